@@ -1,19 +1,28 @@
+import asyncio
 import yaml
-from main_ompl import run_ompl
-from main_s2m2 import run_s2m2
-from main_kcbs import run_kcbs
-from main_dbcbs import run_dbcbs
+from main_ompl import run_ompl_async
+from main_s2m2 import run_s2m2_async
+from main_kcbs import run_kcbs_async
+from main_dbcbs import run_dbcbs_async
 from pathlib import Path
 import shutil
 import subprocess
+import time
 from dataclasses import dataclass
-import multiprocessing as mp
-import tqdm
 import psutil
+import argparse
+import fnmatch
+import os
+from functools import partial
 # import checker
 from benchmark_stats import run_benchmark_stats
 from benchmark_table import write_table
 import paper_tables
+import benchmark_cache
+from benchmark_pipeline import Stage, run_pipeline
+import benchmark_scheduler
+from benchmark_queue import WorkQueue, parse_shard, shard_done, shard_of, worker_name
+import resource_monitor
 
 
 @dataclass
@@ -26,6 +35,29 @@ class ExecutionTask:
 	alg: str
 	trial: int
 	timelimit: float
+	key: str = None
+	# rerun even if the cached result is up to date
+	force: bool = False
+
+@dataclass
+class SolveResult:
+	"""Output of the solver stage, handed on to the checker and renderer"""
+	task: ExecutionTask
+	env: Path
+	result_folder: Path
+	check_files: list
+	visualize_files: list
+	duration: float
+	# False once a result file failed the checker (its stats are deleted)
+	checks_passed: bool = True
+
+# solver executable of each algorithm (relative to the build folder)
+solvers = {
+	"sst": Path("main_ompl"),
+	"s2m2": Path("../s2m2/main_s2m2_original.py"),
+	"k-cbs": Path("main_kcbs"),
+	"db-cbs": Path("db_cbs"),
+}
 
 def run_visualize(script, filename_env, filename_result):
 	subprocess.run(["python3",
@@ -46,10 +78,7 @@ def run_checker(filename_env, filename_result, filename_log):
 					stdout=f, stderr=f)
 	return out.returncode == 0
 
-def execute_task(task: ExecutionTask):
-	scripts_path = Path("../scripts")
-	results_path = Path("../results")
-	# tuning_path = Path("../tuning")
+def task_config(task: ExecutionTask):
 	env_path = Path().resolve() / "../example"
 	env = (env_path / task.instance).with_suffix(".yaml") 
 	assert(env.is_file())
@@ -60,17 +89,10 @@ def execute_task(task: ExecutionTask):
 	with open(cfg) as f:
 		cfg = yaml.safe_load(f)
 
-	result_folder = results_path / task.instance / task.alg / "{:03d}".format(task.trial)
-	if result_folder.exists():
-			print("Warning! {} exists already. Deleting...".format(result_folder))
-			shutil.rmtree(result_folder)
-	result_folder.mkdir(parents=True, exist_ok=False)
-
 	# find cfg
 	mycfg = cfg[task.alg]
 	mycfg = mycfg['default']
 	# wildcard matching
-	import fnmatch
 	for k, v in cfg[task.alg].items():
 		if fnmatch.fnmatch(Path(task.instance).name, k):
 			mycfg = {**mycfg, **v} # merge two dictionaries
@@ -79,36 +101,168 @@ def execute_task(task: ExecutionTask):
 		mycfg_instance = cfg[task.alg][Path(task.instance).name]
 		mycfg = {**mycfg, **mycfg_instance} # merge two dictionaries
 
+	return env, mycfg
+
+def result_folder_of(task: ExecutionTask):
+	return Path("../results") / task.instance / task.alg / "{:03d}".format(task.trial)
+
+def compute_task_key(task: ExecutionTask):
+	env, mycfg = task_config(task)
+	motions = benchmark_cache.motion_files(env) if task.alg == "db-cbs" else []
+	return benchmark_cache.task_key(task, env, mycfg, solvers[task.alg], motions)
+
+async def solve_task_async(task: ExecutionTask):
+	# tuning_path = Path("../tuning")
+	env, mycfg = task_config(task)
+
+	result_folder = result_folder_of(task)
+	if not task.force and task.key is not None and benchmark_cache.is_complete(result_folder, task.key):
+		print("Skipping {}, cached result is up to date".format(result_folder))
+		return None
+	if result_folder.exists():
+			print("Warning! {} exists already. Deleting...".format(result_folder))
+			shutil.rmtree(result_folder)
+	result_folder.mkdir(parents=True, exist_ok=False)
+
 	print("Using configurations ", mycfg)
 
+	start = time.time()
 	if task.alg == "sst":
-		run_ompl(str(env), str(result_folder), task.timelimit, mycfg)
+		await run_ompl_async(str(env), str(result_folder), task.timelimit, mycfg)
 		visualize_files = [p.name for p in result_folder.glob('result_*')]
 		check_files = [p.name for p in result_folder.glob('result_*')]
 	elif task.alg == "s2m2":
-		run_s2m2(str(env), str(result_folder), task.timelimit, mycfg)
+		await run_s2m2_async(str(env), str(result_folder), task.timelimit, mycfg)
 		visualize_files = [p.name for p in result_folder.glob('result_*')]
 		check_files = [p.name for p in result_folder.glob('result_*')]
 	elif task.alg == "k-cbs":
-		run_kcbs(str(env), str(result_folder), task.timelimit, mycfg)
+		await run_kcbs_async(str(env), str(result_folder), task.timelimit, mycfg)
 		visualize_files = [p.name for p in result_folder.glob('result_*')]
 		check_files = [p.name for p in result_folder.glob('result_*')]
 	elif task.alg == "db-cbs":
-		run_dbcbs(str(env), str(result_folder), task.timelimit, mycfg)
+		await run_dbcbs_async(str(env), str(result_folder), task.timelimit, mycfg)
 		visualize_files = [p.name for p in result_folder.glob('result_*')]
 		check_files = [p.name for p in result_folder.glob('result_dbcbs_opt*')]
-	
-	for file in check_files:
-		if not run_checker(env, result_folder / file, (result_folder / file).with_suffix(".check.txt")):
+
+	duration = time.time() - start
+
+	return SolveResult(task, env, result_folder, check_files, visualize_files, duration)
+
+def solve_task(task: ExecutionTask):
+	return asyncio.run(solve_task_async(task))
+
+def check_task(result: SolveResult):
+	for file in result.check_files:
+		if not run_checker(result.env, result.result_folder / file, (result.result_folder / file).with_suffix(".check.txt")):
 			print("WARNING: CHECKER FAILED -> DELETING stats!")
-			(result_folder / "stats.yaml").unlink(missing_ok=True)
+			(result.result_folder / "stats.yaml").unlink(missing_ok=True)
+			result.checks_passed = False
+	return result
+
+def render_task(result: SolveResult):
+	vis_script = Path("../scripts") / "visualize.py"
+	for file in result.visualize_files:
+		run_visualize(vis_script, result.env, result.result_folder / file)
+	return result
+
+def forced(tasks):
+	for task in tasks:
+		task.force = True
+		yield task
+
+def finish_task(task: ExecutionTask, result: SolveResult, work_queue=None):
+	# without stats, the task must run again next time
+	if result is not None and result.checks_passed:
+		benchmark_cache.write_manifest(result.result_folder, task.key,
+			instance=task.instance, alg=task.alg, trial=task.trial, duration=result.duration)
+	if work_queue is not None:
+		work_queue.done(task)
+
+def execute_task(task: ExecutionTask, render=True, work_queue=None):
+	result = solve_task(task)
+	if result is not None:
+		check_task(result)
+		if render:
+			render_task(result)
+	finish_task(task, result, work_queue)
+
+async def orchestrate(tasks, concurrency, render=True, cores=None):
+	"""Solves the tasks from this one process, at most concurrency at a time.
+	Checking and rendering run in threads and do not count against concurrency.
+	With cores (at least concurrency), every running solver gets a core of its own."""
+	# one slot per concurrent solver
+	free_cores = asyncio.Queue()
+	for core in (cores or [None] * concurrency)[:concurrency]:
+		free_cores.put_nowait(core)
+	async def solve(task):
+		core = await free_cores.get()
+		try:
+			# only affects the solver runs of this asyncio task
+			resource_monitor.use_cpus(core)
+			return await solve_task_async(task)
+		finally:
+			free_cores.put_nowait(core)
+	async def execute(task):
+		try:
+			result = await solve(task)
+			if result is not None:
+				await asyncio.to_thread(check_task, result)
+				if render:
+					await asyncio.to_thread(render_task, result)
+		except Exception as e:
+			print("Task {} {} {} failed: {}".format(task.instance, task.alg, task.trial, e))
+			result = None
+		finish_task(task, result)
+	await asyncio.gather(*[execute(task) for task in tasks])
+
+def isolate_solver(cores, memory_limit, cpu_limit, index):
+	# core 0 is left to the main, checker and renderer processes
+	resource_monitor.configure_isolation(cores[1 + index % (len(cores) - 1)], memory_limit, cpu_limit)
+
+def isolate_helper(cores, index):
+	os.sched_setaffinity(0, cores[0])
 
-	vis_script = scripts_path / "visualize.py"
-	for file in visualize_files:
-		run_visualize(vis_script, env, result_folder / file)
+def aggregate(instances, algs, trials, timelimit):
+	run_benchmark_stats(instances, algs, trials, timelimit)
+
+	write_table(instances, algs, Path("../results"), "table.pdf", trials, timelimit, resources=True)
+
+	subprocess.run(
+		['pdftk',
+		 Path("../results") / 'table.pdf',
+		 Path("../results") / 'stats.pdf',
+		 'cat', 'output',
+		 Path("../results") / 'results.pdf'
+		]
+	)
+	# delete temp files
+	(Path("../results") / 'table.pdf').unlink()
+	(Path("../results") / 'stats.pdf').unlink()
+
+	paper_tables.write_table1(trials, timelimit)
+	paper_tables.write_table2(trials, timelimit)
+	paper_tables.write_table3(trials, timelimit)
+	paper_tables.write_table4(trials, timelimit)
+	paper_tables.write_table5(trials, timelimit)
 
 
 def main():
+	parser = argparse.ArgumentParser()
+	parser.add_argument("--force", action="store_true", help="ignore cached results and rerun all tasks")
+	parser.add_argument("--no-render", action="store_true", help="do not render videos of the results")
+	parser.add_argument("--shard", help="only run shard i of n of the tasks, given as i/n")
+	parser.add_argument("--sweep", default="default", help="name of the sweep the shards belong to (use a new name per sweep; each sweep is aggregated once)")
+	parser.add_argument("--queue", help="claim tasks from a shared work queue (SQLite file; use a fresh file per sweep)")
+	parser.add_argument("--cpus", type=int, help="number of solver processes on this host")
+	parser.add_argument("--aggregate-only", action="store_true", help="only compute stats and tables of existing results")
+	parser.add_argument("--isolate", action="store_true", help="pin each solver to its own physical core and limit its memory and CPU time")
+	parser.add_argument("--memory-limit", type=float, help="memory limit per solver in GiB when isolating (default: share of the physical memory)")
+	parser.add_argument("--cpu-limit", type=float, help="CPU time limit per solver in s when isolating (default: 1.1 * timelimit + 10)")
+	parser.add_argument("--orchestrate", action="store_true", help="drive all solver runs from this one process (asyncio) instead of a pool of solver processes")
+	args = parser.parse_args()
+	if args.orchestrate and args.queue is not None:
+		parser.error("--orchestrate cannot claim from a shared queue")
+
 	parallel = True
 	instances = [
 		# 1 robot cases
@@ -184,37 +338,111 @@ def main():
 			for trial in range(trials):
 				tasks.append(ExecutionTask(instance, alg, trial, timelimit))
 
-	if parallel and len(tasks) > 1:
-		use_cpus = psutil.cpu_count(logical=False)-1
+	if args.aggregate_only:
+		aggregate(instances, algs, trials, timelimit)
+		return
+
+	# partition the full task list first, so that every host gets the same
+	# shards independent of its cached results
+	if args.shard is not None:
+		shard, num_shards = parse_shard(args.shard)
+		tasks = [task for task in tasks if shard_of(task, num_shards) == shard]
+
+	# only run tasks whose inputs changed since their last complete run; the
+	# keys are also needed with --force, for the manifests of the new results
+	for task in tasks:
+		task.key = compute_task_key(task)
+	if not args.force:
+		num_tasks = len(tasks)
+		tasks = [task for task in tasks if not benchmark_cache.is_complete(result_folder_of(task), task.key)]
+		print("Skipping {} of {} tasks with up-to-date results".format(num_tasks - len(tasks), num_tasks))
+
+	# start the longest tasks first, based on the runtimes of earlier sweeps
+	predictions = benchmark_scheduler.predict_durations(tasks, result_folder_of)
+	tasks, predictions = benchmark_scheduler.schedule(tasks, predictions)
+
+	# with a shared queue, every host adds all tasks and claims them one by one
+	work_queue = None
+	items = tasks
+	if args.queue is not None:
+		work_queue = WorkQueue(args.queue, ExecutionTask, stale_after=2*timelimit + 600)
+		work_queue.put(tasks, predictions)
+		items = work_queue.claims(worker_name())
+
+	# --force only applies to the tasks this host runs (with a shared queue,
+	# those it claims), not to the results other hosts just finished
+	if args.force:
+		if work_queue is None:
+			for task in tasks:
+				task.force = True
+		else:
+			items = forced(items)
+
+	if parallel and (len(tasks) > 1 or work_queue is not None):
+		use_cpus = args.cpus if args.cpus is not None else psutil.cpu_count(logical=False)-1
 		print("Using {} CPUs".format(use_cpus))
-		with mp.Pool(use_cpus) as p:
-			for _ in tqdm.tqdm(p.imap_unordered(execute_task, tasks)):
-				pass
-	else:
-		for task in tasks:
-			execute_task(task)
-	
-	run_benchmark_stats(instances, algs, trials, timelimit)
 
-	write_table(instances, algs, Path("../results"), "table.pdf", trials, timelimit)
+		predicted_makespan = benchmark_scheduler.makespan(predictions, use_cpus)
+		print("Predicted makespan: {:.1f} s".format(predicted_makespan))
+		start = time.time()
 
-	subprocess.run(
-		['pdftk',
-		 Path("../results") / 'table.pdf',
-		 Path("../results") / 'stats.pdf',
-		 'cat', 'output',
-		 Path("../results") / 'results.pdf'
-		]
-	)
-	# delete temp files
-	(Path("../results") / 'table.pdf').unlink()
-	(Path("../results") / 'stats.pdf').unlink()
+		solver_init = None
+		helper_init = None
+		if args.isolate:
+			cores = resource_monitor.physical_cores()
+			if len(cores) < 2:
+				parser.error("--isolate needs at least two physical cores")
+			use_cpus = min(use_cpus, len(cores) - 1)
+			memory_limit = args.memory_limit * 1024**3 if args.memory_limit is not None else psutil.virtual_memory().total / (use_cpus + 1)
+			cpu_limit = args.cpu_limit if args.cpu_limit is not None else 1.1 * timelimit + 10
+			print("Isolating {} solvers, memory limit {:.1f} GiB, CPU limit {:.0f} s".format(use_cpus, memory_limit / 1024**3, cpu_limit))
+			solver_init = partial(isolate_solver, cores, int(memory_limit), cpu_limit)
+			helper_init = partial(isolate_helper, cores)
+			if args.orchestrate:
+				# each solver gets one of the cores next to the one of this process
+				resource_monitor.configure_isolation(None, int(memory_limit), cpu_limit)
 
-	paper_tables.write_table1(trials, timelimit)
-	paper_tables.write_table2(trials, timelimit)
-	paper_tables.write_table3(trials, timelimit)
-	paper_tables.write_table4(trials, timelimit)
-	paper_tables.write_table5(trials, timelimit)
+		if args.orchestrate:
+			asyncio.run(orchestrate(tasks, use_cpus, not args.no_render, cores[1:] if args.isolate else None))
+		else:
+			# solver processes only solve; checking and (low priority) rendering
+			# run in their own processes, fed through bounded queues
+			stages = [
+				# claim from the shared queue only when a solver process is free
+				Stage(solve_task, use_cpus, queue_size=1 if work_queue is not None else 0, initializer=solver_init),
+				Stage(check_task, 1, queue_size=2*use_cpus, initializer=helper_init),
+			]
+			if not args.no_render:
+				stages.append(Stage(render_task, 1, queue_size=4*use_cpus, niceness=19, initializer=helper_init))
+			run_pipeline(items, stages,
+				lambda task, result: finish_task(task, result, work_queue),
+				total=len(tasks) if work_queue is None else None)
+
+		actual_makespan = time.time() - start
+		Path("../results").mkdir(exist_ok=True)
+		print("Makespan: {:.1f} s (predicted {:.1f} s)".format(actual_makespan, predicted_makespan))
+		with open(Path("../results") / "schedule{}.yaml".format("" if args.shard is None else "_" + args.shard.replace("/", "_of_")), 'w') as f:
+			yaml.safe_dump({
+				"cpus": use_cpus,
+				"tasks": len(tasks),
+				"predicted_makespan": predicted_makespan,
+				"makespan": actual_makespan,
+			}, f)
+	else:
+		for task in items:
+			execute_task(task, not args.no_render, work_queue)
+
+	# the stats are computed once, by whoever finishes last
+	if work_queue is not None:
+		if not work_queue.all_done() or not work_queue.claim_aggregation(worker_name()):
+			print("Other workers are still running, skipping stats")
+			return
+	elif args.shard is not None:
+		if not shard_done(Path("../results") / "shards" / args.sweep, shard, num_shards):
+			print("Other shards are still running or sweep {} was already aggregated, skipping stats".format(args.sweep))
+			return
+
+	aggregate(instances, algs, trials, timelimit)
 
 if __name__ == '__main__':
 	main()
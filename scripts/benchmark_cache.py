@@ -0,0 +1,71 @@
+import hashlib
+import os
+from functools import lru_cache
+from pathlib import Path
+import yaml
+
+# written into each result folder once a task has finished completely
+MANIFEST = "task.yaml"
+
+# robot type -> motion library, mirrors the lookup in src/db_cbs.cpp
+MOTIONS = {
+	"unicycle_first_order_0": "unicycle_first_order_0_sorted.msgpack",
+	"unicycle_first_order_0_sphere": "unicycle_first_order_0_sorted.msgpack",
+	"unicycle_second_order_0": "unicycle_second_order_0_sorted.msgpack",
+	"double_integrator_0": "double_integrator_0_sorted.msgpack",
+	"car_first_order_with_1_trailers_0": "car_first_order_with_1_trailers_0_sorted.msgpack",
+}
+
+
+@lru_cache(maxsize=None)
+def _hash_file(filename, mtime_ns, size):
+	h = hashlib.sha256()
+	with open(filename, 'rb') as f:
+		for chunk in iter(lambda: f.read(1 << 20), b''):
+			h.update(chunk)
+	return h.hexdigest()
+
+def hash_file(filename):
+	"""sha256 of a file (None if it does not exist), memoized on mtime and size"""
+	p = Path(filename)
+	if not p.is_file():
+		return None
+	st = p.stat()
+	return _hash_file(str(p.resolve()), st.st_mtime_ns, st.st_size)
+
+def motion_files(filename_env, motions_path=Path("../motions")):
+	with open(filename_env) as f:
+		env = yaml.safe_load(f)
+	robot_types = sorted({r["type"] for r in env["robots"]})
+	return [motions_path / MOTIONS[t] for t in robot_types if t in MOTIONS]
+
+def task_key(task, filename_env, cfg, solver, motions=()):
+	"""Content hash of everything that influences the result of a task"""
+	h = hashlib.sha256()
+	h.update(yaml.safe_dump({
+		"instance": task.instance,
+		"alg": task.alg,
+		"trial": task.trial,
+		"timelimit": task.timelimit,
+		"env": hash_file(filename_env),
+		"cfg": cfg,
+		"solver": hash_file(solver),
+		"motions": [hash_file(m) for m in motions],
+	}, sort_keys=True).encode())
+	return h.hexdigest()
+
+def is_complete(result_folder, key):
+	manifest = Path(result_folder) / MANIFEST
+	if not manifest.is_file():
+		return False
+	with open(manifest) as f:
+		info = yaml.safe_load(f)
+	return info is not None and info.get("key") == key
+
+def write_manifest(result_folder, key, **info):
+	# write to a temporary file first, so that an interrupted task never looks complete
+	manifest = Path(result_folder) / MANIFEST
+	tmp = manifest.with_suffix(".tmp")
+	with open(tmp, 'w') as f:
+		yaml.safe_dump({"key": key, **info}, f)
+	os.replace(tmp, manifest)
@@ -0,0 +1,174 @@
+import argparse
+import hashlib
+import sys
+import tempfile
+from pathlib import Path
+import numpy as np
+import yaml
+
+import stats_store
+from benchmark_table import collect_runs
+
+# python3 ../scripts/benchmark_compare.py ../results_baseline ../results --report ../results/compare.yaml
+
+
+def bootstrap_ci(baseline, candidate, statistic, n_boot, confidence, rng):
+	"""Bootstrap confidence interval of statistic(candidate) - statistic(baseline),
+	resampling both groups independently. With baseline None, the interval of
+	statistic(candidate) itself."""
+	candidate = np.asarray(candidate, dtype=float)
+	diffs = statistic(rng.choice(candidate, (n_boot, len(candidate))), axis=1)
+	if baseline is not None:
+		baseline = np.asarray(baseline, dtype=float)
+		diffs -= statistic(rng.choice(baseline, (n_boot, len(baseline))), axis=1)
+	alpha = 1 - confidence
+	return float(np.quantile(diffs, alpha / 2)), float(np.quantile(diffs, 1 - alpha / 2))
+
+def compare_metric(baseline, candidate, statistic, higher_is_better, min_effect, n_boot, confidence, rng):
+	"""Compares one metric of two groups of runs.
+
+	A change is significant if the whole confidence interval of the difference
+	(candidate - baseline) is beyond min_effect (in the unit of the metric).
+	"""
+	if len(baseline) < 2 or len(candidate) < 2:
+		return {"status": "insufficient", "baseline": len(baseline), "candidate": len(candidate)}
+	lo, hi = bootstrap_ci(baseline, candidate, statistic, n_boot, confidence, rng)
+	status = "unchanged"
+	if lo > min_effect:
+		status = "improvement" if higher_is_better else "regression"
+	elif hi < -min_effect:
+		status = "regression" if higher_is_better else "improvement"
+	return {
+		"status": status,
+		"baseline": float(statistic(baseline)),
+		"candidate": float(statistic(candidate)),
+		"ci": [lo, hi],
+	}
+
+def compare_regret(regrets, min_effect, n_boot, confidence, rng):
+	"""Paired comparison: regrets [%] of the candidate runs against the baseline
+	run of the same trial; positive is worse"""
+	if len(regrets) < 2:
+		return {"status": "insufficient", "candidate": len(regrets)}
+	lo, hi = bootstrap_ci(None, regrets, np.median, n_boot, confidence, rng)
+	status = "unchanged"
+	if lo > min_effect:
+		status = "regression"
+	elif hi < -min_effect:
+		status = "improvement"
+	return {"status": status, "median": float(np.median(regrets)), "ci": [lo, hi]}
+
+def instances_of(results_path, alg):
+	return {p.parent.name for p in Path(results_path).glob("*/" + alg)}
+
+def expected_runs(results_path, instance, alg, trials=None):
+	"""Number of runs of alg on instance (which may be a pattern): trials per
+	matching instance, or without trials the trial folders on disk. Unlike
+	the stats files, this includes runs whose result failed the checker."""
+	folders = [p for p in Path(results_path).glob(instance + "/" + alg) if p.is_dir()]
+	if trials is not None:
+		return trials * len(folders)
+	return sum(1 for folder in folders for p in folder.iterdir() if p.is_dir())
+
+def _success(runs, expected):
+	"""Per run success indicators; runs without stats count as failed"""
+	solved = len(runs["initial_times"])
+	return [1] * solved + [0] * max(expected - solved, 0)
+
+def _baseline_store(baseline_path):
+	# the baseline tree is only read, so its database is kept in the temp folder
+	name = hashlib.sha256(str(Path(baseline_path).resolve()).encode()).hexdigest()[:16]
+	return stats_store.open_store(baseline_path, Path(tempfile.gettempdir()) / "stats_{}.sqlite".format(name))
+
+def compare(baseline_path, candidate_path, instances, algs, T, regret=False,
+		n_boot=10000, confidence=0.95, tolerance=0.05, seed=0, trials=None):
+	"""Per instance and algorithm comparison of two result trees. Returns the
+	report and the number of significant regressions."""
+	rng = np.random.default_rng(seed)
+	baseline = _baseline_store(baseline_path)
+	candidate = stats_store.open_store(candidate_path)
+
+	report = dict()
+	num_regressions = 0
+	for instance in instances:
+		report[instance] = dict()
+		for alg in algs:
+			if regret:
+				# the run with the same instance/alg/trial in the baseline tree
+				base_of = lambda stat_file: (baseline, stat_file.replace(str(candidate.results_path), str(baseline.results_path), 1))
+				runs = collect_runs(candidate, instance, alg, T, base_of)
+				metrics = {
+					"tr^st": compare_regret(runs["initial_time_regrets"], 100 * tolerance, n_boot, confidence, rng),
+					"Jr^f": compare_regret(runs["final_regrets"], 100 * tolerance, n_boot, confidence, rng),
+				}
+			else:
+				runs_base = collect_runs(baseline, instance, alg, T)
+				runs = collect_runs(candidate, instance, alg, T)
+				# per run success indicators
+				success_base = _success(runs_base, expected_runs(baseline_path, instance, alg, trials))
+				success = _success(runs, expected_runs(candidate_path, instance, alg, trials))
+				# time and cost differences relative to the baseline median
+				scale_t = np.median(runs_base["initial_times"]) if len(runs_base["initial_times"]) > 0 else 1
+				scale_J = np.median(runs_base["final_costs"]) if len(runs_base["final_costs"]) > 0 else 1
+				metrics = {
+					"t^st": compare_metric(runs_base["initial_times"], runs["initial_times"], np.median, False,
+						tolerance * scale_t, n_boot, confidence, rng),
+					"success": compare_metric(success_base, success, np.mean, True,
+						tolerance, n_boot, confidence, rng),
+					"J^f": compare_metric(runs_base["final_costs"], runs["final_costs"], np.median, False,
+						tolerance * scale_J, n_boot, confidence, rng),
+				}
+			report[instance][alg] = metrics
+			num_regressions += sum(m["status"] == "regression" for m in metrics.values())
+	return report, num_regressions
+
+def main():
+	parser = argparse.ArgumentParser(description="Flags statistically significant performance regressions of a candidate results tree against a baseline")
+	parser.add_argument("baseline", help="results folder of the baseline build")
+	parser.add_argument("candidate", help="results folder of the candidate build")
+	parser.add_argument("--alg", action="append", help="algorithm to compare (default: db-cbs); may be repeated")
+	parser.add_argument("--instances", nargs="*", help="instances (or patterns) to compare (default: all that both trees have)")
+	parser.add_argument("-T", type=float, default=5*60, help="time horizon (s)")
+	parser.add_argument("--trials", type=int, help="trials per instance (default: the trial folders in each tree)")
+	parser.add_argument("--regret", action="store_true", help="compare each candidate run to the baseline run of the same trial")
+	parser.add_argument("--confidence", type=float, default=0.95)
+	parser.add_argument("--boot", type=int, default=10000, help="number of bootstrap samples")
+	parser.add_argument("--tolerance", type=float, default=0.05, help="smallest relative change that counts as a regression")
+	parser.add_argument("--report", help="write the report to this yaml file")
+	args = parser.parse_args()
+
+	algs = args.alg if args.alg else ["db-cbs"]
+	instances = args.instances
+	if not instances:
+		instances = set.union(*[instances_of(args.baseline, alg) & instances_of(args.candidate, alg) for alg in algs])
+		instances = sorted(instances)
+	if len(instances) == 0:
+		parser.error("the result trees have no instances in common")
+
+	report, num_regressions = compare(args.baseline, args.candidate, instances, algs, args.T,
+		args.regret, args.boot, args.confidence, args.tolerance, trials=args.trials)
+
+	for instance, result in report.items():
+		for alg, metrics in result.items():
+			for name, m in metrics.items():
+				if m["status"] in ("regression", "improvement"):
+					print("{}: {} {} {} (CI {:.2f} .. {:.2f})".format(m["status"].upper(), instance, alg, name, *m["ci"]))
+	print("{} significant regression(s)".format(num_regressions))
+
+	if args.report:
+		with open(args.report, 'w') as f:
+			yaml.safe_dump({
+				"baseline": str(args.baseline),
+				"candidate": str(args.candidate),
+				"regret": args.regret,
+				"confidence": args.confidence,
+				"tolerance": args.tolerance,
+				"regressions": num_regressions,
+				"instances": report,
+			}, f, sort_keys=False)
+
+	sys.exit(1 if num_regressions > 0 else 0)
+
+
+if __name__ == '__main__':
+	main()
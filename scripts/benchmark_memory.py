@@ -0,0 +1,135 @@
+import argparse
+import json
+from pathlib import Path
+import subprocess
+import tempfile
+import numpy as np
+import yaml
+from benchmark import ExecutionTask, task_config
+import solver_runner
+
+# python3 ../scripts/benchmark_memory.py swap4_unicycle --timelimit 600 --plot
+#
+# Memory benchmark for a long db-CBS high-level search: runs ./db_cbs on an
+# instance until it is done or killed at the time limit, and reads the RSS that
+# db_cbs reports with every 100 HL expansions (progress event log). The RSS
+# should stay flat over the HL search; the report has the growth over the run
+# (after the warmup) from a linear fit of RSS over the HL expansions.
+
+def rss_samples(events):
+	"""(t, HL expansions over all delta iterations, RSS in MiB) of the
+	hl_expansions events"""
+	samples = []
+	offset = 0
+	last = 0
+	for e in events:
+		if e["event"] == "delta_iteration":
+			offset += last
+			last = 0
+		elif e["event"] == "hl_expansions" and "rss" in e:
+			last = int(e["expands"])
+			samples.append((e["t"], offset + last, e["rss"]))
+	return samples
+
+def analyze(samples, warmup=0.2, tolerance=10):
+	"""Fits the RSS over the HL expansions after the first warmup fraction of
+	the samples. Flat: the fitted growth over that range is below tolerance
+	(MiB)."""
+	report = {"samples": len(samples)}
+	if not samples:
+		return report
+	rss = [s[2] for s in samples]
+	report["rss_first"] = rss[0]
+	report["rss_last"] = rss[-1]
+	report["rss_peak"] = max(rss)
+	report["hl_expansions"] = samples[-1][1]
+	steady = samples[int(len(samples) * warmup):]
+	if len(steady) < 2:
+		return report
+	x = np.array([s[1] for s in steady], dtype=float)
+	y = np.array([s[2] for s in steady], dtype=float)
+	slope = np.polyfit(x, y, 1)[0]
+	growth = slope * (x[-1] - x[0])
+	report["mib_per_1000_expansions"] = float(slope * 1000)
+	report["growth"] = float(growth)
+	report["flat"] = bool(growth < tolerance)
+	return report
+
+def plot(samples, filename):
+	import matplotlib
+	matplotlib.use('Agg')
+	import matplotlib.pyplot as plt
+	fig, ax = plt.subplots()
+	ax.plot([s[1] for s in samples], [s[2] for s in samples])
+	ax.set_xlabel("HL expansions")
+	ax.set_ylabel("RSS [MiB]")
+	ax.set_ylim(bottom=0)
+	fig.savefig(filename)
+	plt.close(fig)
+
+def run(instance, timelimit, folder):
+	"""Runs db_cbs (with the db-cbs configuration of the benchmark) and returns
+	its progress events and ProcessResult"""
+	env, cfg = task_config(ExecutionTask(instance, "db-cbs", 0, timelimit))
+	folder = Path(folder)
+	filename_cfg = folder / "cfg.yaml"
+	with open(filename_cfg, 'w') as f:
+		yaml.dump(cfg, f, Dumper=yaml.CSafeDumper)
+	filename_progress = folder / "progress.jsonl"
+	cmd = ["./db_cbs",
+		"-i", env,
+		"-o", folder / "result_dbcbs.yaml",
+		"--joint", folder / "dbcbs_joint.yaml",
+		"--opt", folder / "result_dbcbs_opt.yaml",
+		"-c", filename_cfg,
+		"--progress", filename_progress,
+		"--stats", folder / "dbcbs_stats.yaml"]
+	print(subprocess.list2cmdline([str(c) for c in cmd]))
+	result = solver_runner.run(cmd, log=folder / "log.txt", timeout=timelimit)
+	events = []
+	if filename_progress.is_file():
+		with open(filename_progress) as f:
+			for line in f:
+				try:
+					events.append(json.loads(line))
+				except ValueError:
+					# e.g. the last line, truncated when db_cbs was killed
+					pass
+	return events, result
+
+def main():
+	parser = argparse.ArgumentParser(description="RSS of db_cbs over a long HL search")
+	parser.add_argument("instance", help="instance in ../example, e.g. swap4_unicycle")
+	parser.add_argument("--timelimit", type=float, default=600, help="db_cbs is killed after this time (s)")
+	parser.add_argument("--warmup", type=float, default=0.2, help="fraction of the samples that is not fitted")
+	parser.add_argument("--tolerance", type=float, default=10, help="growth (MiB) that still counts as flat")
+	parser.add_argument("--out", help="report (YAML, default: ../results/memory/<instance>.yaml)")
+	parser.add_argument("--plot", action='store_true', help="also plot RSS over HL expansions next to the report")
+	args = parser.parse_args()
+
+	out = Path(args.out) if args.out else Path("../results/memory") / "{}.yaml".format(args.instance)
+	out.parent.mkdir(parents=True, exist_ok=True)
+	with tempfile.TemporaryDirectory() as tmpdirname:
+		events, result = run(args.instance, args.timelimit, tmpdirname)
+
+	samples = rss_samples(events)
+	report = {"instance": args.instance, "timelimit": args.timelimit,
+		"timed_out": result.timed_out, "returncode": result.returncode,
+		"peak_rss": result.resources["peak_rss"]}
+	report.update(analyze(samples, args.warmup, args.tolerance))
+	report["rss"] = [{"t": t, "hl_expansions": n, "rss": rss} for t, n, rss in samples]
+	with open(out, 'w') as f:
+		yaml.safe_dump(report, f, sort_keys=False)
+	if args.plot and samples:
+		plot(samples, out.with_suffix(".pdf"))
+
+	if "growth" in report:
+		print("{}: {} HL expansions, RSS {:.1f} -> {:.1f} MiB, growth {:.1f} MiB ({})".format(
+			args.instance, report["hl_expansions"], report["rss_first"], report["rss_last"],
+			report["growth"], "flat" if report["flat"] else "growing"))
+	else:
+		print("{}: not enough HL expansions for a fit".format(args.instance))
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,98 @@
+import os
+import queue
+import threading
+import traceback
+import multiprocessing as mp
+import tqdm
+
+
+def _stage_worker(func, inbox, outbox, niceness, initializer, index):
+	if niceness > 0:
+		os.nice(niceness)
+	if initializer is not None:
+		initializer(index)
+	while True:
+		item = inbox.get()
+		if item is None:
+			break
+		origin, value = item
+		try:
+			# None marks an item that was skipped or failed in an earlier stage
+			if value is not None:
+				value = func(value)
+		except Exception:
+			traceback.print_exc()
+			value = None
+		# items are always forwarded, so that the last queue sees one entry per item
+		outbox.put((origin, value))
+
+class Stage:
+	def __init__(self, func, processes, queue_size=0, niceness=0, initializer=None):
+		self.func = func
+		self.processes = processes
+		self.queue_size = queue_size
+		self.niceness = niceness
+		# called with the index of the worker process when it starts
+		self.initializer = initializer
+
+def run_pipeline(items, stages, finish=None, total=None):
+	"""Runs each item through the stages in order.
+
+	Every stage has its own process pool; consecutive stages are connected by
+	(optionally bounded) queues, so that e.g. rendering overlaps with solving
+	without taking cores away from the solver processes. items may be a lazy
+	iterable; it is consumed only as fast as the first queue accepts items.
+	finish(item, result) is called in the calling process for every item,
+	with result None if the item was skipped or failed in one of the stages.
+	Raises RuntimeError if a worker process dies, instead of waiting forever
+	for the item it was working on.
+	"""
+	queues = [mp.Queue(s.queue_size) for s in stages] + [mp.Queue()]
+	workers = []
+	for stage, inbox, outbox in zip(stages, queues[:-1], queues[1:]):
+		procs = [mp.Process(target=_stage_worker, args=(stage.func, inbox, outbox, stage.niceness, stage.initializer, k))
+			for k in range(stage.processes)]
+		for p in procs:
+			p.start()
+		workers.append(procs)
+
+	num_fed = 0
+	feeding_done = threading.Event()
+	def feed():
+		nonlocal num_fed
+		try:
+			for item in items:
+				queues[0].put((item, item))
+				num_fed += 1
+		finally:
+			feeding_done.set()
+	feeder = threading.Thread(target=feed, daemon=True)
+	feeder.start()
+
+	num_done = 0
+	with tqdm.tqdm(total=total) as pbar:
+		while not (feeding_done.is_set() and num_done == num_fed):
+			try:
+				origin, value = queues[-1].get(timeout=1)
+			except queue.Empty:
+				# workers only exit after the shutdown below, so one that is gone
+				# died (e.g. killed by the OOM killer) and took its item with it
+				dead = [p for procs in workers for p in procs if p.exitcode is not None]
+				if dead:
+					for procs in workers:
+						for p in procs:
+							p.terminate()
+					raise RuntimeError("pipeline worker {} died with exit code {} ({} of {} items done)".format(
+						dead[0].name, dead[0].exitcode, num_done, num_fed))
+				continue
+			num_done += 1
+			pbar.update()
+			if finish is not None:
+				finish(origin, value)
+
+	# all work is done, shut down one stage after the other
+	for procs, inbox in zip(workers, queues[:-1]):
+		for _ in procs:
+			inbox.put(None)
+		for p in procs:
+			p.join()
@@ -0,0 +1,114 @@
+import hashlib
+import os
+import socket
+import sqlite3
+import time
+from contextlib import closing
+from pathlib import Path
+
+
+def worker_name():
+	return "{}:{}".format(socket.gethostname(), os.getpid())
+
+def parse_shard(shard):
+	"""'i/n' -> (i, n)"""
+	i, n = [int(x) for x in shard.split("/")]
+	if n < 1 or not 0 <= i < n:
+		raise ValueError("invalid shard {}".format(shard))
+	return i, n
+
+def shard_of(task, num_shards):
+	"""Shard of a task, from a hash of (instance, alg, trial); stable across
+	hosts, sweeps and changes of the other tasks"""
+	name = "{}/{}/{}".format(task.instance, task.alg, task.trial)
+	return int(hashlib.sha256(name.encode()).hexdigest(), 16) % num_shards
+
+class WorkQueue:
+	"""Task queue in an SQLite file on a shared filesystem.
+
+	Several hosts (or local processes) add the same tasks and claim them one by
+	one; claiming runs in an exclusive transaction, so every task is executed
+	once. Each call opens its own connection, so a WorkQueue can be used from
+	any thread or process.
+	"""
+	def __init__(self, filename, task_type, stale_after=None):
+		self.filename = str(filename)
+		self.task_type = task_type
+		# claims older than this (in s) are assumed to belong to a crashed worker
+		self.stale_after = stale_after
+		with closing(self._connect()) as con:
+			con.execute("""CREATE TABLE IF NOT EXISTS tasks (
+				instance TEXT, alg TEXT, trial INTEGER, timelimit REAL, key TEXT,
+				priority REAL, status TEXT, worker TEXT, claimed REAL, finished REAL,
+				PRIMARY KEY (instance, alg, trial))""")
+			con.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)")
+
+	def _connect(self):
+		# autocommit mode, transactions are started explicitly
+		return sqlite3.connect(self.filename, timeout=60, isolation_level=None)
+
+	def put(self, tasks, priorities):
+		"""Adds tasks that are not in the queue yet"""
+		with closing(self._connect()) as con:
+			con.execute("BEGIN IMMEDIATE")
+			con.executemany("INSERT OR IGNORE INTO tasks VALUES (?, ?, ?, ?, ?, ?, 'pending', NULL, NULL, NULL)",
+				[(t.instance, t.alg, t.trial, t.timelimit, t.key, p) for t, p in zip(tasks, priorities)])
+			con.execute("COMMIT")
+
+	def claim(self, worker):
+		"""Atomically takes the pending task with the highest priority (None if there is none)"""
+		with closing(self._connect()) as con:
+			con.execute("BEGIN IMMEDIATE")
+			if self.stale_after is not None:
+				con.execute("UPDATE tasks SET status = 'pending', worker = NULL WHERE status = 'running' AND claimed < ?",
+					(time.time() - self.stale_after,))
+			row = con.execute("""SELECT instance, alg, trial, timelimit, key FROM tasks
+				WHERE status = 'pending' ORDER BY priority DESC LIMIT 1""").fetchone()
+			if row is not None:
+				con.execute("UPDATE tasks SET status = 'running', worker = ?, claimed = ? WHERE instance = ? AND alg = ? AND trial = ?",
+					(worker, time.time(), row[0], row[1], row[2]))
+			con.execute("COMMIT")
+		if row is None:
+			return None
+		return self.task_type(*row)
+
+	def claims(self, worker):
+		"""Generator that keeps claiming tasks until the queue is drained"""
+		while True:
+			task = self.claim(worker)
+			if task is None:
+				return
+			yield task
+
+	def done(self, task):
+		with closing(self._connect()) as con:
+			con.execute("UPDATE tasks SET status = 'done', finished = ? WHERE instance = ? AND alg = ? AND trial = ?",
+				(time.time(), task.instance, task.alg, task.trial))
+
+	def all_done(self):
+		with closing(self._connect()) as con:
+			row = con.execute("SELECT COUNT(*) FROM tasks WHERE status != 'done'").fetchone()
+		return row[0] == 0
+
+	def claim_aggregation(self, worker):
+		"""True for exactly one caller; used to run the stats aggregation once"""
+		with closing(self._connect()) as con:
+			cur = con.execute("INSERT OR IGNORE INTO meta VALUES ('aggregated', ?)", (worker,))
+			return cur.rowcount == 1
+
+def shard_done(folder, shard, num_shards):
+	"""Marks a shard as finished; True for exactly one caller once all shards are
+	finished. The markers and the lock stay in place, so a sweep is aggregated
+	only once (use a new folder per sweep)."""
+	folder = Path(folder)
+	folder.mkdir(parents=True, exist_ok=True)
+	(folder / "{}_of_{}.done".format(shard, num_shards)).touch()
+	if not all((folder / "{}_of_{}.done".format(i, num_shards)).exists() for i in range(num_shards)):
+		return False
+	lock = folder / "{}.aggregated".format(num_shards)
+	try:
+		fd = os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+	except FileExistsError:
+		return False
+	os.close(fd)
+	return True
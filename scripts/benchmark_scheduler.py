@@ -0,0 +1,65 @@
+import heapq
+from collections import defaultdict
+from pathlib import Path
+import numpy as np
+import yaml
+
+import benchmark_cache
+
+
+def _previous_duration(result_folder):
+	"""Solver runtime of an earlier run in result_folder (None if unknown)"""
+	manifest = Path(result_folder) / benchmark_cache.MANIFEST
+	if manifest.is_file():
+		with open(manifest) as f:
+			info = yaml.safe_load(f)
+		if info is not None and "duration" in info:
+			return info["duration"]
+
+	stat_file = Path(result_folder) / "stats.yaml"
+	if stat_file.is_file():
+		with open(stat_file) as f:
+			stats = yaml.safe_load(f)
+		if stats is not None and stats.get("stats"):
+			# db-cbs reports its runtime, otherwise the last solution is a lower bound
+			d = stats["stats"][-1]
+			return d.get("duration_dbcbs", d["t"])
+	return None
+
+def predict_durations(tasks, result_folder_of):
+	"""Expected runtime per task.
+
+	Uses the runtime of the previous run of the same task, then the mean over
+	other trials of the same instance and algorithm, and finally the timelimit.
+	"""
+	history = dict()
+	per_instance = defaultdict(list)
+	for task in tasks:
+		d = _previous_duration(result_folder_of(task))
+		if d is not None:
+			d = min(d, task.timelimit)
+			history[id(task)] = d
+			per_instance[(task.instance, task.alg)].append(d)
+
+	predictions = []
+	for task in tasks:
+		if id(task) in history:
+			predictions.append(history[id(task)])
+		elif len(per_instance[(task.instance, task.alg)]) > 0:
+			predictions.append(float(np.mean(per_instance[(task.instance, task.alg)])))
+		else:
+			predictions.append(task.timelimit)
+	return predictions
+
+def makespan(durations, cores):
+	"""Makespan of greedily assigning durations (in order) to the least loaded core"""
+	loads = [0.0] * max(cores, 1)
+	for d in durations:
+		heapq.heapreplace(loads, loads[0] + d)
+	return max(loads)
+
+def schedule(tasks, predictions):
+	"""Longest-expected-first order, which a pool that hands the next task to
+	the first idle core turns into an LPT packing of the tasks onto cores"""
+	order = sorted(range(len(tasks)), key=lambda k: predictions[k], reverse=True)
+	return [tasks[k] for k in order], [predictions[k] for k in order]
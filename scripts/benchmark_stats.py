@@ -1,22 +1,24 @@
 import yaml
 from pathlib import Path
 import plot_stats
+import stats_store
 import argparse
 
 
 def run_benchmark_stats(instances, algs, trials, T):
 	results_path = Path("../results")
 
-	report = plot_stats.Report(results_path / "stats.pdf", trials, T, dt=0.1)
+	store = stats_store.open_store(results_path)
+	report = plot_stats.Report(results_path / "stats.pdf", trials, T, dt=0.1, store=store)
 
 	for instance in instances:
 		for alg in algs:
-			result_folder = results_path / instance / alg
-			stat_files = [str(p) for p in result_folder.glob("**/stats.yaml")]
+			stat_files = [str(p) for p in store.glob(instance + "/" + alg + "/**/stats.yaml")]
 			if len(stat_files) > 0:
 				report.load_stat_files(instance, alg, stat_files)
 
 	report.add_barplot_initial_cost_plot(instances)
+	report.add_time_breakdown_plot(instances)
 	for instance in instances:
 		report.add_success_and_cost_over_time_plot(instance)
 		# report.add_time_cost_plot(instance)
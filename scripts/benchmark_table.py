@@ -2,6 +2,75 @@ from pathlib import Path
 import yaml
 import numpy as np
 import subprocess
+import stats_store
+
+def collect_runs(store, instance, alg, T, base_of=None):
+	"""Samples over the runs of alg on instance (which may be a pattern, such
+	as gen_p10_n2_*_hetero), up to the time horizon T.
+
+	If base_of is given, it maps a stats file to the (store, stats file) of the
+	run to compute the regrets against.
+	"""
+	stat_files = [str(p) for p in store.glob(instance + "/"+alg+"/**/stats.yaml")]
+
+	runs = {
+		"runs": len(stat_files),
+		"initial_times": [],
+		"initial_time_regrets": [],
+		"initial_costs": [],
+		"initial_regrets": [],
+		"final_costs": [],
+		"final_regrets": [],
+		"peak_rss": [],
+		"cpu_user": [],
+		"cpu_system": [],
+		"ctx_switches": [],
+	}
+
+	for stat_file in stat_files:
+		final_cost_base = None
+		initial_time_base = None
+		if base_of is not None:
+			base_store, stat_file_base = base_of(stat_file)
+			stats = base_store.load(stat_file_base)
+			if stats is not None and "stats" in stats and stats["stats"] is not None:
+				for k, d in enumerate(stats["stats"]):
+					# skip results that were after our time horizon
+					if d["t"] > T:
+						break
+					if k == 0:
+						initial_time_base = d["t"]
+					final_cost_base = d["cost"]
+
+		stats = store.load(stat_file)
+		if stats is not None and stats.get("resources") is not None:
+			r = stats["resources"]
+			runs["peak_rss"].append(r["peak_rss"])
+			runs["cpu_user"].append(r["cpu_user"])
+			runs["cpu_system"].append(r["cpu_system"])
+			runs["ctx_switches"].append(r["ctx_switches_voluntary"] + r["ctx_switches_involuntary"])
+		if stats is not None and "stats" in stats and stats["stats"] is not None:
+			last_cost = None
+			for k, d in enumerate(stats["stats"]):
+				# skip results that were after our time horizon
+				if d["t"] > T:
+					break
+				if k == 0:
+					runs["initial_times"].append(d["t"])
+					runs["initial_costs"].append(d["cost"])
+					if initial_time_base is not None:
+						runs["initial_time_regrets"].append((d["t"] - initial_time_base)/d["t"] * 100)
+						runs["initial_regrets"].append((d["cost"] - final_cost_base)/d["cost"] * 100)
+
+				last_cost = d["cost"]
+			if last_cost is not None:
+				runs["final_costs"].append(last_cost)
+			if last_cost is not None and final_cost_base is not None:
+				runs["final_regrets"].append((last_cost - final_cost_base)/last_cost * 100)
+	return runs
+
+def _median(values):
+	return np.median(values) if len(values) > 0 else None
 
 def compute_results(instances, algs, results_path, trials, T, regret=False):
 	all_result = dict()
@@ -10,74 +79,32 @@ def compute_results(instances, algs, results_path, trials, T, regret=False):
 		trials = [trials]*len(instances)
 	print(trials)
 
+	store = stats_store.open_store(results_path)
+
 	for instance, itrials in zip(instances, trials):
 		result = dict()
 		for alg in algs:
-			if not regret:
-				result_folder = results_path / instance / alg
-				stat_files = [str(p) for p in result_folder.glob("**/stats.yaml")]
-			else:
-				stat_files = [str(p) for p in results_path.glob(instance + "/"+alg+"/**/stats.yaml")]
-			initial_time_regrets = []
-			final_regrets = []
-
-			# load data
-			initial_times = []
-			initial_time_regrets = []
-			initial_costs = []
-			initial_regrets = []
-			final_costs = []
-			final_regrets = []
-
-			for stat_file in stat_files:
-				final_cost_base = None
-				initial_time_base = None
-				if regret:
-					stat_file_base = stat_file.replace(alg, "db-cbs")
-					if Path(stat_file_base).exists():
-						with open(stat_file_base) as sf:
-							stats = yaml.safe_load(sf)
-						if stats is not None and "stats" in stats and stats["stats"] is not None:
-							for k, d in enumerate(stats["stats"]):
-								# skip results that were after our time horizon
-								if d["t"] > T:
-									break
-								if k == 0:
-									initial_time_base = d["t"]
-								final_cost_base = d["cost"]
-
-				with open(stat_file) as sf:
-					stats = yaml.safe_load(sf)
-				if stats is not None and "stats" in stats and stats["stats"] is not None:
-					last_cost = None
-					for k, d in enumerate(stats["stats"]):
-						# skip results that were after our time horizon
-						if d["t"] > T:
-							break
-						if k == 0:
-							initial_times.append(d["t"])
-							initial_costs.append(d["cost"])
-							if initial_time_base is not None:
-								initial_time_regrets.append((d["t"] - initial_time_base)/d["t"] * 100)
-								initial_regrets.append((d["cost"] - final_cost_base)/d["cost"] * 100)
-
-						last_cost = d["cost"]
-					if last_cost is not None:
-						final_costs.append(last_cost)
-					if last_cost is not None and final_cost_base is not None:
-						final_regrets.append((last_cost - final_cost_base)/last_cost * 100)
+			base_of = None
+			if regret:
+				base_of = lambda stat_file: (store, stat_file.replace(alg, "db-cbs"))
+			runs = collect_runs(store, instance, alg, T, base_of)
 
 			result[alg] = {
-				'success': len(initial_times)/itrials,
-				't^st_median': np.median(initial_times) if len(initial_times) > 0 else None,
-				'tr^st_median': np.median(initial_time_regrets) if len(initial_time_regrets) > 0 else None,
-				'J^st_median': np.median(initial_costs) if len(initial_costs) > 0 else None,
-				'Jr^st_median': np.median(initial_regrets) if len(initial_regrets) > 0 else None,
-				'J^f_median': np.median(final_costs) if len(initial_costs) > 0 else None,
-				'Jr^f_median': np.median(final_regrets) if len(final_regrets) > 0 else None,
+				'success': len(runs["initial_times"])/itrials,
+				't^st_median': _median(runs["initial_times"]),
+				'tr^st_median': _median(runs["initial_time_regrets"]),
+				'J^st_median': _median(runs["initial_costs"]),
+				'Jr^st_median': _median(runs["initial_regrets"]),
+				'J^f_median': _median(runs["final_costs"]) if len(runs["initial_costs"]) > 0 else None,
+				'Jr^f_median': _median(runs["final_regrets"]),
+				# resource usage of the solver process (over all runs, including failed ones)
+				'rss^max_median': _median(runs["peak_rss"]),
+				'cpu^user_median': _median(runs["cpu_user"]),
+				'cpu^sys_median': _median(runs["cpu_system"]),
+				'ctx_median': _median(runs["ctx_switches"]),
 			}
 
-			if alg == "s2m2" and len(initial_times) == 0 and "unicycle_sphere" not in instance:
+			if alg == "s2m2" and len(runs["initial_times"]) == 0 and "unicycle_sphere" not in instance:
 				for key in result[alg].keys():
 					result[alg][key] = '*'
 
@@ -124,7 +151,7 @@ def print_and_highlight_best_max(out, key, result, alg, algs, digits=1):
 	return out
 
 
-def write_table(rows, algs, results_path, fname, trials, T, regret=False):
+def write_table(rows, algs, results_path, fname, trials, T, regret=False, resources=False):
 
 	result = compute_results(rows, algs, results_path, trials, T, regret)
 
@@ -161,40 +188,43 @@ def write_table(rows, algs, results_path, fname, trials, T, regret=False):
 			"db-cbs": "db-CBS",
 		}
 
+		# solver resource usage, lower is better
+		resource_columns = [
+			('rss^max_median', r"$\mathrm{RSS}^{\max} [\mathrm{MiB}]$", 0),
+			('cpu^user_median', r"$t^{\mathrm{cpu}}_{\mathrm{user}} [s]$", 1),
+			('cpu^sys_median', r"$t^{\mathrm{cpu}}_{\mathrm{sys}} [s]$", 1),
+			('ctx_median', r"$n^{\mathrm{ctx}}$", 0),
+		] if resources else []
+
+		def num_columns(alg):
+			return (4 if alg == "sst" and not regret else 3) + len(resource_columns)
+
 		out = r"\begin{tabular}{c || c"
 		for alg in algs:
-			if alg == "sst" and not regret:
-				out += r" || r|r|r|r"
-			else:
-				out += r" || r|r|r"
+			out += r" || " + "|".join(["r"] * num_columns(alg))
 		out += "}\n"
 		f.write(out)
 		out = r"\# & Instance"
 		for k, alg in enumerate(algs):
 			if k == len(algs) - 1:
-				if alg == "sst" and not regret:
-					out += r" & \multicolumn{4}{c}{"
-				else:
-					out += r" & \multicolumn{3}{c}{"
+				out += r" & \multicolumn{" + str(num_columns(alg)) + r"}{c}{"
 			else:
-				if alg == "sst" and not regret:
-					out += r" & \multicolumn{4}{c||}{"
-				else:
-					out += r" & \multicolumn{3}{c||}{"
+				out += r" & \multicolumn{" + str(num_columns(alg)) + r"}{c||}{"
 			out += alg_names[alg]
 			out += r"}"
 		out += r"\\"
 		f.write(out)
 		out = r"& "
-		if not regret:
-			for alg in algs:
+		for alg in algs:
+			if not regret:
 				if alg == "sst":
 					out += r" & $p$ & $t^{\mathrm{st}} [s]$ & $J^{\mathrm{st}} [s]$ & $J^{f} [s]$"
 				else:
 					out += r" & $p$ & $t^{\mathrm{st}} [s]$ & $J^{\mathrm{st},f} [s]$"
-		else:
-			for alg in algs:
+			else:
 				out += r" & $p$ & $t_r^{\mathrm{st}} [\%]$ & $J_r^{f} [\%]$"
+			for _, header, _ in resource_columns:
+				out += " & " + header
 		out += r"\\"
 		f.write(out)
 		f.write(r"\hline")
@@ -219,6 +249,8 @@ def write_table(rows, algs, results_path, fname, trials, T, regret=False):
 					out = print_and_highlight_best_max(out, 'success', result[row], alg, algs)
 					out = print_and_highlight_best(out, 'tr^st_median', result[row], alg, algs)
 					out = print_and_highlight_best(out, 'Jr^f_median', result[row], alg, algs)
+				for key, _, digits in resource_columns:
+					out = print_and_highlight_best(out, key, result[row], alg, algs, digits)
 
 			out += r"\\"
 			f.write(out)
@@ -245,7 +277,7 @@ def main():
 		"db-cbs",
 	]
 
-	write_table(rows, algs, results_path, "table.pdf", 1, 5*60)
+	write_table(rows, algs, results_path, "table.pdf", 1, 5*60, resources=True)
 
 if __name__ == '__main__':
 	main()
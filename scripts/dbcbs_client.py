@@ -0,0 +1,39 @@
+import json
+import socket
+import yaml
+
+
+def solve(server, filename_env, cfg, filename_result, filename_joint, filename_opt, timelimit, filename_progress=None, filename_stats=None):
+	"""Solves an instance with a running db_cbs_server (listening on the Unix
+	socket server). The results are written to the same files as ./db_cbs would
+	write them. Returns the response of the server, e.g.
+	{"feasible": True, "timed_out": False, "cost": 12.3, "stats": {"iterations": 2, ...}}"""
+	request = {
+		"env": str(filename_env),
+		"cfg": cfg,
+		"output": str(filename_result),
+		"joint": str(filename_joint),
+		"optimization": str(filename_opt),
+		"timelimit": timelimit,
+	}
+	if filename_progress is not None:
+		request["progress"] = str(filename_progress)
+	if filename_stats is not None:
+		request["stats"] = str(filename_stats)
+
+	with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+		s.connect(str(server))
+		s.sendall(json.dumps(request).encode())
+		# the server starts solving once the request is complete
+		s.shutdown(socket.SHUT_WR)
+		chunks = []
+		while True:
+			chunk = s.recv(4096)
+			if not chunk:
+				break
+			chunks.append(chunk)
+
+	response = yaml.safe_load(b"".join(chunks).decode())
+	if response is None or "error" in response:
+		raise RuntimeError("db_cbs_server: {}".format(response["error"] if response else "no response"))
+	return response
@@ -11,6 +11,7 @@ import copy
 import shutil
 from collections import defaultdict
 import tempfile
+import concurrent.futures
 from pathlib import Path
 import msgpack
 
@@ -23,80 +24,182 @@ sys.path.append(os.getcwd())
 # import gen_motion_primitive
 from motionplanningutils import RobotHelper
 import checker
+import motion_importance
 
 # ./dbastar -i ../benchmark/dubins/kink_0.yaml -m motions.yaml -o output.yaml --delta 0.3
 
-def find_smallest_delta(filename_env, filename_motions, filename_result_dbastar, max_delta, max_cost):
+# outcome of dbastar runs: (env, motions, delta, max_cost) -> content of the
+# result file, or None if it failed
+_delta_probes = dict()
+
+def _file_key(filename):
+	st = os.stat(filename)
+	return (os.path.realpath(filename), st.st_size, st.st_mtime_ns)
+
+def _irrelevant(delta, outcomes):
+	"""True if the outcome of a probe at delta cannot change the bracket"""
+	succeeded = [d for d, r in outcomes.items() if r is not None]
+	failed = [d for d, r in outcomes.items() if r is None]
+	return (succeeded and delta > min(succeeded)) or (failed and delta < max(failed))
+
+def find_smallest_delta(filename_env, filename_motions, filename_result_dbastar, max_delta, max_cost, workers=None, eps=0.01):
+	"""Smallest delta (up to eps) for which dbastar finds a solution, or None.
+
+	Each round probes `workers` deltas evenly spaced in the current bracket in
+	parallel. A success at delta makes all larger probes irrelevant, a failure
+	all smaller ones, so those are killed. Outcomes are cached per
+	(env, motions, delta, max_cost)."""
+	if workers is None:
+		workers = os.cpu_count()
+	key = (_file_key(filename_env), _file_key(filename_motions), max_cost)
+
 	low = 0
 	high = max_delta
-	delta = high
 	best_delta = None
-	eps = 0.01
-
-	while low < high - eps:
-		delta = (high + low) / 2
-		print("ATTEMPT WITH DELTA ", delta, low, high)
-		result = subprocess.run(["./dbastar", 
-			"-i", filename_env,
-			"-m", filename_motions,
-			"-o", filename_result_dbastar,
-			"--delta", str(delta),
-			"--maxCost", str(max_cost)])
-		if result.returncode != 0:
-			# failure -> need higher delta
-			low = delta
-		else:
-			# success -> try lower delta
-			high = delta
-			best_delta = delta
-		print("NEW ", low, high)
 
+	with tempfile.TemporaryDirectory() as tmpdirname:
+		while low < high - eps:
+			deltas = [low + (high - low) * (i + 1) / (workers + 1) for i in range(workers)]
+			print("ATTEMPT WITH DELTAS ", deltas, low, high)
+			outcomes = {d: _delta_probes[key + (d,)] for d in deltas if key + (d,) in _delta_probes}
+
+			running = dict()
+			for i, delta in enumerate(deltas):
+				if delta in outcomes or _irrelevant(delta, outcomes):
+					continue
+				filename_result = Path(tmpdirname) / "result_dbastar_{}.yaml".format(i)
+				p = subprocess.Popen(["./dbastar",
+					"-i", filename_env,
+					"-m", filename_motions,
+					"-o", filename_result,
+					"--delta", str(delta),
+					"--maxCost", str(max_cost)],
+					stdout=subprocess.DEVNULL)
+				running[delta] = (p, filename_result)
+
+			# one thread per probe waits for its process, so that the outcomes are
+			# handled as soon as they are known
+			if running:
+				with concurrent.futures.ThreadPoolExecutor(len(running)) as pool:
+					waiting = {pool.submit(p.wait): delta for delta, (p, _) in running.items()}
+					killed = set()
+					while waiting:
+						done, _ = concurrent.futures.wait(waiting, return_when=concurrent.futures.FIRST_COMPLETED)
+						for future in done:
+							delta = waiting.pop(future)
+							p, filename_result = running.pop(delta)
+							if delta in killed:
+								continue
+							result = None
+							if p.returncode == 0:
+								with open(filename_result) as f:
+									result = f.read()
+							_delta_probes[key + (delta,)] = result
+							outcomes[delta] = result
+						for delta, (p, _) in running.items():
+							if delta not in killed and _irrelevant(delta, outcomes):
+								p.kill()
+								killed.add(delta)
+
+			# success -> try lower delta
+			succeeded = [d for d, r in outcomes.items() if r is not None]
+			if succeeded:
+				high = best_delta = min(succeeded)
+			# failure -> need higher delta
+			failed = [d for d, r in outcomes.items() if r is None and d < high]
+			if failed:
+				low = max(failed)
+			print("NEW ", low, high)
+
+	if best_delta is not None:
+		with open(filename_result_dbastar, 'w') as f:
+			f.write(_delta_probes[key + (best_delta,)])
 	return best_delta
 
 
-def compute_motion_importance(filename_env, filename_motions, filename_result_dbastar, delta, max_cost, motions_stats):
-	# load the result
-	with open(filename_result_dbastar) as f:
-		result = yaml.safe_load(f)
-		old_cost = len(result["result"][0]["actions"])
-
-	# load the motions file
-	with open(filename_motions) as f:
-		all_motions = yaml.safe_load(f)
-
-	for name, v in result["result"][0]["motion_stats"].items():
-		# create temporary motions file with one motion removed
-		motions = copy.copy(all_motions)
-		for k, m in enumerate(motions):
-			if name == m["name"]:
-				break
-		del motions[k]
-		with open("motions_tmp.yaml", 'w') as file:
-			yaml.dump(motions, file)
-
-
-		result = subprocess.run(["./dbastar",
-							"-i", filename_env,
-							"-m", 'motions_tmp.yaml',
-							"-o", 'result_dbastar_tmp.yaml',
-							"--delta", str(delta),
-							"--maxCost", str(max_cost)])
-		if result.returncode != 0:
-			# failure -> this was a very important edge
-			print(k, "super important!")
-			motions_stats[name] += 1
-		else:
-			# success -> compute numeric importance
-			# load the result
-			with open('result_dbastar_tmp.yaml') as f:
-				result = yaml.safe_load(f)
-				new_cost = len(result["result"][0]["actions"])
-			print(k, old_cost, new_cost, 1 - old_cost / new_cost)
-			motions_stats[name] += np.clip(1 - old_cost / new_cost, 0, 1)
+def compute_motion_importance(filename_env, filename_motions, delta, max_cost, motions_stats, workers=None):
+	"""Adds the leave-one-out importance of the motions (msgpack library
+	indices) that solve filename_env to motions_stats; see motion_importance.py"""
+	report = motion_importance.compute([filename_env], filename_motions, delta, max_cost=max_cost, workers=workers)
+	for entry in report["importance"]:
+		motions_stats[entry["motion"]] += entry["score"]
 	return motions_stats
 
+def run_dbastar_incremental(filename_env, folder, timelimit, cfg):
+	"""Like run_dbastar, but keeps the db-A* search tree in this process while
+	more primitives are added, instead of re-running ./dbastar from scratch"""
+	# only built with BUILD_PYTHON_BINDINGS
+	from motionplanningutils import IncrementalDBAstar
+
+	add_prims = cfg["add_primitives_per_iteration"]
+
+	with open(filename_env) as f:
+		env = yaml.safe_load(f)
+	robot_type = env["robots"][0]["type"]
+
+	with open('../cloud/motions/{}_sorted.msgpack'.format(robot_type), 'rb') as f:
+		all_motions = msgpack.unpack(f)
+	print("Have {} motions in total".format(len(all_motions)))
+
+	start = time.time()
+	planner = IncrementalDBAstar(filename_env,
+		delta=-cfg["desired_branching_factor"],
+		epsilon=cfg["suboptimality_bound"],
+		alpha=cfg["alpha"],
+		filter_duplicates=cfg["filter_duplicates"])
+
+	sol = 0
+	best_cost = float('inf')
+	filename_stats = "{}/stats.yaml".format(folder)
+	with open(filename_stats, 'w') as stats:
+		stats.write("stats:\n")
+		num_motions = 0
+		while time.time() - start < timelimit and num_motions < len(all_motions):
+			planner.add_motions(all_motions[num_motions:num_motions+add_prims])
+			num_motions += add_prims
+
+			t_dbastar_start = time.time()
+			result = planner.search(timelimit=max(timelimit - (t_dbastar_start - start), 1e-3))
+			duration_dbastar = time.time() - t_dbastar_start
+			if result is None:
+				print("dbA* failed; Using more primitives", planner.num_motions)
+				continue
+
+			print("dbA* cost", result["cost"], "with", planner.num_motions, "primitives")
+			# without a better path, the search returns the previous solution again
+			if result["cost"] >= best_cost:
+				continue
+			best_cost = result["cost"]
+			# like --maxCost of ./dbastar; only solutions that beat this one from now on
+			planner.max_cost = best_cost
+
+			filename_result_dbastar = "{}/result_dbastar_sol{}.yaml".format(folder, sol)
+			with open(filename_result_dbastar, 'w') as f:
+				yaml.dump({
+					"delta": result["delta"],
+					"epsilon": cfg["suboptimality_bound"],
+					"cost": result["cost"],
+					"result": [{
+						"states": result["states"].tolist(),
+						"actions": result["actions"].tolist(),
+						"motion_stats": result["motion_stats"],
+					}],
+				}, f, default_flow_style=None)
+			delta_achieved = checker.compute_delta(filename_env, filename_result_dbastar)
+			print("DELTA CHECK", delta_achieved)
+			stats.write("  - t: {}\n".format(time.time() - start))
+			stats.write("    cost: {}\n".format(result["cost"]))
+			stats.write("    duration_dbastar: {}\n".format(duration_dbastar))
+			stats.write("    expansions: {}\n".format(planner.num_expansions))
+			stats.flush()
+			sol += 1
+
+
 def run_dbastar(filename_env, folder, timelimit, cfg, opt_alg="scp", motions_stats=None):
 
+	if cfg.get("incremental", False):
+		return run_dbastar_incremental(filename_env, folder, timelimit, cfg)
+
 	add_prims = cfg["add_primitives_per_iteration"]
 	desired_branching_factor = cfg["desired_branching_factor"]
 	epsilon = cfg["suboptimality_bound"]
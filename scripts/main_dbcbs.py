@@ -7,13 +7,29 @@ from pathlib import Path
 import sys
 import os
 import yaml
+import asyncio
+import dataclasses
+import traceback
+from resource_monitor import ProcessResult, write_resources
+import solver_runner
+from progress_log import ProgressTail
+import dbcbs_client
 # import msgpack
 
 
 sys.path.append(os.getcwd())
 
 
-def run_dbcbs(filename_env, folder, timelimit, cfg):
+def load_dbcbs_stats(filename):
+    """Per phase timings and counters written by db_cbs --stats ({} if there are none)"""
+    if not os.path.exists(filename):
+        return dict()
+    with open(filename) as f:
+        return yaml.safe_load(f) or dict()
+
+
+async def run_dbcbs_async(filename_env, folder, timelimit, cfg, server=None):
+    # server: socket of a running db_cbs_server, which has the motions already loaded
     with tempfile.TemporaryDirectory() as tmpdirname:
         p = Path(tmpdirname)
         filename_cfg = p / "cfg.yaml"
@@ -24,12 +40,18 @@ def run_dbcbs(filename_env, folder, timelimit, cfg):
         filename_stats = "{}/stats.yaml".format(folder)
         start = time.time()
         duration_dbcbs = 0
+        process_result = None
         with open(filename_stats, 'w') as stats:
             stats.write("stats:\n")
             
             filename_result_dbcbs = Path(folder) / "result_dbcbs.yaml"
             filename_result_dbcbs_joint = Path(folder) / "dbcbs_joint.yaml"
             filename_result_dbcbs_opt = Path(folder) / "result_dbcbs_opt.yaml"
+            filename_progress = Path(folder) / "progress.jsonl"
+            filename_dbcbs_stats = Path(folder) / "dbcbs_stats.yaml"
+            # do not pick up the events or stats of an earlier run
+            filename_progress.unlink(missing_ok=True)
+            filename_dbcbs_stats.unlink(missing_ok=True)
             t_dbcbs_start = time.time()
 
             cmd = ["./db_cbs", 
@@ -37,22 +59,42 @@ def run_dbcbs(filename_env, folder, timelimit, cfg):
                 "-o", filename_result_dbcbs,
                 "--joint", filename_result_dbcbs_joint,
                 "--opt", filename_result_dbcbs_opt,
-                "-c", str(filename_cfg)]
-            print(subprocess.list2cmdline(cmd))
+                "-c", str(filename_cfg),
+                "--progress", filename_progress,
+                "--stats", filename_dbcbs_stats,
+                "--timelimit", str(timelimit)]
+            progress = ProgressTail(filename_progress, label=Path(folder).name)
+            progress.start()
             try:
-                with open("{}/log.txt".format(folder), 'w') as logfile:
-                    result = subprocess.run(cmd, timeout=timelimit, stdout=logfile, stderr=logfile)
+                if server is not None:
+                    response = await asyncio.to_thread(dbcbs_client.solve, server, filename_env, cfg, filename_result_dbcbs,
+                        filename_result_dbcbs_joint, filename_result_dbcbs_opt, timelimit, filename_progress,
+                        filename_dbcbs_stats)
+                    result = ProcessResult(0 if response["feasible"] else 1, response["timed_out"], None)
+                else:
+                    print(subprocess.list2cmdline(cmd))
+                    # db_cbs stops itself at the time limit and still writes its stats;
+                    # it is only killed if it does not (e.g. in a long low-level search)
+                    result = await solver_runner.run_async(cmd, log="{}/log.txt".format(folder),
+                        timeout=solver_runner.deadline(timelimit))
+                    if result.returncode != 0 and load_dbcbs_stats(filename_dbcbs_stats).get("timed_out"):
+                        result = dataclasses.replace(result, timed_out=True, failure="timeout")
+                    process_result = result
                 t_dbcbs_stop = time.time()
                 duration_dbcbs += t_dbcbs_stop - t_dbcbs_start
-                if result.returncode != 0:
+                if result.timed_out:
+                    print("db-cbs timed out")
+                elif result.returncode != 0:
                     print("db-cbs failed ", result.returncode)
                 else:
                     # shutil.copyfile(filename_result_dbcbs_opt, "{}/result_dbcbs_opt.yaml".format(folder))
-                    cost = 0
-                    with open(filename_result_dbcbs_opt) as f:
-                        result = yaml.safe_load(f)
-                        for r in result["result"]:
-                            cost += len(r["actions"]) * 0.1
+                    cost = load_dbcbs_stats(filename_dbcbs_stats).get("cost")
+                    if cost is None:
+                        cost = 0
+                        with open(filename_result_dbcbs_opt) as f:
+                            result_opt = yaml.safe_load(f)
+                            for r in result_opt["result"]:
+                                cost += len(r["actions"]) * 0.1
 
                     #     cost = result["cost"] # cost*2
                     now = time.time()
@@ -62,8 +104,19 @@ def run_dbcbs(filename_env, folder, timelimit, cfg):
                     stats.write("    cost: {}\n".format(cost))
                     stats.write("    duration_dbcbs: {}\n".format(duration_dbcbs))
                     stats.flush()
-            except:
+            except Exception:
+                traceback.print_exc()
                 print("Failure!")
+        progress.stop()
+        if process_result is not None:
+            write_resources(filename_stats, process_result)
+        # also for failed runs, to see where the time went
+        with open(filename_stats, 'a') as stats:
+            yaml.dump({"progress": progress.summary()}, stats, Dumper=yaml.CSafeDumper, default_flow_style=False)
+            dbcbs_stats = load_dbcbs_stats(filename_dbcbs_stats)
+            if dbcbs_stats:
+                yaml.dump({"dbcbs": dbcbs_stats}, stats, Dumper=yaml.CSafeDumper, default_flow_style=False)
 
 
-
+def run_dbcbs(filename_env, folder, timelimit, cfg, server=None):
+    asyncio.run(run_dbcbs_async(filename_env, folder, timelimit, cfg, server))
@@ -5,8 +5,11 @@ import subprocess
 import tempfile
 from pathlib import Path
 import yaml
+import asyncio
+from resource_monitor import write_resources
+import solver_runner
 
-def run_ompl(filename_env, folder, timelimit, cfg):
+async def run_ompl_async(filename_env, folder, timelimit, cfg):
 
 	with tempfile.TemporaryDirectory() as tmpdirname:
 		p = Path(tmpdirname)
@@ -14,18 +17,21 @@ def run_ompl(filename_env, folder, timelimit, cfg):
 		with open(filename_cfg, 'w') as f:
 			yaml.dump(cfg, f, Dumper=yaml.CSafeDumper)
 		
-		with open("{}/log.txt".format(folder), 'w') as logfile: 
-			result = subprocess.run(["./main_ompl", 
-				"-i", filename_env,
-				"-o", "{}/result_ompl.yaml".format(folder),
-				"--stats", "{}/stats.yaml".format(folder),
-				"--timelimit", str(timelimit),
-				"-p", "sst",
-				"-c", str(filename_cfg)],
-				stdout=logfile, stderr=logfile)
+		result = await solver_runner.run_async(["./main_ompl",
+			"-i", filename_env,
+			"-o", "{}/result_ompl.yaml".format(folder),
+			"--stats", "{}/stats.yaml".format(folder),
+			"--timelimit", str(timelimit),
+			"-p", "sst",
+			"-c", str(filename_cfg)],
+			log="{}/log.txt".format(folder), timeout=solver_runner.deadline(timelimit))
+		write_resources("{}/stats.yaml".format(folder), result)
 		if result.returncode != 0:
 			print("OMPL failed")
 
+def run_ompl(filename_env, folder, timelimit, cfg):
+	asyncio.run(run_ompl_async(filename_env, folder, timelimit, cfg))
+
 def main():
 	parser = argparse.ArgumentParser()
 	parser.add_argument("env", help="file containing the environment (YAML)")
@@ -1,21 +1,28 @@
 import argparse
 import subprocess
 from pathlib import Path
+import asyncio
+from resource_monitor import write_resources
+import solver_runner
 
 
-def run_s2m2(filename_env, folder, timelimit, cfg):
+async def run_s2m2_async(filename_env, folder, timelimit, cfg):
 	s2sm_script = Path().resolve().parent / "s2m2/main_s2m2_original.py"
-	with open("{}/log.txt".format(folder), 'w') as logfile: 
-		result = subprocess.run(["python3",
-			s2sm_script, 
-			filename_env,
-			folder,
-			str(timelimit),
-			str(cfg),
-			],
-			stdout=logfile, stderr=logfile)
+	# s2m2 starts its own python subprocesses; they are in the same process group
+	result = await solver_runner.run_async(["python3",
+		s2sm_script, 
+		filename_env,
+		folder,
+		str(timelimit),
+		str(cfg),
+		],
+		log="{}/log.txt".format(folder), timeout=solver_runner.deadline(timelimit))
+	write_resources("{}/stats.yaml".format(folder), result)
 	if result.returncode != 0:
 		print("S2SM failed")
+
+def run_s2m2(filename_env, folder, timelimit, cfg):
+	asyncio.run(run_s2m2_async(filename_env, folder, timelimit, cfg))
 		
 def main():
 	parser = argparse.ArgumentParser()
@@ -0,0 +1,139 @@
+import argparse
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+import math
+import os
+import msgpack
+import numpy as np
+import yaml
+
+# python3 ../scripts/motion_importance.py ../example/*.yaml --motions ../motions/unicycle_first_order_0_sorted.msgpack --delta 0.3 --report importance.yaml
+
+# Leave-one-out importance of motion primitives: each motion used by the
+# db-A* solution of an environment is disabled in turn and the environment is
+# solved again. A motion without which there is no solution scores 1,
+# otherwise 1 - cost / cost without it. Scores are summed over environments.
+#
+# The searches run in memory (motionplanningutils.IncrementalDBAstar) in a
+# process pool; every worker loads the library once.
+
+# per worker: the library and the planner of the last environment
+_motions = None
+_planner_env = None
+_planner = None
+
+def _load_library(filename_motions, num_motions):
+	with open(filename_motions, 'rb') as f:
+		motions = msgpack.unpack(f)
+	return motions if num_motions is None else motions[0:num_motions]
+
+def _init_worker(filename_motions, num_motions):
+	global _motions
+	_motions = _load_library(filename_motions, num_motions)
+
+def _get_planner(filename_env, delta, alpha, max_cost):
+	global _planner_env, _planner
+	if _planner_env != filename_env:
+		from motionplanningutils import IncrementalDBAstar
+		_planner = None
+		_planner = IncrementalDBAstar(filename_env, delta=delta, alpha=alpha,
+			filter_duplicates=False, max_cost=max_cost)
+		_planner.add_motions(_motions)
+		_planner_env = filename_env
+	_planner.restart()
+	return _planner
+
+def _baseline(filename_env, delta, alpha, max_cost, timelimit):
+	planner = _get_planner(filename_env, delta, alpha, max_cost)
+	result = planner.search(timelimit)
+	if result is None:
+		return None
+	return {"delta": planner.delta, "cost": result["cost"], "motion_stats": result["motion_stats"]}
+
+def _leave_one_out(filename_env, delta, alpha, max_cost, timelimit, idx):
+	planner = _get_planner(filename_env, delta, alpha, max_cost)
+	planner.set_disabled(idx)
+	try:
+		result = planner.search(timelimit)
+	finally:
+		planner.set_disabled(idx, False)
+	return None if result is None else result["cost"]
+
+def compute(filenames_env, filename_motions, delta, alpha=0.5, max_cost=math.inf, timelimit=60,
+		workers=None, num_motions=None):
+	"""Importance report of the motions in filename_motions (msgpack) over
+	the given environments. Motions are identified by their index in the
+	library. A search that hits timelimit (s) counts as failed."""
+	if workers is None:
+		workers = os.cpu_count()
+	with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+			initargs=(filename_motions, num_motions)) as executor:
+		n = len(filenames_env)
+		baselines = list(executor.map(_baseline, filenames_env, [delta] * n, [alpha] * n,
+			[max_cost] * n, [timelimit] * n))
+
+		# one task per (environment, used motion); consecutive tasks share the environment
+		tasks = []
+		for filename_env, baseline in zip(filenames_env, baselines):
+			if baseline is None:
+				print("{}: no solution with all motions".format(filename_env))
+				continue
+			for idx in baseline["motion_stats"]:
+				tasks.append((filename_env, baseline["delta"], idx))
+		chunksize = max(1, len(tasks) // (4 * workers))
+		costs = list(executor.map(_leave_one_out,
+			[t[0] for t in tasks], [t[1] for t in tasks], [alpha] * len(tasks), [max_cost] * len(tasks),
+			[timelimit] * len(tasks), [t[2] for t in tasks], chunksize=chunksize))
+
+	environments = dict()
+	for filename_env, baseline in zip(filenames_env, baselines):
+		if baseline is None:
+			environments[filename_env] = {"solved": False}
+		else:
+			environments[filename_env] = {"solved": True, "delta": baseline["delta"],
+				"cost": baseline["cost"], "used": len(baseline["motion_stats"])}
+
+	score = defaultdict(float)
+	critical = defaultdict(int)
+	used = defaultdict(int)
+	for (filename_env, _, idx), cost in zip(tasks, costs):
+		used[idx] += 1
+		if cost is None:
+			critical[idx] += 1
+			score[idx] += 1
+		else:
+			score[idx] += float(np.clip(1 - environments[filename_env]["cost"] / cost, 0, 1))
+
+	importance = [{"motion": int(idx), "score": score[idx], "critical": critical[idx], "used": used[idx]}
+		for idx in sorted(score, key=lambda idx: (-score[idx], idx))]
+	return {
+		"motions": str(filename_motions),
+		"num_motions": len(_load_library(filename_motions, num_motions)),
+		"delta": delta,
+		"environments": environments,
+		"importance": importance,
+	}
+
+
+def main():
+	parser = argparse.ArgumentParser(description="Leave-one-out importance of motion primitives over many environments")
+	parser.add_argument("env", nargs="+", help="environments (YAML)")
+	parser.add_argument("--motions", required=True, help="motion library (msgpack)")
+	parser.add_argument("--num-motions", type=int, help="use only the first motions of the library")
+	parser.add_argument("--delta", type=float, required=True, help="discontinuity bound (negative: -k, k applicable motions on average)")
+	parser.add_argument("--alpha", type=float, default=0.5)
+	parser.add_argument("--max-cost", type=float, default=math.inf)
+	parser.add_argument("--timelimit", type=float, default=60, help="per search (s)")
+	parser.add_argument("--workers", type=int, help="number of processes (default: all cores)")
+	parser.add_argument("--report", default="importance.yaml", help="output file (YAML)")
+	args = parser.parse_args()
+
+	report = compute(args.env, args.motions, args.delta, args.alpha, args.max_cost, args.timelimit,
+		args.workers, args.num_motions)
+	with open(args.report, 'w') as f:
+		yaml.safe_dump(report, f, sort_keys=False)
+	print("{} of {} motions are used".format(len(report["importance"]), report["num_motions"]))
+
+
+if __name__ == '__main__':
+	main()
@@ -10,7 +10,7 @@ from matplotlib.cm import get_cmap
 from collections import defaultdict
 
 class Report:
-  def __init__(self, filename, trials, T, dt):
+  def __init__(self, filename, trials, T, dt, store=None):
 
     tex_fonts = {
         # Use LaTeX to write all text
@@ -47,17 +47,25 @@ class Report:
     self.dt = dt
     self.times = np.arange(0, self.T, self.dt)
     self.stats = dict()
+    # per experiment, the db-cbs time per phase of each run
+    self.phase_times = dict()
+    # stats_store.StatsStore to read the stat files from (instead of parsing them)
+    self.store = store
 
   def load_stat_files(self, exp_name, algo, filenames):
     costs = []
     for filename in filenames:
-      costs.append(load_data(filename, self.T, self.dt))
+      costs.append(load_data(filename, self.T, self.dt, self.store))
 
     # convert to 2D array
     costs = np.array(costs)
     key = (exp_name, algo)
     self.stats[key] = costs
 
+    if algo == "db-cbs":
+      phase_times = [load_phase_times(filename, self.store) for filename in filenames]
+      self.phase_times[exp_name] = [p for p in phase_times if p is not None]
+
   def add_time_cost_plot(self, exp_name):
     self._add_page()
     self.fig, self.ax = plt.subplots()
@@ -275,6 +283,44 @@ class Report:
     ax[1,0].set_ylabel("Time for first solution [s]")
 
 
+  def add_time_breakdown_plot(self, exp_names):
+    # the HL search time includes the conflict checks and the low-level replanning
+    phases = [
+      ('motion_loading', 'motion loading'),
+      ('heuristic', 'heuristic'),
+      ('motion_filtering', 'motion filtering'),
+      ('root_planning', 'root planning'),
+      ('conflict_checks', 'conflict checks'),
+      ('low_level', 'low-level replanning'),
+      ('hl_other', 'other HL search'),
+      ('optimization', 'optimization'),
+    ]
+    exp_names = [e for e in exp_names if len(self.phase_times.get(e, [])) > 0]
+    if len(exp_names) == 0:
+      return
+
+    self._add_page()
+    self.fig, self.ax = plt.subplots()
+    self.ax.set_title("db-CBS time breakdown")
+    cmap = get_cmap("tab10")
+    bottom = np.zeros(len(exp_names))
+    for k, (phase, name) in enumerate(phases):
+      means = []
+      for exp_name in exp_names:
+        times = []
+        for t in self.phase_times[exp_name]:
+          if phase == 'hl_other':
+            times.append(t.get('hl_search', 0) - t.get('conflict_checks', 0) - t.get('low_level', 0))
+          else:
+            times.append(t.get(phase, 0))
+        means.append(np.mean(times))
+      self.ax.bar(range(len(exp_names)), means, bottom=bottom, label=name, color=cmap.colors[k])
+      bottom += np.array(means)
+    self.ax.set_xticks(range(len(exp_names)))
+    self.ax.set_xticklabels([e.replace("_", r"\_") for e in exp_names], rotation=45, ha='right')
+    self.ax.set_ylabel("Mean time [s]")
+    self.ax.legend(fontsize='small')
+
   def close(self):
     self._add_page()
     self.pp.close()
@@ -286,11 +332,18 @@ class Report:
       self.fig = None
 
 
-def load_data(filename, T, dt):
+def load_data(filename, T, dt, store=None):
+  costs = np.zeros(int(T / dt)) * np.nan
+  if store is not None:
+    times, solution_costs = store.times_and_costs(filename)
+    for t, cost in zip(times, solution_costs):
+      idx = int(t / dt)
+      costs[idx:] = cost
+    return costs
+
   with open(filename) as f:
     stats = yaml.safe_load(f)
 
-  costs = np.zeros(int(T / dt)) * np.nan
   if stats is not None and "stats" in stats and stats["stats"] is not None:
     for d in stats["stats"]:
         idx = int(d["t"] / dt)
@@ -298,6 +351,18 @@ def load_data(filename, T, dt):
   return costs
 
 
+def load_phase_times(filename, store=None):
+  """time per phase of a db-cbs run (None if it has none)"""
+  if store is not None:
+    stats = store.load(filename)
+  else:
+    with open(filename) as f:
+      stats = yaml.safe_load(f)
+  if stats is None or stats.get("dbcbs") is None:
+    return None
+  return stats["dbcbs"].get("time")
+
+
 def main():
   parser = argparse.ArgumentParser()
   parser.add_argument("stats", nargs='*', help="yaml files with stats")
@@ -0,0 +1,121 @@
+import json
+import threading
+import time
+
+
+def summarize(events):
+	"""Condenses the progress events of a db-cbs run (see src/instrumentation.hpp)
+	into a dict for stats.yaml: one entry per delta iteration, and the times
+	of the first discrete solution and of the optimization"""
+	summary = {"events": len(events), "iterations": []}
+	for e in events:
+		kind = e["event"]
+		iterations = summary["iterations"]
+		if kind == "delta_iteration":
+			if iterations:
+				iterations[-1]["t_end"] = e["t"]
+			iterations.append({"t_start": e["t"], "delta": e["delta"], "motions": int(e["motions"]), "hl_expansions": 0})
+		elif kind == "heuristic":
+			summary["t_heuristic"] = e["t"]
+		elif not iterations:
+			continue
+		elif kind == "root_node":
+			iterations[-1]["root_cost"] = e["cost"]
+		elif kind == "hl_expansions":
+			iterations[-1]["hl_expansions"] = int(e["expands"])
+			iterations[-1]["open"] = int(e["open"])
+			if "rss" in e:
+				iterations[-1]["rss"] = e["rss"]
+		elif kind == "discrete_solution":
+			iterations[-1]["hl_expansions"] = int(e["expands"])
+			iterations[-1]["discrete_cost"] = e["cost"]
+			iterations[-1]["t_discrete"] = e["t"]
+			summary.setdefault("t_first_discrete", e["t"])
+		elif kind == "optimization_start":
+			summary.setdefault("t_first_optimization", e["t"])
+		elif kind == "optimization_end":
+			iterations[-1]["optimization_time"] = e["t"] - iterations[-1]["t_discrete"]
+			iterations[-1]["feasible"] = bool(e["feasible"])
+	if summary["iterations"] and events:
+		summary["iterations"][-1].setdefault("t_end", events[-1]["t"])
+	return summary
+
+def _cost(cost):
+	# non-finite costs are logged as null
+	return "inf" if cost is None else "{:.2f}".format(cost)
+
+def describe(e):
+	"""One line for the live view"""
+	kind = e["event"]
+	if kind == "delta_iteration":
+		return "delta={:.3f} motions={}".format(e["delta"], int(e["motions"]))
+	if kind == "root_node":
+		return "root cost {}".format(_cost(e["cost"]))
+	if kind == "hl_expansions":
+		return "HL expanded {} open {} cost {}".format(int(e["expands"]), int(e["open"]), _cost(e["cost"]))
+	if kind == "discrete_solution":
+		return "discrete solution cost {}".format(_cost(e["cost"]))
+	if kind == "optimization_end":
+		return "optimization {}".format("feasible" if e["feasible"] else "infeasible")
+	return kind
+
+class ProgressTail(threading.Thread):
+	"""Follows a progress event log while the solver is writing it.
+
+	Complete lines are parsed as they appear; a partially written last line is
+	kept until the rest of it arrives. If label is given, the main events are
+	printed as they arrive, as a live view of the run.
+	"""
+	def __init__(self, filename, label=None, interval=0.2):
+		super().__init__(daemon=True)
+		self.filename = filename
+		self.label = label
+		self.interval = interval
+		self.events = []
+		self._stop_event = threading.Event()
+
+	def run(self):
+		f = None
+		partial = ""
+		while True:
+			stopping = self._stop_event.is_set()
+			if f is None:
+				try:
+					f = open(self.filename)
+				except FileNotFoundError:
+					if stopping:
+						return
+					time.sleep(self.interval)
+					continue
+			chunk = f.read()
+			if chunk:
+				lines = (partial + chunk).split("\n")
+				partial = lines.pop()
+				for line in lines:
+					if not line.strip():
+						continue
+					try:
+						e = json.loads(line)
+					except ValueError:
+						print("Skipping invalid line in {}: {}".format(self.filename, line))
+						continue
+					self._handle(e)
+			elif stopping:
+				# a killed solver may leave a truncated last line behind
+				break
+			else:
+				time.sleep(self.interval)
+		f.close()
+
+	def _handle(self, e):
+		self.events.append(e)
+		if self.label is not None and e["event"] not in ("optimization_start", "heuristic", "root_low_level"):
+			print("[{}] {:7.1f} s {}".format(self.label, e["t"], describe(e)), flush=True)
+
+	def stop(self):
+		"""Reads what is left in the log and stops following it"""
+		self._stop_event.set()
+		self.join()
+
+	def summary(self):
+		return summarize(list(self.events))
@@ -0,0 +1,105 @@
+import contextvars
+import os
+import signal
+from dataclasses import dataclass
+
+
+@dataclass
+class ProcessResult:
+	returncode: int
+	timed_out: bool
+	resources: dict
+	# None on success, otherwise one of timeout, cpu_limit, memory_limit, oom, crash
+	failure: str = None
+
+# isolation settings of this (worker) process, applied to every solver subprocess
+_isolation = None
+# cpus of the solvers started from the current asyncio task (overrides the cpus of _isolation)
+_cpus = contextvars.ContextVar("cpus", default=None)
+
+# what a solver writes when an allocation fails with ENOMEM (e.g. at RLIMIT_AS)
+_out_of_memory = ["bad_alloc", "MemoryError", "Cannot allocate memory", "ENOMEM"]
+
+def physical_cores():
+	"""Logical CPUs (that we may run on) grouped by physical core, e.g. [[0, 8], [1, 9], ...]"""
+	cores = dict()
+	for cpu in sorted(os.sched_getaffinity(0)):
+		topology = "/sys/devices/system/cpu/cpu{}/topology/".format(cpu)
+		try:
+			with open(topology + "physical_package_id") as f:
+				package = int(f.read())
+			with open(topology + "core_id") as f:
+				core = int(f.read())
+		except OSError:
+			package, core = 0, cpu
+		cores.setdefault((package, core), []).append(cpu)
+	return [cores[k] for k in sorted(cores, key=lambda k: cores[k][0])]
+
+def configure_isolation(cpus=None, memory_limit=None, cpu_limit=None):
+	"""Pins solver subprocesses started from this process to cpus and caps their
+	address space (bytes) and CPU time (s)"""
+	global _isolation
+	_isolation = {"cpus": cpus, "memory_limit": memory_limit, "cpu_limit": cpu_limit}
+
+def use_cpus(cpus):
+	"""Pins the solvers started from the current asyncio task (or thread) to cpus,
+	so that concurrent runs of one process can be isolated from each other"""
+	_cpus.set(cpus)
+
+def isolation():
+	"""Isolation settings for a solver started now (None without isolation)"""
+	if _isolation is None:
+		return None
+	settings = dict(_isolation)
+	if _cpus.get() is not None:
+		settings["cpus"] = _cpus.get()
+	return settings
+
+def isolated_command(cmd, settings):
+	"""cmd started through taskset and prlimit (util-linux), which apply the
+	settings before they exec the solver. Unlike a preexec_fn, this is safe in
+	a multithreaded caller."""
+	prefix = []
+	if settings["cpus"] is not None:
+		prefix += ["taskset", "--cpu-list", ",".join(str(cpu) for cpu in settings["cpus"])]
+	limits = []
+	if settings["memory_limit"] is not None:
+		limits.append("--as={}".format(int(settings["memory_limit"])))
+	if settings["cpu_limit"] is not None:
+		# SIGXCPU at the soft limit, SIGKILL at the hard limit
+		cpu_limit = int(settings["cpu_limit"])
+		limits.append("--cpu={}:{}".format(cpu_limit, cpu_limit + 5))
+	if limits:
+		prefix += ["prlimit"] + limits + ["--"]
+	return prefix + list(cmd)
+
+def classify_failure(returncode, timed_out, resources, log_tail=""):
+	if returncode == 0:
+		return None
+	if timed_out:
+		return "timeout"
+	limits = _isolation or {}
+	if limits.get("cpu_limit") is not None and (returncode == -signal.SIGXCPU or
+			resources["cpu_user"] + resources["cpu_system"] >= limits["cpu_limit"]):
+		return "cpu_limit"
+	# at RLIMIT_AS, allocations fail (ENOMEM) rather than the process being
+	# killed; the solver then aborts with e.g. std::bad_alloc
+	if limits.get("memory_limit") is not None and any(marker in log_tail for marker in _out_of_memory):
+		return "memory_limit"
+	if returncode == -signal.SIGKILL:
+		# we did not kill it, so most likely the kernel's OOM killer did
+		return "oom"
+	return "crash"
+
+def write_resources(filename_stats, result):
+	"""Appends the resource usage (and failure class, if any) of a ProcessResult
+	as top-level entries to a stats.yaml"""
+	exists = os.path.exists(filename_stats)
+	with open(filename_stats, 'a') as stats:
+		if not exists:
+			stats.write("stats:\n")
+		if result.failure is not None:
+			stats.write("failure: {}\n".format(result.failure))
+		stats.write("resources:\n")
+		for k, v in result.resources.items():
+			stats.write("  {}: {}\n".format(k, v))
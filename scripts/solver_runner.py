@@ -0,0 +1,147 @@
+import asyncio
+import collections
+import os
+import signal
+import subprocess
+import threading
+import time
+import psutil
+import resource_monitor
+from resource_monitor import ProcessResult
+
+# One way to run the solver executables (db_cbs, main_ompl, main_kcbs, s2m2):
+# every run gets its own process group, which is killed as a whole on the
+# deadline (and once the solver exits, so that no children linger), its output
+# is streamed into the log file while it runs, and the result is a
+# resource_monitor.ProcessResult.
+#
+# The runs are asyncio tasks, so one process can drive many of them at once:
+#   asyncio.run(asyncio.gather(*[run_async(cmd, log, timeout) for ...]))
+
+def deadline(timelimit):
+	"""Wall time after which a solver with its own time limit is killed"""
+	return 1.1 * timelimit + 10
+
+def _sample(ps, usage):
+	"""Adds the current RSS of the process tree to usage"""
+	rss = 0
+	if ps is None:
+		return
+	try:
+		procs = [ps] + ps.children(recursive=True)
+	except psutil.Error:
+		return
+	for p in procs:
+		try:
+			rss += p.memory_info().rss
+		except psutil.Error:
+			pass
+	usage["peak_rss"] = max(usage["peak_rss"], rss)
+
+def _reap(pid):
+	"""Future with the (status, rusage) of pid once it exits. wait4 blocks, so it
+	runs in a thread of its own (a shared executor would limit the number of
+	concurrent runs)."""
+	loop = asyncio.get_running_loop()
+	future = loop.create_future()
+	def wait():
+		_, status, rusage = os.wait4(pid, 0)
+		loop.call_soon_threadsafe(future.set_result, (status, rusage))
+	threading.Thread(target=wait, daemon=True).start()
+	return future
+
+async def _stream(reader, log, tail, on_line):
+	while True:
+		line = await reader.readline()
+		if not line:
+			break
+		if log is not None:
+			log.write(line)
+		tail.append(line)
+		if on_line is not None:
+			on_line(line.decode(errors="replace"))
+
+def _kill_group(pgid):
+	try:
+		os.killpg(pgid, signal.SIGKILL)
+	except (ProcessLookupError, PermissionError):
+		pass
+
+async def run_async(cmd, log=None, timeout=None, interval=0.5, on_line=None, cwd=None):
+	"""Runs cmd, writing its stdout and stderr to the file log (if given) and
+	passing each line to on_line. The process group is killed after timeout
+	seconds.
+
+	The peak RSS is sampled every interval seconds over the whole process tree
+	(so it includes e.g. the python subprocess of s2m2); CPU times and context
+	switches are the exact totals the kernel reports when the process is reaped.
+	"""
+	start = time.time()
+	cmd = [str(c) for c in cmd]
+	isolation = resource_monitor.isolation()
+	if isolation is not None:
+		cmd = resource_monitor.isolated_command(cmd, isolation)
+	proc = subprocess.Popen(cmd,
+		stdout=subprocess.PIPE, stderr=subprocess.STDOUT, cwd=cwd,
+		start_new_session=True)
+	# with start_new_session, the group id is the pid
+	pgid = proc.pid
+	# before the reaper runs, so that the pid cannot be reused yet (an exited
+	# but unreaped child stays a zombie)
+	try:
+		ps = psutil.Process(proc.pid)
+	except psutil.Error:
+		ps = None
+	exited = _reap(proc.pid)
+	usage = {"peak_rss": 0}
+	tail = collections.deque(maxlen=50)
+
+	loop = asyncio.get_running_loop()
+	reader = asyncio.StreamReader()
+	transport, _ = await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), proc.stdout)
+	logfile = open(log, 'wb') if log is not None else None
+	try:
+		streaming = asyncio.create_task(_stream(reader, logfile, tail, on_line))
+		timed_out = False
+		while True:
+			_sample(ps, usage)
+			remaining = None if timeout is None else timeout - (time.time() - start)
+			if remaining is not None and remaining <= 0:
+				timed_out = True
+				_kill_group(pgid)
+				break
+			try:
+				await asyncio.wait_for(asyncio.shield(exited), interval if remaining is None else min(interval, remaining))
+				break
+			except asyncio.TimeoutError:
+				pass
+		status, rusage = await exited
+		# children that outlive the solver would keep the pipe open
+		_kill_group(pgid)
+		await streaming
+	finally:
+		if not exited.done():
+			_kill_group(pgid)
+			await exited
+		transport.close()
+		if logfile is not None:
+			logfile.close()
+	# already reaped by wait4, make sure Popen does not try again
+	proc.returncode = os.waitstatus_to_exitcode(status)
+
+	resources = {
+		"wall_time": time.time() - start,
+		# in MiB (ru_maxrss is in kB on Linux)
+		"peak_rss": max(usage["peak_rss"], rusage.ru_maxrss * 1024) / 1024**2,
+		"cpu_user": rusage.ru_utime,
+		"cpu_system": rusage.ru_stime,
+		"ctx_switches_voluntary": rusage.ru_nvcsw,
+		"ctx_switches_involuntary": rusage.ru_nivcsw,
+	}
+	log_tail = b"".join(tail).decode(errors="replace") if proc.returncode != 0 else ""
+	failure = resource_monitor.classify_failure(proc.returncode, timed_out, resources, log_tail)
+	return ProcessResult(proc.returncode, timed_out, resources, failure)
+
+def run(cmd, log=None, timeout=None, interval=0.5, on_line=None, cwd=None):
+	"""run_async for callers without an event loop"""
+	return asyncio.run(run_async(cmd, log, timeout, interval, on_line, cwd))
@@ -0,0 +1,119 @@
+import json
+import re
+import sqlite3
+from contextlib import closing
+from pathlib import Path
+import numpy as np
+import yaml
+
+try:
+	from yaml import CSafeLoader as SafeLoader
+except ImportError:
+	from yaml import SafeLoader
+
+
+def _pattern_to_regex(pattern):
+	"""glob pattern (with **, * and ?) relative to the results folder -> regex"""
+	out = ""
+	for segment in pattern.split("/"):
+		if segment == "**":
+			# zero or more folders
+			out += "(?:[^/]+/)*"
+		else:
+			out += "".join("[^/]*" if c == "*" else "[^/]" if c == "?" else re.escape(c) for c in segment) + "/"
+	return re.compile(out.rstrip("/") + "$")
+
+class StatsStore:
+	"""All results/**/stats.yaml files, parsed once into an SQLite database.
+
+	Files are re-parsed only if their mtime or size changed since the last
+	ingest. The solution time and cost series are kept as columns of one
+	table; everything else in a stats file (resources, failure, ...) is kept
+	as JSON.
+	"""
+	def __init__(self, results_path, filename=None):
+		self.results_path = Path(results_path)
+		self.filename = Path(filename) if filename is not None else self.results_path / "stats.sqlite"
+		self.files = dict()
+		self.series = dict()
+		with closing(sqlite3.connect(self.filename)) as con:
+			con.execute("CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, mtime_ns INTEGER, size INTEGER, has_stats INTEGER, extra TEXT)")
+			con.execute("CREATE TABLE IF NOT EXISTS samples (path TEXT, k INTEGER, t REAL, cost REAL)")
+			con.execute("CREATE INDEX IF NOT EXISTS samples_path ON samples (path)")
+			con.commit()
+
+	def ingest(self):
+		"""Synchronizes the store with the stats files on disk; returns the number of parsed files"""
+		found = dict()
+		for p in self.results_path.glob("**/stats.yaml"):
+			st = p.stat()
+			found[p.relative_to(self.results_path).as_posix()] = (st.st_mtime_ns, st.st_size)
+
+		with closing(sqlite3.connect(self.filename)) as con:
+			known = {path: (mtime_ns, size) for path, mtime_ns, size in con.execute("SELECT path, mtime_ns, size FROM files")}
+			removed = [(path,) for path in known if path not in found]
+			changed = [path for path, v in found.items() if known.get(path) != v]
+			con.executemany("DELETE FROM files WHERE path = ?", removed + [(path,) for path in changed])
+			con.executemany("DELETE FROM samples WHERE path = ?", removed + [(path,) for path in changed])
+			for path in changed:
+				with open(self.results_path / path) as f:
+					stats = yaml.load(f, Loader=SafeLoader)
+				if stats is None:
+					stats = dict()
+				samples = stats.pop("stats", None)
+				con.execute("INSERT INTO files VALUES (?, ?, ?, ?, ?)",
+					(path, *found[path], samples is not None, json.dumps(stats)))
+				if samples is not None:
+					con.executemany("INSERT INTO samples VALUES (?, ?, ?, ?)",
+						[(path, k, d["t"], d["cost"]) for k, d in enumerate(samples)])
+			con.commit()
+
+			# the whole store is small, so keep it in memory for the queries
+			self.files = {path: (bool(has_stats), json.loads(extra)) for path, has_stats, extra in con.execute("SELECT path, has_stats, extra FROM files")}
+			rows = con.execute("SELECT path, t, cost FROM samples ORDER BY path, k").fetchall()
+		self.series = dict()
+		for path, t, cost in rows:
+			self.series.setdefault(path, ([], []))
+			self.series[path][0].append(t)
+			self.series[path][1].append(cost)
+		self.series = {path: (np.array(t), np.array(c)) for path, (t, c) in self.series.items()}
+		return len(changed)
+
+	def _key(self, filename):
+		return Path(filename).relative_to(self.results_path).as_posix()
+
+	def glob(self, pattern):
+		"""Stats files matching a glob pattern relative to the results folder,
+		as paths like pathlib's results_path.glob would return them"""
+		regex = _pattern_to_regex(pattern)
+		return sorted(self.results_path / path for path in self.files if regex.match(path))
+
+	def load(self, filename):
+		"""The content of a stats file, as yaml.safe_load would return it (None if it does not exist)"""
+		key = self._key(filename)
+		if key not in self.files:
+			return None
+		has_stats, extra = self.files[key]
+		stats = None
+		if has_stats:
+			t, cost = self.series.get(key, ([], []))
+			stats = [{"t": float(ti), "cost": float(ci)} for ti, ci in zip(t, cost)]
+		return {"stats": stats, **extra}
+
+	def times_and_costs(self, filename):
+		"""Solution times and costs of a stats file as numpy arrays"""
+		key = self._key(filename)
+		return self.series.get(key, (np.zeros(0), np.zeros(0)))
+
+_stores = dict()
+
+def open_store(results_path, filename=None):
+	"""The (ingested) store of a results folder, shared within this process.
+	The database is results_path/stats.sqlite unless filename is given (e.g.
+	for a results folder that must not be written to)."""
+	key = Path(results_path).resolve()
+	if key not in _stores:
+		store = StatsStore(results_path, filename)
+		print("Parsed {} new or changed stats files".format(store.ingest()))
+		_stores[key] = store
+	return _stores[key]
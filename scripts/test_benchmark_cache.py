@@ -0,0 +1,98 @@
+import tempfile
+import unittest
+from dataclasses import dataclass
+from pathlib import Path
+
+import benchmark
+import benchmark_cache
+
+
+@dataclass
+class Task:
+	instance: str
+	alg: str
+	trial: int
+	timelimit: float
+
+
+class TestCache(unittest.TestCase):
+
+	def setUp(self):
+		self.tmp = tempfile.TemporaryDirectory()
+		self.path = Path(self.tmp.name)
+		self.env = self.path / "env.yaml"
+		self.env.write_text("robots: []\n")
+		self.solver = self.path / "db_cbs"
+		self.solver.write_bytes(b"solver v1")
+		self.motions = self.path / "motions.msgpack"
+		self.motions.write_bytes(b"motions v1")
+		self.task = Task("swap2_unicycle", "db-cbs", 0, 300)
+		self.cfg = {"delta_0": 0.5}
+
+	def tearDown(self):
+		self.tmp.cleanup()
+
+	def key(self, task=None, cfg=None):
+		return benchmark_cache.task_key(task or self.task, self.env, cfg or self.cfg, self.solver, [self.motions])
+
+	def test_key_is_stable(self):
+		self.assertEqual(self.key(), self.key())
+
+	def test_key_changes_with_inputs(self):
+		key = self.key()
+		self.assertNotEqual(self.key(cfg={"delta_0": 0.4}), key)
+		self.assertNotEqual(self.key(task=Task("swap2_unicycle", "db-cbs", 1, 300)), key)
+		self.assertNotEqual(self.key(task=Task("swap2_unicycle", "db-cbs", 0, 60)), key)
+
+		# hashes are memoized on mtime and size, which may not tick between writes
+		self.solver.write_bytes(b"solver v2.0")
+		key_solver = self.key()
+		self.assertNotEqual(key_solver, key)
+		self.motions.write_bytes(b"motions v2.0")
+		key_motions = self.key()
+		self.assertNotEqual(key_motions, key_solver)
+		self.env.write_text("robots: [] \n")
+		self.assertNotEqual(self.key(), key_motions)
+
+	def test_manifest(self):
+		folder = self.path / "result"
+		folder.mkdir()
+		key = self.key()
+		self.assertFalse(benchmark_cache.is_complete(folder, key))
+		benchmark_cache.write_manifest(folder, key, duration=12.5)
+		self.assertTrue(benchmark_cache.is_complete(folder, key))
+
+		self.solver.write_bytes(b"solver v2.0")
+		self.assertFalse(benchmark_cache.is_complete(folder, self.key()))
+
+
+class TestFinishTask(unittest.TestCase):
+
+	def setUp(self):
+		self.tmp = tempfile.TemporaryDirectory()
+		self.folder = Path(self.tmp.name)
+		self.task = benchmark.ExecutionTask("swap2_unicycle", "db-cbs", 0, 300, key="abc")
+
+	def tearDown(self):
+		self.tmp.cleanup()
+
+	def result(self, checks_passed):
+		return benchmark.SolveResult(self.task, Path("env.yaml"), self.folder, [], [], 1.5, checks_passed)
+
+	def test_manifest_after_checks(self):
+		benchmark.finish_task(self.task, self.result(True))
+		self.assertTrue(benchmark_cache.is_complete(self.folder, "abc"))
+
+	def test_no_manifest_after_failed_check(self):
+		# its stats were deleted, so it must run again
+		benchmark.finish_task(self.task, self.result(False))
+		self.assertFalse(benchmark_cache.is_complete(self.folder, "abc"))
+
+	def test_forced(self):
+		tasks = [benchmark.ExecutionTask("a", "sst", k, 300) for k in range(3)]
+		self.assertFalse(any(task.force for task in tasks))
+		self.assertTrue(all(task.force for task in benchmark.forced(iter(tasks))))
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,42 @@
+import os
+import unittest
+
+from benchmark_pipeline import Stage, run_pipeline
+
+
+def double(x):
+	return 2 * x
+
+def fail_odd(x):
+	if x % 2:
+		raise ValueError(x)
+	return x
+
+def die_on_three(x):
+	if x == 3:
+		# like the OOM killer, no chance to forward the item
+		os._exit(9)
+	return x
+
+
+class TestPipeline(unittest.TestCase):
+
+	def test_results(self):
+		results = {}
+		run_pipeline(range(10), [Stage(double, 2, queue_size=1), Stage(fail_odd, 1)],
+			lambda item, result: results.__setitem__(item, result))
+		self.assertEqual(results, {k: 2 * k for k in range(10)})
+
+	def test_failed_items(self):
+		results = {}
+		run_pipeline(range(6), [Stage(fail_odd, 2), Stage(double, 1)],
+			lambda item, result: results.__setitem__(item, result))
+		self.assertEqual(results, {k: None if k % 2 else 2 * k for k in range(6)})
+
+	def test_dead_worker(self):
+		with self.assertRaises(RuntimeError):
+			run_pipeline(range(6), [Stage(die_on_three, 2), Stage(double, 1)])
+
+
+if __name__ == '__main__':
+	unittest.main()
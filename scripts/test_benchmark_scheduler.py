@@ -0,0 +1,77 @@
+import tempfile
+import unittest
+from dataclasses import dataclass
+from pathlib import Path
+import yaml
+
+import benchmark_cache
+import benchmark_scheduler
+
+
+@dataclass
+class Task:
+	instance: str
+	alg: str
+	trial: int
+	timelimit: float
+
+
+class TestScheduler(unittest.TestCase):
+
+	def setUp(self):
+		self.tmp = tempfile.TemporaryDirectory()
+		self.results = Path(self.tmp.name)
+
+	def tearDown(self):
+		self.tmp.cleanup()
+
+	def folder_of(self, task):
+		return self.results / task.instance / task.alg / "{:03d}".format(task.trial)
+
+	def write_manifest(self, task, duration):
+		folder = self.folder_of(task)
+		folder.mkdir(parents=True)
+		benchmark_cache.write_manifest(folder, "key", duration=duration)
+
+	def write_stats(self, task, stats):
+		folder = self.folder_of(task)
+		folder.mkdir(parents=True)
+		with open(folder / "stats.yaml", 'w') as f:
+			yaml.safe_dump({"stats": stats}, f)
+
+	def test_predictions(self):
+		a0 = Task("a", "db-cbs", 0, 300)
+		a1 = Task("a", "db-cbs", 1, 300)
+		b0 = Task("b", "db-cbs", 0, 300)
+		c0 = Task("c", "sst", 0, 300)
+		d0 = Task("d", "sst", 0, 100)
+		self.write_manifest(a0, 20.0)
+		# the runtime db_cbs reports, not the time of the last solution
+		self.write_stats(b0, [{"t": 1.0, "cost": 5.0}, {"t": 2.0, "cost": 4.0, "duration_dbcbs": 7.5}])
+		self.write_stats(c0, [{"t": 3.0, "cost": 5.0}])
+		# capped at the timelimit
+		self.write_manifest(d0, 500.0)
+
+		predictions = benchmark_scheduler.predict_durations([a0, a1, b0, c0, d0], self.folder_of)
+		# a1 has no history of its own, so it gets the mean over the other trials
+		self.assertEqual(predictions, [20.0, 20.0, 7.5, 3.0, 100.0])
+
+		# without any history, the timelimit
+		self.assertEqual(benchmark_scheduler.predict_durations([Task("e", "sst", 0, 42)], self.folder_of), [42])
+
+	def test_longest_first(self):
+		tasks = [Task(name, "sst", 0, 300) for name in "abcde"]
+		ordered, predictions = benchmark_scheduler.schedule(tasks, [3, 10, 1, 7, 5])
+		self.assertEqual([t.instance for t in ordered], ["b", "d", "e", "a", "c"])
+		self.assertEqual(predictions, [10, 7, 5, 3, 1])
+
+	def test_makespan(self):
+		# LPT: 7 | 6 | 5 -> 7 | 6 + 2 | 5 + 4 = 9
+		self.assertEqual(benchmark_scheduler.makespan([7, 6, 5, 4, 2], 3), 9)
+		# with the long tasks last: 2 + 6 | 4 + 7 | 5 = 11
+		self.assertEqual(benchmark_scheduler.makespan([2, 4, 5, 6, 7], 3), 11)
+		self.assertEqual(benchmark_scheduler.makespan([3, 3], 1), 6)
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,106 @@
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+import msgpack
+import yaml
+
+# run from the build folder, like the other scripts:
+#   python3 -m pytest ../scripts/test_incremental_dbastar.py
+sys.path.append(os.getcwd())
+
+try:
+	from motionplanningutils import IncrementalDBAstar
+except ImportError:
+	IncrementalDBAstar = None
+
+ENV = Path("../example/swap1_unicycle.yaml")
+MOTIONS = Path("../motions/unicycle_first_order_0_sorted.msgpack")
+
+CFG = {
+	"desired_branching_factor": 2,
+	"suboptimality_bound": 1.0,
+	"alpha": 0.5,
+	"filter_duplicates": True,
+}
+
+
+@unittest.skipIf(IncrementalDBAstar is None, "python bindings not built (BUILD_PYTHON_BINDINGS)")
+@unittest.skipUnless(Path("./dbastar").is_file() and ENV.is_file() and MOTIONS.is_file(), "needs ./dbastar and the unicycle motions")
+class TestIncrementalDBAstar(unittest.TestCase):
+	"""The in-memory search must find the same solution as ./dbastar with the
+	same primitives and delta, also after primitives were added to a previous
+	search (delta is chosen once, on the first batch of primitives)"""
+
+	@classmethod
+	def setUpClass(cls):
+		with open(MOTIONS, 'rb') as f:
+			cls.motions = msgpack.unpack(f)
+
+	def run_dbastar(self, motions, delta):
+		with tempfile.TemporaryDirectory() as tmpdirname:
+			p = Path(tmpdirname)
+			with open(p / "motions.msgpack", 'wb') as f:
+				msgpack.pack(motions, f)
+			result = subprocess.run(["./dbastar",
+				"-i", ENV,
+				"-m", p / "motions.msgpack",
+				"-o", p / "result_dbastar.yaml",
+				"--delta", str(delta),
+				"--epsilon", str(CFG["suboptimality_bound"]),
+				"--alpha", str(CFG["alpha"]),
+				"--filterDuplicates", str(CFG["filter_duplicates"])],
+				stdout=subprocess.DEVNULL)
+			if result.returncode != 0:
+				return None
+			with open(p / "result_dbastar.yaml") as f:
+				return yaml.safe_load(f)
+
+	def planner(self):
+		return IncrementalDBAstar(str(ENV),
+			delta=-CFG["desired_branching_factor"],
+			epsilon=CFG["suboptimality_bound"],
+			alpha=CFG["alpha"],
+			filter_duplicates=CFG["filter_duplicates"])
+
+	def assertSameResult(self, expected, result):
+		if expected is None:
+			self.assertIsNone(result)
+			return
+		self.assertIsNotNone(result)
+		# solutions of equal cost may differ in how ties were broken
+		self.assertAlmostEqual(result["cost"], expected["cost"], places=4)
+		self.assertEqual(result["states"].shape[0], len(expected["result"][0]["states"]))
+
+	def test_grow(self):
+		planner = self.planner()
+		num_motions = 0
+		for n in [100, 200, 400]:
+			planner.add_motions(self.motions[num_motions:n])
+			num_motions = n
+			with self.subTest(motions=n):
+				self.assertSameResult(self.run_dbastar(self.motions[:n], planner.delta), planner.search())
+
+	def test_fresh(self):
+		planner = self.planner()
+		planner.add_motions(self.motions[:400])
+		self.assertSameResult(self.run_dbastar(self.motions[:400], planner.delta), planner.search())
+
+	def test_max_cost(self):
+		planner = self.planner()
+		planner.add_motions(self.motions[:400])
+		result = planner.search()
+		self.assertIsNotNone(result)
+		# the goal node stays in open, so without a lower bound it is found again
+		self.assertAlmostEqual(planner.search()["cost"], result["cost"], places=4)
+		planner.max_cost = result["cost"] - 1e-3
+		self.assertIsNone(planner.search())
+		# the bound is never raised again
+		planner.max_cost = 1e6
+		self.assertAlmostEqual(planner.max_cost, result["cost"] - 1e-3, places=4)
+
+
+if __name__ == '__main__':
+	unittest.main()
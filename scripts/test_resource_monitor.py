@@ -0,0 +1,101 @@
+import os
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+import yaml
+
+import resource_monitor
+import solver_runner
+
+# burns about 0.3 s of CPU time and touches 200 MiB, then exits
+BUSY = """
+import time
+data = bytearray(200 * 1024**2)
+for i in range(0, len(data), 4096):
+	data[i] = 1
+start = time.process_time()
+while time.process_time() - start < 0.3:
+	pass
+"""
+
+
+class TestResources(unittest.TestCase):
+
+	def setUp(self):
+		self.tmp = tempfile.TemporaryDirectory()
+		self.path = Path(self.tmp.name)
+
+	def tearDown(self):
+		self.tmp.cleanup()
+
+	def test_short_run(self):
+		# shorter than the sampling interval, so the CPU time must come from the kernel
+		result = solver_runner.run([sys.executable, "-c", BUSY], timeout=60, interval=5)
+		self.assertEqual(result.returncode, 0)
+		self.assertIsNone(result.failure)
+		r = result.resources
+		self.assertGreater(r["cpu_user"] + r["cpu_system"], 0.25)
+		self.assertGreater(r["peak_rss"], 200)
+		self.assertGreater(r["ctx_switches_voluntary"] + r["ctx_switches_involuntary"], 0)
+		self.assertGreaterEqual(r["wall_time"], r["cpu_user"])
+
+	def test_timeout(self):
+		result = solver_runner.run([sys.executable, "-c", "import time; time.sleep(60)"], timeout=0.5)
+		self.assertTrue(result.timed_out)
+		self.assertEqual(result.failure, "timeout")
+		self.assertLess(result.resources["wall_time"], 30)
+
+	def test_write_resources(self):
+		filename_stats = self.path / "stats.yaml"
+		with open(filename_stats, 'w') as f:
+			f.write("stats:\n  - t: 1.5\n    cost: 10.0\n")
+		result = solver_runner.run([sys.executable, "-c", "import sys; sys.exit(3)"])
+		self.assertEqual(result.failure, "crash")
+		resource_monitor.write_resources(filename_stats, result)
+
+		with open(filename_stats) as f:
+			stats = yaml.safe_load(f)
+		self.assertEqual(stats["stats"], [{"t": 1.5, "cost": 10.0}])
+		self.assertEqual(stats["failure"], "crash")
+		self.assertEqual(stats["resources"], result.resources)
+
+	def test_isolation(self):
+		cpu = min(os.sched_getaffinity(0))
+		resource_monitor.configure_isolation([cpu], 300 * 1024**2, 100)
+		try:
+			log = self.path / "log.txt"
+			result = solver_runner.run([sys.executable, "-c",
+				"import os, resource; print(sorted(os.sched_getaffinity(0)), resource.getrlimit(resource.RLIMIT_CPU)[0])"], log=log)
+			self.assertEqual(result.returncode, 0)
+			self.assertEqual(log.read_text().strip(), "[{}] 100".format(cpu))
+
+			result = solver_runner.run([sys.executable, "-c", "data = bytearray(1024**3)"])
+			self.assertEqual(result.failure, "memory_limit")
+		finally:
+			resource_monitor._isolation = None
+
+	def test_immediate_exit(self):
+		# the solver may be gone before its resources are first sampled
+		for _ in range(20):
+			result = solver_runner.run(["true"])
+			self.assertEqual(result.returncode, 0)
+
+	def test_classify_failure(self):
+		resources = {"cpu_user": 1.0, "cpu_system": 0.0, "peak_rss": 10}
+		self.assertIsNone(resource_monitor.classify_failure(0, False, resources))
+		self.assertEqual(resource_monitor.classify_failure(-9, True, resources), "timeout")
+		self.assertEqual(resource_monitor.classify_failure(-9, False, resources), "oom")
+		self.assertEqual(resource_monitor.classify_failure(-6, False, resources, "std::bad_alloc"), "crash")
+		resource_monitor.configure_isolation(None, 1024**3, 100)
+		try:
+			self.assertEqual(resource_monitor.classify_failure(-6, False, resources,
+				"terminate called after throwing an instance of 'std::bad_alloc'"), "memory_limit")
+			self.assertEqual(resource_monitor.classify_failure(-24, False, resources), "cpu_limit")
+			self.assertEqual(resource_monitor.classify_failure(-11, False, resources), "crash")
+		finally:
+			resource_monitor._isolation = None
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,75 @@
+import os
+import tempfile
+import unittest
+from pathlib import Path
+import numpy as np
+import yaml
+
+import stats_store
+
+
+class TestStatsStore(unittest.TestCase):
+
+	def setUp(self):
+		self.tmp = tempfile.TemporaryDirectory()
+		self.results = Path(self.tmp.name)
+
+	def tearDown(self):
+		self.tmp.cleanup()
+
+	def write(self, path, stats, bump=0):
+		filename = self.results / path / "stats.yaml"
+		filename.parent.mkdir(parents=True, exist_ok=True)
+		with open(filename, 'w') as f:
+			yaml.safe_dump(stats, f)
+		# the store detects changes by mtime and size, which may not tick between writes
+		st = filename.stat()
+		os.utime(filename, ns=(st.st_atime_ns, st.st_mtime_ns + bump))
+		return filename
+
+	def test_incremental(self):
+		a = self.write("swap2/db-cbs/000", {"stats": [{"t": 1.0, "cost": 10.0}, {"t": 2.0, "cost": 8.0}]})
+		b = self.write("swap2/db-cbs/001", {"stats": None, "failure": "timeout"})
+		store = stats_store.StatsStore(self.results)
+		self.assertEqual(store.ingest(), 2)
+		self.assertEqual(store.load(a), {"stats": [{"t": 1.0, "cost": 10.0}, {"t": 2.0, "cost": 8.0}]})
+		self.assertEqual(store.load(b), {"stats": None, "failure": "timeout"})
+
+		# nothing changed, nothing is parsed
+		self.assertEqual(store.ingest(), 0)
+
+		# a changed file is parsed again, its old samples are gone
+		self.write("swap2/db-cbs/000", {"stats": [{"t": 3.0, "cost": 9.0}], "resources": {"peak_rss": 12.5}}, bump=1000)
+		self.assertEqual(store.ingest(), 1)
+		self.assertEqual(store.load(a), {"stats": [{"t": 3.0, "cost": 9.0}], "resources": {"peak_rss": 12.5}})
+		t, cost = store.times_and_costs(a)
+		np.testing.assert_array_equal(t, [3.0])
+		np.testing.assert_array_equal(cost, [9.0])
+
+		# a deleted file (e.g. by the checker) disappears from the store
+		b.unlink()
+		self.assertEqual(store.ingest(), 0)
+		self.assertIsNone(store.load(b))
+		self.assertEqual(store.glob("swap2/db-cbs/**/stats.yaml"), [a])
+
+	def test_persistent(self):
+		a = self.write("swap2/sst/000", {"stats": [{"t": 1.0, "cost": 10.0}]})
+		self.assertEqual(stats_store.StatsStore(self.results).ingest(), 1)
+		# a new store on the same database only reads what changed since
+		store = stats_store.StatsStore(self.results)
+		self.assertEqual(store.ingest(), 0)
+		self.assertEqual(store.load(a), {"stats": [{"t": 1.0, "cost": 10.0}]})
+		self.assertTrue((self.results / "stats.sqlite").is_file())
+
+	def test_glob(self):
+		files = [self.write(path, {"stats": None}) for path in
+			["gen_p10_n2_0_hetero/db-cbs/000", "gen_p10_n2_1_hetero/db-cbs/000", "gen_p10_n4_0_hetero/db-cbs/000", "swap2/db-cbs/000"]]
+		store = stats_store.StatsStore(self.results)
+		store.ingest()
+		self.assertEqual(store.glob("gen_p10_n2_*_hetero/db-cbs/**/stats.yaml"), files[:2])
+		self.assertEqual(store.glob("*/db-cbs/000/stats.yaml"), sorted(files))
+		self.assertEqual(store.glob("swap2/sst/**/stats.yaml"), [])
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,120 @@
+import argparse
+import itertools
+import math
+import multiprocessing as mp
+import shutil
+from pathlib import Path
+import numpy as np
+import psutil
+import tqdm
+import yaml
+
+from main_dbcbs import run_dbcbs
+from benchmark import ExecutionTask, task_config
+
+# python3 ../scripts/tune_dbcbs.py "gen_p10_n4_*_hetero" --grid ../tuning/dbcbs_grid.yaml --write
+
+
+def run_config(args):
+	instance, cfg_idx, cfg, budget, folder = args
+	if folder.exists():
+		shutil.rmtree(folder)
+	folder.mkdir(parents=True)
+	env, _ = task_config(ExecutionTask(instance, "db-cbs", 0, budget))
+	run_dbcbs(str(env), str(folder), budget, cfg)
+
+	with open(folder / "stats.yaml") as f:
+		stats = yaml.safe_load(f)
+	if stats is not None and stats.get("stats"):
+		return cfg_idx, stats["stats"][0]["t"]
+	# penalize unsolved instances with twice the budget (PAR2)
+	return cfg_idx, 2 * budget
+
+def successive_halving(instances, configs, budget, eta, cpus, results_path):
+	"""Runs all surviving configs on all instances with the current budget,
+	keeps the fastest 1/eta of them and multiplies the budget by eta, until
+	a single config is left. Returns the index of the winner."""
+	alive = list(range(len(configs)))
+	r = 0
+	while len(alive) > 1:
+		print("Round {}: {} configurations, budget {:.1f} s".format(r, len(alive), budget))
+		jobs = [(instance, k, configs[k], budget, results_path / "round{}".format(r) / "cfg{}".format(k) / instance)
+			for k in alive for instance in instances]
+		scores = {k: [] for k in alive}
+		with mp.Pool(cpus) as p:
+			for k, t in tqdm.tqdm(p.imap_unordered(run_config, jobs), total=len(jobs)):
+				scores[k].append(t)
+		mean_scores = {k: np.mean(v) for k, v in scores.items()}
+		for k in sorted(alive, key=lambda k: mean_scores[k]):
+			print("  {:.2f} s: {}".format(mean_scores[k], configs[k]))
+		alive = sorted(alive, key=lambda k: mean_scores[k])[0:math.ceil(len(alive) / eta)]
+		budget *= eta
+		r += 1
+	return alive[0]
+
+def write_overrides(filename, alg, pattern, overrides):
+	"""Sets the entry for pattern in the alg section of algorithms.yaml,
+	keeping the comments and layout of the rest of the file"""
+	with open(filename) as f:
+		lines = f.read().splitlines()
+
+	block = ["  '{}':".format(pattern)]
+	for k, v in overrides.items():
+		block.append("    " + yaml.safe_dump({k: v}, default_flow_style=False).strip())
+
+	section = lines.index("{}:".format(alg))
+	end = section + 1
+	while end < len(lines) and (lines[end].startswith(" ") or lines[end].strip() == ""):
+		end += 1
+
+	keys = ["  '{}':".format(pattern), '  "{}":'.format(pattern), "  {}:".format(pattern)]
+	start = next((i for i in range(section + 1, end) if lines[i].rstrip() in keys), None)
+	if start is None:
+		lines[end:end] = block
+	else:
+		stop = start + 1
+		while stop < end and lines[stop].startswith("    "):
+			stop += 1
+		lines[start:stop] = block
+
+	with open(filename, 'w') as f:
+		f.write("\n".join(lines) + "\n")
+
+def main():
+	parser = argparse.ArgumentParser()
+	parser.add_argument("pattern", help="instance family, e.g. gen_p10_n4_*_hetero")
+	parser.add_argument("--grid", required=True, help="yaml file mapping db-cbs parameters to lists of values")
+	parser.add_argument("--budget", type=float, default=10, help="time budget per run in the first round (s)")
+	parser.add_argument("--eta", type=int, default=2, help="keep 1/eta of the configurations per round")
+	parser.add_argument("--cpus", type=int, default=psutil.cpu_count(logical=False)-1)
+	parser.add_argument("--write", action="store_true", help="write the winning overrides to algorithms.yaml")
+	args = parser.parse_args()
+
+	env_path = Path("../example")
+	instances = sorted(p.stem for p in env_path.glob(args.pattern + ".yaml"))
+	if len(instances) == 0:
+		parser.error("no instances match {}".format(args.pattern))
+	print("Tuning on {} instances".format(len(instances)))
+
+	with open(args.grid) as f:
+		grid = yaml.safe_load(f)
+	names = list(grid.keys())
+	overrides = [dict(zip(names, values)) for values in itertools.product(*[grid[n] for n in names])]
+
+	# the grid values are applied on top of the configuration the benchmark
+	# would use for the first instance
+	_, base_cfg = task_config(ExecutionTask(instances[0], "db-cbs", 0, args.budget))
+	configs = [{**base_cfg, **o} for o in overrides]
+
+	results_path = Path("../results/tuning") / args.pattern.replace("*", "X")
+	best = successive_halving(instances, configs, args.budget, args.eta, args.cpus, results_path)
+	print("Best configuration: {}".format(overrides[best]))
+
+	if args.write:
+		filename = env_path / "algorithms.yaml"
+		write_overrides(filename, "db-cbs", args.pattern, overrides[best])
+		print("Updated {}".format(filename))
+
+
+if __name__ == '__main__':
+	main()
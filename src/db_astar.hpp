@@ -1,7 +1,14 @@
+#pragma once
+
 #include <fstream>
 #include <iostream>
 #include <algorithm>
+#include <array>
 #include <chrono>
+#include <cstring>
+#include <deque>
+#include <memory>
+#include <mutex>
 
 #include <yaml-cpp/yaml.h>
 #include <msgpack.hpp>
@@ -18,6 +25,7 @@
 #include <ompl/datastructures/NearestNeighbors.h>
 #include <ompl/datastructures/NearestNeighborsSqrtApprox.h>
 #include <ompl/datastructures/NearestNeighborsGNATNoThreadSafety.h>
+#include <ompl/datastructures/NearestNeighborsGNAT.h>
 
 #include "robots.h"
 #include "robotStatePropagator.hpp"
@@ -97,8 +105,10 @@ public:
   // Last state translated to origin (to support reverse search)
   ob::State* last_state_translated;
 
-  std::shared_ptr<ShiftableDynamicAABBTreeCollisionManager<float>> collision_manager;
-  std::vector<fcl::CollisionObjectf *> collision_objects;
+  // built on first use (see add_collision_manager), as most motions of a
+  // library are never checked for collisions
+  mutable std::shared_ptr<ShiftableDynamicAABBTreeCollisionManager<float>> collision_manager;
+  mutable std::vector<fcl::CollisionObjectf *> collision_objects;
 
   // AABB for this motion to support efficient out-of-bounds detection
   fcl::AABBf aabb;
@@ -109,6 +119,14 @@ public:
   bool disabled;
 };
 
+// Checking a motion for collisions shifts its collision objects, so concurrent
+// searches on the same motions hold the motion's lock while doing so.
+std::mutex& motion_lock(const Motion* motion)
+{
+  static std::array<std::mutex, 64> locks;
+  return locks[motion->idx % locks.size()];
+}
+
 // forward declaration
 struct AStarNode;
 
@@ -166,6 +184,97 @@ bool compareAStarNode::operator()(const AStarNode *a, const AStarNode *b) const
   }
 }
 
+// Nodes, states and node tree of a search, released together when the last
+// owner goes away. Only the plan is copied out of a search; a reverse search
+// keeps its arena alive as the heuristic of later searches.
+struct SearchArena
+{
+  explicit SearchArena(std::shared_ptr<oc::SpaceInformation> si)
+    : si(si)
+  {
+  }
+
+  ~SearchArena()
+  {
+    for (auto state : states) {
+      si->freeState(state);
+    }
+  }
+
+  SearchArena(const SearchArena&) = delete;
+  SearchArena& operator=(const SearchArena&) = delete;
+
+  AStarNode* newNode()
+  {
+    nodes.emplace_back();
+    return &nodes.back();
+  }
+
+  ob::State* allocState()
+  {
+    states.push_back(si->allocState());
+    return states.back();
+  }
+
+  ob::State* cloneState(const ob::State* state)
+  {
+    states.push_back(si->cloneState(state));
+    return states.back();
+  }
+
+  std::shared_ptr<oc::SpaceInformation> si;
+  // a deque keeps the addresses of the nodes stable
+  std::deque<AStarNode> nodes;
+  std::vector<ob::State*> states;
+  std::unique_ptr<ompl::NearestNeighbors<AStarNode*>> T_n;
+};
+
+// Storage of the states and controls of a low-level plan. They are copied
+// out of the SearchArena, so a plan outlives its search and is freed with
+// the last HL node (or cache entry) that uses it.
+struct PlanArena
+{
+  explicit PlanArena(std::shared_ptr<oc::SpaceInformation> si)
+    : si(si)
+  {
+  }
+
+  ~PlanArena()
+  {
+    for (auto state : states) {
+      si->freeState(state);
+    }
+    for (auto control : controls) {
+      si->freeControl(control);
+    }
+  }
+
+  PlanArena(const PlanArena&) = delete;
+  PlanArena& operator=(const PlanArena&) = delete;
+
+  ob::State* allocState()
+  {
+    states.push_back(si->allocState());
+    return states.back();
+  }
+
+  ob::State* cloneState(const ob::State* state)
+  {
+    states.push_back(si->cloneState(state));
+    return states.back();
+  }
+
+  oc::Control* allocControl()
+  {
+    controls.push_back(si->allocControl());
+    return controls.back();
+  }
+
+  std::shared_ptr<oc::SpaceInformation> si;
+  std::vector<ob::State*> states;
+  std::vector<oc::Control*> controls;
+};
+
 float heuristic(std::shared_ptr<Robot> robot, const ob::State *s, const ob::State *g, float delta, ompl::NearestNeighbors<AStarNode*>* heuristic_nn)
 {
   if (heuristic_nn) {
@@ -195,6 +304,195 @@ struct Motions
   ompl::NearestNeighbors<Motion*>* T_m_end;
 };
 
+// generates collision objects and collision manager for a motion; for motions
+// that are shared by concurrent searches, the caller holds the motion's lock
+void add_collision_manager(std::shared_ptr<Robot> robot, const Motion& m)
+{
+  for (const auto &state : m.states)
+  {
+    for (size_t part = 0; part < robot->numParts(); ++part) {
+      const auto &transform = robot->getTransform(state, part);
+
+      auto co = new fcl::CollisionObjectf(robot->getCollisionGeometry(part));
+      co->setTranslation(transform.translation());
+      co->setRotation(transform.rotation());
+      co->computeAABB();
+      m.collision_objects.push_back(co);
+    }
+  }
+  m.collision_manager.reset(new ShiftableDynamicAABBTreeCollisionManager<float>());
+  m.collision_manager->registerObjects(m.collision_objects);
+}
+
+// GNAT on motions whose tree can be written to and restored from a buffer
+// (see motion_cache.hpp), with the motions stored as their index into first.
+// Restoring skips the distance computations of building it.
+class MotionGNAT : public ompl::NearestNeighborsGNAT<Motion*>
+{
+public:
+  void write(std::string& out, const Motion* first) const
+  {
+    put<uint64_t>(out, size_);
+    put<uint8_t>(out, tree_ != nullptr);
+    if (tree_) {
+      write_node(out, tree_, first);
+    }
+  }
+
+  // false if the buffer does not hold a tree on num_motions motions
+  bool read(const char*& ptr, const char* end, Motion* first, size_t num_motions)
+  {
+    clear();
+    Reader in{ptr, end};
+    const uint64_t size = in.get<uint64_t>();
+    if (in.get<uint8_t>()) {
+      tree_ = read_node(in, first, num_motions);
+    }
+    if (!in.ok || (size > 0 && tree_ == nullptr)) {
+      clear();
+      return false;
+    }
+    size_ = size;
+    ptr = in.ptr;
+    return true;
+  }
+
+private:
+  using Node = ompl::NearestNeighborsGNAT<Motion*>::Node;
+
+  template <typename T>
+  static void put(std::string& out, T value)
+  {
+    out.append((const char*)&value, sizeof(T));
+  }
+
+  struct Reader {
+    const char* ptr;
+    const char* end;
+    bool ok = true;
+
+    template <typename T>
+    T get()
+    {
+      T value{};
+      if (!ok || size_t(end - ptr) < sizeof(T)) {
+        ok = false;
+        return value;
+      }
+      std::memcpy(&value, ptr, sizeof(T));
+      ptr += sizeof(T);
+      return value;
+    }
+
+    // a count of elements of the given size that still fit into the buffer
+    uint64_t count(size_t element_size)
+    {
+      const uint64_t n = get<uint64_t>();
+      if (ok && n > size_t(end - ptr) / element_size) {
+        ok = false;
+      }
+      return ok ? n : 0;
+    }
+  };
+
+  void write_node(std::string& out, const Node* node, const Motion* first) const
+  {
+    put<uint32_t>(out, node->degree_);
+    put<uint64_t>(out, node->pivot_ - first);
+    put<double>(out, node->minRadius_);
+    put<double>(out, node->maxRadius_);
+    for (const auto* range : {&node->minRange_, &node->maxRange_}) {
+      put<uint64_t>(out, range->size());
+      for (double r : *range) {
+        put<double>(out, r);
+      }
+    }
+    put<uint64_t>(out, node->data_.size());
+    for (const Motion* m : node->data_) {
+      put<uint64_t>(out, m - first);
+    }
+    put<uint64_t>(out, node->children_.size());
+    for (const Node* child : node->children_) {
+      write_node(out, child, first);
+    }
+  }
+
+  Node* read_node(Reader& in, Motion* first, size_t num_motions) const
+  {
+    const uint32_t degree = in.get<uint32_t>();
+    const uint64_t pivot = in.get<uint64_t>();
+    if (!in.ok || pivot >= num_motions) {
+      return nullptr;
+    }
+    auto node = new Node(degree, maxNumPtsPerLeaf_, first + pivot);
+    node->minRadius_ = in.get<double>();
+    node->maxRadius_ = in.get<double>();
+    for (auto* range : {&node->minRange_, &node->maxRange_}) {
+      range->resize(in.count(sizeof(double)));
+      for (double& r : *range) {
+        r = in.get<double>();
+      }
+    }
+    node->data_.resize(in.count(sizeof(uint64_t)));
+    for (Motion*& m : node->data_) {
+      const uint64_t idx = in.get<uint64_t>();
+      in.ok = in.ok && idx < num_motions;
+      m = first + (in.ok ? idx : 0);
+    }
+    const uint64_t num_children = in.count(sizeof(uint32_t));
+    for (uint64_t i = 0; i < num_children && in.ok; ++i) {
+      Node* child = read_node(in, first, num_motions);
+      if (child == nullptr) {
+        in.ok = false;
+        break;
+      }
+      node->children_.push_back(child);
+    }
+    if (!in.ok) {
+      // also deletes the children
+      delete node;
+      return nullptr;
+    }
+    return node;
+  }
+};
+
+// creates the (empty) kd-trees for the first and (translated) last states of
+// the motions. Queries on them are thread-safe, as searches for several robots
+// may share them.
+void new_motion_trees(std::shared_ptr<oc::SpaceInformation> si, Motions& result)
+{
+    // kd-tree for motion primitives (start)
+    if (si->getStateSpace()->isMetricSpace())
+    {
+      result.T_m_start = new MotionGNAT();
+    } else {
+      result.T_m_start = new ompl::NearestNeighborsSqrtApprox<Motion*>();
+    }
+    result.T_m_start->setDistanceFunction([si](const Motion* a, const Motion* b) { return si->distance(a->states[0], b->states[0]); });
+
+    // kd-tree for motion primitives (end)
+    if (si->getStateSpace()->isMetricSpace())
+    {
+      result.T_m_end = new MotionGNAT();
+    } else {
+      result.T_m_end = new ompl::NearestNeighborsSqrtApprox<Motion*>();
+    }
+    result.T_m_end->setDistanceFunction([si](const Motion* a, const Motion* b) { return si->distance(a->last_state_translated, b->last_state_translated); });
+}
+
+// builds the kd-trees (see new_motion_trees) on all motions
+void build_motion_trees(std::shared_ptr<oc::SpaceInformation> si, Motions& result)
+{
+    std::vector<Motion*> motions;
+    for (auto& motion : result.motions) {
+      motions.push_back(&motion);
+    }
+    new_motion_trees(si, result);
+    result.T_m_start->add(motions); // keep initial states
+    result.T_m_end->add(motions); // keep initial states
+}
+
 void load_motions(
   msgpack::object msg_obj,
   std::shared_ptr<Robot> robot,
@@ -296,22 +594,6 @@ void load_motions(
       m.last_state_translated = si->cloneState(m.states.back());
       robot->setPosition(m.last_state_translated, fcl::Vector3f(0,0,0));
 
-      // generate collision objects and collision manager for saved motion
-      for (const auto &state : m.states)
-      {
-        for (size_t part = 0; part < robot->numParts(); ++part) {
-          const auto &transform = robot->getTransform(state, part);
-
-          auto co = new fcl::CollisionObjectf(robot->getCollisionGeometry(part));
-          co->setTranslation(transform.translation());
-          co->setRotation(transform.rotation());
-          co->computeAABB();
-          m.collision_objects.push_back(co);
-        }
-      }
-      m.collision_manager.reset(new ShiftableDynamicAABBTreeCollisionManager<float>());
-      m.collision_manager->registerObjects(m.collision_objects);
-
       m.disabled = false; 
 
       result.motions.push_back(m); 
@@ -324,31 +606,7 @@ void load_motions(
       result.motions[idx].idx = idx;
     }
 
-    // build kd-tree for motion primitives (start)
-    if (si->getStateSpace()->isMetricSpace())
-    {
-      result.T_m_start = new ompl::NearestNeighborsGNATNoThreadSafety<Motion*>();
-    } else {
-      result.T_m_start = new ompl::NearestNeighborsSqrtApprox<Motion*>();
-    }
-    result.T_m_start->setDistanceFunction([si](const Motion* a, const Motion* b) { return si->distance(a->states[0], b->states[0]); });
-
-    for (auto& motion : result.motions) {
-      result.T_m_start->add(&motion); // keep initial states
-    }
-
-    // build kd-tree for motion primitives (end)
-    if (si->getStateSpace()->isMetricSpace())
-    {
-      result.T_m_end = new ompl::NearestNeighborsGNATNoThreadSafety<Motion*>();
-    } else {
-      result.T_m_end = new ompl::NearestNeighborsSqrtApprox<Motion*>();
-    }
-    result.T_m_end->setDistanceFunction([si](const Motion* a, const Motion* b) { return si->distance(a->last_state_translated, b->last_state_translated); });
-
-    for (auto& motion : result.motions) {
-      result.T_m_end->add(&motion); // keep initial states
-    }
+    build_motion_trees(si, result);
 
     std::cout << "There are " << result.motions.size() << " motions!" << std::endl;
 }
@@ -442,6 +700,34 @@ void disable_motions(
   std::cout << "There are " << num_enabled_motions << " motions enabled." << std::endl;
 }
 
+// Configures the space information of the robot for planning among the
+// obstacles. DBAstar::search does not modify it, so that searches for different
+// robots can run concurrently; call this once per robot before searching.
+void setup_space_information(
+  std::shared_ptr<Robot> robot,
+  const std::vector<fcl::CollisionObjectf *>& obstacles)
+{
+  auto si = robot->getSpaceInformation();
+
+  std::shared_ptr<fcl::BroadPhaseCollisionManagerf> bpcm_env(new fcl::DynamicAABBTreeCollisionManagerf());
+  bpcm_env->registerObjects(obstacles);
+  bpcm_env->setup();
+
+  // set number of control steps
+  si->setPropagationStepSize(1);
+  si->setMinMaxControlDuration(1, 1);
+
+  // set state validity checking for this space
+  auto stateValidityChecker(std::make_shared<fclStateValidityChecker>(si, bpcm_env, robot, false));
+  si->setStateValidityChecker(stateValidityChecker);
+
+  // set the state propagator
+  std::shared_ptr<oc::StatePropagator> statePropagator(new RobotStatePropagator(si, robot));
+  si->setStatePropagator(statePropagator);
+
+  si->setup();
+}
+
 template <typename Constraint>
 class DBAstar
 {
@@ -451,6 +737,8 @@ public:
     , alpha(alpha)
     , epsilon(1.0)
     , maxCost(1e6)
+    , num_expansions(0)
+    , num_collision_checks(0)
   {
   }
 
@@ -465,9 +753,11 @@ public:
     bool reverse_search,
     LowLevelPlan<AStarNode*,ob::State*,oc::Control*>& ll_result,
     ompl::NearestNeighbors<AStarNode*>* heuristic_nn = nullptr,
-    ompl::NearestNeighbors<AStarNode*>** heuristic_result = nullptr)
+    std::shared_ptr<SearchArena>* heuristic_result = nullptr)
   {
     auto si = robot->getSpaceInformation();
+    // everything allocated for the search is released when it returns
+    auto arena = std::make_shared<SearchArena>(si);
 
 #ifdef DBG_PRINTS
     std::cout << "Running dbA*" << std::endl;
@@ -481,25 +771,16 @@ public:
     ll_result.trajectory.clear();
     ll_result.actions.clear();
     ll_result.cost = 0;
+    ll_result.storage.reset();
 
     std::shared_ptr<fcl::BroadPhaseCollisionManagerf> bpcm_env(new fcl::DynamicAABBTreeCollisionManagerf());
     bpcm_env->registerObjects(obstacles);
     bpcm_env->setup();
 
-    // set number of control steps
-    si->setPropagationStepSize(1);
-    si->setMinMaxControlDuration(1, 1);
-
-    // set state validity checking for this space
+    // si is only read (see setup_space_information), the validity checker is our own
     auto stateValidityChecker(std::make_shared<fclStateValidityChecker>(si, bpcm_env, robot, false));
-    si->setStateValidityChecker(stateValidityChecker);
-
-    // set the state propagator
-    std::shared_ptr<oc::StatePropagator> statePropagator(new RobotStatePropagator(si, robot));
-    si->setStatePropagator(statePropagator);
 
-    si->setup();
-    auto startState = si->allocState();
+    auto startState = arena->allocState();
     if (!reverse_search) {
       si->getStateSpace()->copyFromReals(startState, robot_start);
     } else {
@@ -508,7 +789,7 @@ public:
     si->enforceBounds(startState);
     
     // set goal state
-    auto goalState = si->allocState();
+    auto goalState = arena->allocState();
     if (!reverse_search) {
       si->getStateSpace()->copyFromReals(goalState, robot_goal);
     } else {
@@ -516,7 +797,6 @@ public:
     }
 
     if (isnan(robot_start[0])) {
-      si->freeState(goalState);
       goalState = nullptr;
     } else {
       si->enforceBounds(goalState);
@@ -538,22 +818,27 @@ public:
   open_t open;
 
   // kd-tree for nodes
-  ompl::NearestNeighbors<AStarNode*> *T_n;
   if (si->getStateSpace()->isMetricSpace())
   {
-    T_n = new ompl::NearestNeighborsGNATNoThreadSafety<AStarNode*>();
+    // a heuristic may be shared by robots that are planned for concurrently
+    if (heuristic_result) {
+      arena->T_n.reset(new ompl::NearestNeighborsGNAT<AStarNode*>());
+    } else {
+      arena->T_n.reset(new ompl::NearestNeighborsGNATNoThreadSafety<AStarNode*>());
+    }
   }
   else
   {
-    T_n = new ompl::NearestNeighborsSqrtApprox<AStarNode*>();
+    arena->T_n.reset(new ompl::NearestNeighborsSqrtApprox<AStarNode*>());
   }
+  auto T_n = arena->T_n.get();
   if (heuristic_result) {
-    *heuristic_result = T_n;
+    *heuristic_result = arena;
   }
   T_n->setDistanceFunction([si](const AStarNode* a, const AStarNode* b)
                            { return si->distance(a->state, b->state); });
 
-  auto start_node = new AStarNode();
+  auto start_node = arena->newNode();
   start_node->state = startState;
   start_node->gScore = 0;
   if (goalState) {
@@ -573,13 +858,13 @@ public:
 
   Motion fakeMotion;
   fakeMotion.idx = -1;
-  fakeMotion.states.push_back(si->allocState());
-  fakeMotion.last_state_translated = si->allocState();
+  fakeMotion.states.push_back(arena->allocState());
+  fakeMotion.last_state_translated = arena->allocState();
 
-  AStarNode* query_n = new AStarNode();
+  AStarNode* query_n = arena->newNode();
 
-  ob::State* tmpState = si->allocState();
-  ob::State* tmpStateconst = si->allocState();
+  ob::State* tmpState = arena->allocState();
+  ob::State* tmpStateconst = arena->allocState();
   std::vector<Motion*> neighbors_m; // applicable
   std::vector<AStarNode*> neighbors_n; // explored
 
@@ -591,6 +876,7 @@ public:
     AStarNode* current = open.top();
     // std::cout << expands << " " << current->fScore << std::endl;
     ++expands;
+    ++num_expansions;
     if (expands % 1000 == 0) {
       std::cout << "LL expanded: " << expands << " open: " << open.size() << " nodes: " << T_n->size() << " f-score " << current->fScore << std::endl;
     }
@@ -629,6 +915,8 @@ public:
       std::reverse(result.begin(), result.end());
       // ll_result.plan = result;
       ll_result.cost = current->gScore;
+      auto plan_arena = std::make_shared<PlanArena>(si);
+      ll_result.storage = plan_arena;
 
       for (size_t i = 0; i < result.size() - 1; ++i)
       {
@@ -640,7 +928,7 @@ public:
         for (size_t k = 0; k < motion.states.size()-1; ++k) // skipping the last state
         {
           const auto state = motion.states[k];
-          ob::State* motion_state = si->allocState(); // alternative 
+          ob::State* motion_state = plan_arena->allocState(); // alternative 
           si->copyState(motion_state, state);
           const fcl::Vector3f relative_pos = robot->getTransform(state).translation();
           robot->setPosition(motion_state, current_pos + relative_pos);
@@ -653,7 +941,7 @@ public:
 #ifdef DBG_PRINTS
       si->printState(result.back().first->state);
 #endif
-      ll_result.trajectory.push_back(si->cloneState(result.back().first->state));
+      ll_result.trajectory.push_back(plan_arena->cloneState(result.back().first->state));
 
       for (size_t i = 0; i < result.size() - 1; ++i)
       {
@@ -662,7 +950,7 @@ public:
         for (size_t k = 0; k < motion.actions.size(); ++k)
         {
           const auto& action = motion.actions[k];
-          oc::Control* motion_action = si->allocControl(); 
+          oc::Control* motion_action = plan_arena->allocControl(); 
           si->copyControl(motion_action, action);
           ll_result.actions.push_back(motion_action);
         }
@@ -688,7 +976,7 @@ public:
 
       // sanity check on the state validity
       for (size_t i = 0; i < ll_result.trajectory.size(); ++i) {
-        if (!si->isValid(ll_result.trajectory[i])) {
+        if (!stateValidityChecker->isValid(ll_result.trajectory[i])) {
           std::cerr << "Warning: state invalid " << i << std::endl;
         }
       }
@@ -824,10 +1112,17 @@ public:
 
       // check collision shape with static obstacles
       fcl::DefaultCollisionData<float> collision_data;
-      motion->collision_manager->shift(offset);
-      motion->collision_manager->collide(bpcm_env.get(), &collision_data, fcl::DefaultCollisionFunction<float>);
+      {
+        std::lock_guard<std::mutex> lock(motion_lock(motion));
+        if (!motion->collision_manager) {
+          add_collision_manager(robot, *motion);
+        }
+        motion->collision_manager->shift(offset);
+        motion->collision_manager->collide(bpcm_env.get(), &collision_data, fcl::DefaultCollisionFunction<float>);
+        motion->collision_manager->shift(-offset);
+      }
+      ++num_collision_checks;
       motionValid = !collision_data.result.isCollision();
-      motion->collision_manager->shift(-offset);
     
       if (!motionValid) {
         // std::cout << "skip invalid motion" << std::endl;
@@ -882,8 +1177,8 @@ public:
       // if (nearest_distance > radius)
       {
         // new state -> add it to open and T_n
-        auto node = new AStarNode();
-        node->state = si->cloneState(tmpState);
+        auto node = arena->newNode();
+        node->state = arena->cloneState(tmpState);
         node->gScore = tentative_gScore;
         node->fScore = tentative_fScore;
         node->arrivals.push_back({.gScore = tentative_gScore, .came_from = current, .used_motion = motion->idx, .arrival_idx = current->current_arrival_idx});
@@ -958,6 +1253,10 @@ public:
     return false;
   } // end of search function
 
+  // over all searches of this planner
+  size_t num_expansions;
+  size_t num_collision_checks;
+
 private:
   float delta;
   float alpha;
@@ -967,6 +1266,3 @@ private:
 
 }; // end of DBAstar class
 
-// TO DO:
-// delete New to clear the memory
-
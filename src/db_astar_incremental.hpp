@@ -0,0 +1,487 @@
+#pragma once
+
+#include <deque>
+#include <map>
+
+#include "db_astar.hpp"
+
+// db-A* for a single robot on a motion library that grows between searches
+// (see run_dbastar in scripts/main_dbastar.py). The search tree (open and T_n)
+// is kept across add_motions calls: added motions are applied to the nodes
+// that were already expanded, nodes that are still in open use them once they
+// are expanded. delta is fixed on the first add_motions, so that the tree
+// stays valid.
+class IncrementalDBAstar
+{
+public:
+  IncrementalDBAstar(
+    std::shared_ptr<Robot> robot,
+    const std::string& robot_type,
+    size_t env_size,
+    const std::vector<fcl::CollisionObjectf *>& obstacles,
+    const fcl::AABBf& workspace_aabb,
+    const std::vector<double>& robot_start,
+    const std::vector<double>& robot_goal,
+    float delta, // negative: -k, chosen such that k motions are applicable on average
+    float epsilon,
+    float alpha,
+    bool filterDuplicates,
+    float maxCost)
+    : num_expansions(0)
+    , num_collision_checks(0)
+    , robot_(robot)
+    , si_(robot->getSpaceInformation())
+    , workspace_aabb_(workspace_aabb)
+    , delta_(delta)
+    , epsilon_(epsilon)
+    , alpha_(alpha)
+    , filterDuplicates_(filterDuplicates)
+    , maxCost_(maxCost)
+  {
+    if (alpha <= 0 || alpha >= 1) {
+      throw std::invalid_argument("alpha needs to be between 0 and 1");
+    }
+
+    bpcm_env_.reset(new fcl::DynamicAABBTreeCollisionManagerf());
+    bpcm_env_->registerObjects(obstacles);
+    bpcm_env_->setup();
+
+    // the robot is owned by this search, so its space is set up only once
+    auto stateValidityChecker(std::make_shared<fclStateValidityChecker>(si_, bpcm_env_, robot_, false));
+    std::shared_ptr<oc::StatePropagator> statePropagator(new RobotStatePropagator(si_, robot_));
+    si_->setPropagationStepSize(1);
+    si_->setMinMaxControlDuration(1, 1);
+    si_->setStateValidityChecker(stateValidityChecker);
+    si_->setStatePropagator(statePropagator);
+    si_->setup();
+
+    // motion states are only bounded in the non-position dimensions
+    ob::RealVectorBounds position_bounds_no_bound(env_size);
+    position_bounds_no_bound.setLow(-1e6);
+    position_bounds_no_bound.setHigh(1e6);
+    auto robot_no_pos_bound = create_robot(robot_type, position_bounds_no_bound);
+    si_no_pos_bound_ = robot_no_pos_bound->getSpaceInformation();
+    si_no_pos_bound_->setup();
+
+    T_m_ = new_motion_tree();
+    T_n_ = si_->getStateSpace()->isMetricSpace()
+      ? (ompl::NearestNeighbors<AStarNode*>*)new ompl::NearestNeighborsGNATNoThreadSafety<AStarNode*>()
+      : new ompl::NearestNeighborsSqrtApprox<AStarNode*>();
+    auto si = si_;
+    T_n_->setDistanceFunction([si](const AStarNode* a, const AStarNode* b)
+                              { return si->distance(a->state, b->state); });
+
+    startState_ = si_->allocState();
+    si_->getStateSpace()->copyFromReals(startState_, robot_start);
+    si_->enforceBounds(startState_);
+    goalState_ = si_->allocState();
+    si_->getStateSpace()->copyFromReals(goalState_, robot_goal);
+    si_->enforceBounds(goalState_);
+
+    fakeMotion_.idx = -1;
+    fakeMotion_.states.push_back(si_->allocState());
+    query_n_ = new AStarNode();
+    tmpState_ = si_->allocState();
+
+    // the start node is added once delta is known
+  }
+
+  IncrementalDBAstar(const IncrementalDBAstar&) = delete;
+  IncrementalDBAstar& operator=(const IncrementalDBAstar&) = delete;
+
+  ~IncrementalDBAstar()
+  {
+    clear_nodes();
+    for (auto& m : motions_) {
+      for (auto state : m.states) {
+        si_->freeState(state);
+      }
+      for (auto action : m.actions) {
+        si_->freeControl(action);
+      }
+      si_->freeState(m.last_state_translated);
+      for (auto co : m.collision_objects) {
+        delete co;
+      }
+    }
+    delete T_m_;
+    delete T_n_;
+    delete query_n_;
+    si_->freeState(fakeMotion_.states[0]);
+    si_->freeState(tmpState_);
+    si_->freeState(goalState_);
+    si_->freeState(startState_);
+  }
+
+  // Adds motions (states and actions of each, in the order of the library)
+  // and applies the enabled ones to all expanded nodes. Returns the number of
+  // added motions that are not duplicates of an existing one.
+  size_t add_motions(
+    const std::vector<std::vector<std::vector<double>>>& states,
+    const std::vector<std::vector<std::vector<double>>>& actions)
+  {
+    assert(states.size() == actions.size());
+    const size_t first = motions_.size();
+    for (size_t i = 0; i < states.size(); ++i) {
+      motions_.emplace_back();
+      Motion& m = motions_.back();
+      m.aabb = fcl::AABBf(fcl::Vector3f(0,0,0));
+      for (const auto& reals : states[i]) {
+        ob::State* state = si_->allocState();
+        si_->getStateSpace()->copyFromReals(state, reals);
+        m.states.push_back(state);
+        m.aabb += robot_->getTransform(state).translation();
+        if (!si_no_pos_bound_->satisfiesBounds(state)) {
+          si_no_pos_bound_->enforceBounds(state);
+        }
+      }
+      for (const auto& reals : actions[i]) {
+        oc::Control* control = si_->allocControl();
+        for (size_t idx = 0; idx < reals.size(); ++idx) {
+          double* address = si_->getControlSpace()->getValueAddressAtIndex(control, idx);
+          if (address) {
+            *address = reals[idx];
+          }
+        }
+        m.actions.push_back(control);
+      }
+      m.cost = m.actions.size() * robot_->dt();
+      m.idx = motions_.size() - 1;
+      m.last_state_translated = si_->cloneState(m.states.back());
+      robot_->setPosition(m.last_state_translated, fcl::Vector3f(0,0,0));
+      add_collision_manager(robot_, m);
+      m.disabled = false;
+    }
+
+    if (delta_ < 0 && motions_.size() > first) {
+      std::vector<Motion*> batch;
+      for (size_t i = first; i < motions_.size(); ++i) {
+        batch.push_back(&motions_[i]);
+      }
+      delta_ = branching_delta(batch, (size_t)-delta_);
+      std::cout << "Automatically adjusting delta to: " << delta_ << std::endl;
+    }
+    if (delta_ >= 0 && nodes_.empty()) {
+      add_start_node();
+    }
+
+    // earlier motions of the library win over later duplicates
+    std::vector<Motion*> enabled;
+    std::vector<Motion*> neighbors_m;
+    for (size_t i = first; i < motions_.size(); ++i) {
+      Motion& m = motions_[i];
+      if (filterDuplicates_ && T_m_->size() > 0) {
+        T_m_->nearestR(&m, delta_*alpha_, neighbors_m);
+        for (const Motion* nm : neighbors_m) {
+          if (si_->distance(m.states.back(), nm->states.back()) < delta_*(1-alpha_)) {
+            m.disabled = true;
+            break;
+          }
+        }
+      }
+      if (!m.disabled) {
+        T_m_->add(&m);
+        enabled.push_back(&m);
+      }
+    }
+
+    // expanded nodes only saw the old motions
+    if (!enabled.empty()) {
+      auto T_added = new_motion_tree();
+      T_added->add(enabled);
+      for (size_t i = 0, n = nodes_.size(); i < n; ++i) {
+        if (!nodes_[i]->is_in_open) {
+          expand(nodes_[i], T_added);
+        }
+      }
+      delete T_added;
+    }
+    return enabled.size();
+  }
+
+  // Continues the search. Returns the node that reaches the goal, or nullptr
+  // if open ran empty or only has nodes above the cost bound (more motions
+  // may help) or timelimit (s, if > 0) passed. The goal node stays in open,
+  // so searching again without adding motions returns it again (unless the
+  // cost bound was lowered below it).
+  const AStarNode* search(double timelimit = 0)
+  {
+    const auto start = std::chrono::steady_clock::now();
+    while (!open_.empty()) {
+      if (timelimit > 0 && std::chrono::duration<double>(std::chrono::steady_clock::now() - start).count() > timelimit) {
+        return nullptr;
+      }
+      AStarNode* current = open_.top();
+      // nodes (still) in open from before the bound was lowered
+      if (current->fScore > maxCost_) {
+        return nullptr;
+      }
+      if (current->reaches_goal) {
+        return current;
+      }
+      ++num_expansions;
+      current->is_in_open = false;
+      open_.pop();
+      expand(current, T_m_);
+    }
+    return nullptr;
+  }
+
+  // the states and actions of the path to node, and how often each motion is used
+  void extract(
+    const AStarNode* node,
+    std::vector<std::vector<double>>& states,
+    std::vector<std::vector<double>>& actions,
+    std::map<size_t, size_t>& motion_stats) const
+  {
+    std::vector<std::pair<const AStarNode*, size_t>> path;
+    size_t arrival_idx = node->current_arrival_idx;
+    while (node != nullptr) {
+      path.push_back(std::make_pair(node, arrival_idx));
+      const auto& arrival = node->arrivals[arrival_idx];
+      node = arrival.came_from;
+      arrival_idx = arrival.arrival_idx;
+    }
+    std::reverse(path.begin(), path.end());
+
+    states.clear();
+    actions.clear();
+    motion_stats.clear();
+    std::vector<double> reals;
+    for (size_t i = 0; i + 1 < path.size(); ++i) {
+      const fcl::Vector3f current_pos = robot_->getTransform(path[i].first->state).translation();
+      const auto& motion = motions_.at(path[i+1].first->arrivals[path[i+1].second].used_motion);
+      // skipping the last state
+      for (size_t k = 0; k + 1 < motion.states.size(); ++k) {
+        si_->copyState(tmpState_, motion.states[k]);
+        const fcl::Vector3f relative_pos = robot_->getTransform(motion.states[k]).translation();
+        robot_->setPosition(tmpState_, current_pos + relative_pos);
+        si_->getStateSpace()->copyToReals(reals, tmpState_);
+        states.push_back(reals);
+      }
+      for (const auto& action : motion.actions) {
+        reals.resize(si_->getControlSpace()->getDimension());
+        for (size_t d = 0; d < reals.size(); ++d) {
+          reals[d] = *si_->getControlSpace()->getValueAddressAtIndex(action, d);
+        }
+        actions.push_back(reals);
+      }
+      ++motion_stats[motion.idx];
+    }
+    si_->getStateSpace()->copyToReals(reals, path.back().first->state);
+    states.push_back(reals);
+  }
+
+  // Drops the search tree, but keeps the motions (to search again from
+  // scratch, e.g. with other motions disabled)
+  void restart()
+  {
+    clear_nodes();
+    if (delta_ >= 0) {
+      add_start_node();
+    }
+  }
+
+  // Disabled motions are skipped by the following expansions. Motions that
+  // were filtered as duplicates are never used.
+  void set_disabled(size_t idx, bool disabled)
+  {
+    motions_.at(idx).disabled = disabled;
+  }
+
+  float delta() const
+  {
+    return delta_;
+  }
+
+  float max_cost() const
+  {
+    return maxCost_;
+  }
+
+  // The bound can only be lowered (e.g. to the cost of the best solution so
+  // far): nodes that a higher bound pruned are gone.
+  void set_max_cost(float max_cost)
+  {
+    maxCost_ = std::min(maxCost_, max_cost);
+  }
+
+  size_t num_motions() const
+  {
+    return motions_.size();
+  }
+
+  size_t num_nodes() const
+  {
+    return nodes_.size();
+  }
+
+  // over all searches
+  size_t num_expansions;
+  size_t num_collision_checks;
+
+private:
+  ompl::NearestNeighbors<Motion*>* new_motion_tree() const
+  {
+    ompl::NearestNeighbors<Motion*>* T_m;
+    if (si_->getStateSpace()->isMetricSpace())
+    {
+      T_m = new ompl::NearestNeighborsGNATNoThreadSafety<Motion*>();
+    } else {
+      T_m = new ompl::NearestNeighborsSqrtApprox<Motion*>();
+    }
+    auto si = si_;
+    T_m->setDistanceFunction([si](const Motion* a, const Motion* b) { return si->distance(a->states[0], b->states[0]); });
+    return T_m;
+  }
+
+  // delta for which k of the motions are applicable in an average (valid) state
+  float branching_delta(const std::vector<Motion*>& motions, size_t k)
+  {
+    auto T_m = new_motion_tree();
+    T_m->add(motions);
+    std::vector<Motion*> neighbors_m;
+    const size_t num_samples = std::min<size_t>(1000, motions.size());
+    auto state_sampler = si_->allocStateSampler();
+    float sum_delta = 0.0;
+    for (size_t i = 0; i < num_samples; ++i) {
+      do {
+        state_sampler->sampleUniform(fakeMotion_.states[0]);
+      } while (!si_->isValid(fakeMotion_.states[0]));
+      robot_->setPosition(fakeMotion_.states[0], fcl::Vector3f(0, 0, 0));
+      T_m->nearestK(&fakeMotion_, k+1, neighbors_m);
+      sum_delta += si_->distance(fakeMotion_.states[0], neighbors_m.back()->states.front());
+    }
+    delete T_m;
+    return (sum_delta / num_samples) / alpha_;
+  }
+
+  void clear_nodes()
+  {
+    for (AStarNode* node : nodes_) {
+      si_->freeState(node->state);
+      delete node;
+    }
+    nodes_.clear();
+    open_.clear();
+    T_n_->clear();
+  }
+
+  void add_start_node()
+  {
+    auto start_node = new AStarNode();
+    start_node->state = si_->cloneState(startState_);
+    start_node->gScore = 0;
+    start_node->fScore = epsilon_ * heuristic(robot_, startState_, goalState_, delta_, nullptr);
+    start_node->arrivals.push_back({.gScore = 0, .came_from = nullptr, .used_motion = (size_t)-1, .arrival_idx = (size_t)-1});
+    start_node->handle = open_.push(start_node);
+    start_node->is_in_open = true;
+    start_node->current_arrival_idx = 0;
+    start_node->reaches_goal = si_->distance(startState_, goalState_) <= delta_;
+    T_n_->add(start_node);
+    nodes_.push_back(start_node);
+  }
+
+  // applies the motions of T_m to current (as the db-A* expansion)
+  void expand(AStarNode* current, ompl::NearestNeighbors<Motion*>* T_m)
+  {
+    if (T_m->size() == 0) {
+      return;
+    }
+    si_->copyState(fakeMotion_.states[0], current->state);
+    robot_->setPosition(fakeMotion_.states[0], fcl::Vector3f(0,0,0));
+    T_m->nearestR(&fakeMotion_, delta_*alpha_, neighbors_m_);
+
+    const Eigen::Vector3f offset = robot_->getTransform(current->state).translation();
+    for (const Motion* motion : neighbors_m_) {
+      if (motion->disabled) {
+        continue;
+      }
+      const float tentative_gScore = current->gScore + motion->cost;
+      si_->copyState(tmpState_, motion->states.back());
+      const Eigen::Vector3f relative_pos = robot_->getTransform(motion->states.back()).translation();
+      robot_->setPosition(tmpState_, offset + relative_pos);
+      const float tentative_fScore = tentative_gScore + epsilon_ * heuristic(robot_, tmpState_, goalState_, delta_, nullptr);
+
+      // skip motions that would exceed cost bound or are invalid
+      if (tentative_fScore > maxCost_ || !si_->satisfiesBounds(tmpState_)) {
+        continue;
+      }
+      // make sure that the whole motion stays within the workspace
+      if (!workspace_aabb_.contain(fcl::translate(motion->aabb, offset))) {
+        continue;
+      }
+      // check collision shape with static obstacles
+      fcl::DefaultCollisionData<float> collision_data;
+      motion->collision_manager->shift(offset);
+      motion->collision_manager->collide(bpcm_env_.get(), &collision_data, fcl::DefaultCollisionFunction<float>);
+      motion->collision_manager->shift(-offset);
+      ++num_collision_checks;
+      if (collision_data.result.isCollision()) {
+        continue;
+      }
+
+      // Check if we have this state (or any within delta*(1-alpha)) already
+      query_n_->state = tmpState_;
+      T_n_->nearestR(query_n_, delta_*(1-alpha_), neighbors_n_);
+      if (neighbors_n_.empty()) {
+        auto node = new AStarNode();
+        node->state = si_->cloneState(tmpState_);
+        node->gScore = tentative_gScore;
+        node->fScore = tentative_fScore;
+        node->arrivals.push_back({.gScore = tentative_gScore, .came_from = current, .used_motion = motion->idx, .arrival_idx = current->current_arrival_idx});
+        node->handle = open_.push(node);
+        node->is_in_open = true;
+        node->current_arrival_idx = 0;
+        node->reaches_goal = si_->distance(tmpState_, goalState_) <= delta_;
+        T_n_->add(node);
+        nodes_.push_back(node);
+        continue;
+      }
+      // check if we have a better path now
+      for (AStarNode* entry : neighbors_n_) {
+        const float delta_score = entry->gScore - tentative_gScore;
+        if (delta_score > 0) {
+          entry->gScore = tentative_gScore;
+          entry->fScore -= delta_score;
+          entry->arrivals.push_back({.gScore = tentative_gScore, .came_from = current, .used_motion = motion->idx, .arrival_idx = current->current_arrival_idx});
+          entry->current_arrival_idx = entry->arrivals.size() - 1;
+          if (entry->is_in_open) {
+            open_.increase(entry->handle);
+          } else {
+            entry->handle = open_.push(entry);
+            entry->is_in_open = true;
+          }
+        }
+      }
+    }
+  }
+
+  std::shared_ptr<Robot> robot_;
+  std::shared_ptr<oc::SpaceInformation> si_;
+  std::shared_ptr<oc::SpaceInformation> si_no_pos_bound_;
+  std::shared_ptr<fcl::BroadPhaseCollisionManagerf> bpcm_env_;
+  fcl::AABBf workspace_aabb_;
+  ob::State* startState_;
+  ob::State* goalState_;
+
+  float delta_;
+  float epsilon_;
+  float alpha_;
+  bool filterDuplicates_;
+  float maxCost_;
+
+  // pointers into the motions stay valid when more are added
+  std::deque<Motion> motions_;
+  ompl::NearestNeighbors<Motion*>* T_m_;
+
+  open_t open_;
+  ompl::NearestNeighbors<AStarNode*>* T_n_;
+  std::vector<AStarNode*> nodes_;
+
+  Motion fakeMotion_;
+  AStarNode* query_n_;
+  ob::State* tmpState_;
+  std::vector<Motion*> neighbors_m_;
+  std::vector<AStarNode*> neighbors_n_;
+};
@@ -0,0 +1,1017 @@
+#pragma once
+
+#include <iostream>
+#include <fstream>
+#include <algorithm>
+#include <chrono>
+#include <iterator>
+#include <yaml-cpp/yaml.h>
+// OMPL headers
+#include <ompl/base/spaces/RealVectorStateSpace.h>
+#include <ompl/control/SpaceInformation.h>
+#include <ompl/control/spaces/RealVectorControlSpace.h>
+#include <ompl/base/OptimizationObjective.h>
+
+#include "robots.h"
+#include "robotStatePropagator.hpp"
+#include "fclStateValidityChecker.hpp"
+
+// #define DBG_PRINTS
+#include "db_astar.hpp"
+#include "motion_cache.hpp"
+#include "planresult.hpp"
+#include "instrumentation.hpp"
+#include "thread_pool.hpp"
+#include "lru_cache.hpp"
+
+#include <dynoplan/optimization/ocp.hpp>
+#include <boost/heap/d_ary_heap.hpp>
+#include <boost/functional/hash.hpp>
+
+// #include "multirobot_trajectory.hpp"
+#include "dynoplan/optimization/multirobot_optimization.hpp"
+
+namespace ob = ompl::base;
+namespace oc = ompl::control;
+
+// Conflicts 
+struct Conflict {
+  float time;
+  size_t robot_idx_i;
+  ob::State* robot_state_i;
+  size_t robot_idx_j;
+  ob::State* robot_state_j;
+};
+
+// Constraints
+struct Constraint {
+//   Constraint(float time, ob::State* state) : time(time), constrained_state(state) {}
+  float time;
+  ob::State* constrained_state;
+};
+
+// The constraints of a robot in a HL node: the newest one, linked to those of
+// the parent node, which share them
+struct ConstraintChain {
+    Constraint constraint;
+    std::shared_ptr<const ConstraintChain> parent;
+    // owns constraint.constrained_state, a copy of the conflicting state (the
+    // plan it was taken from is freed once no HL node uses it anymore)
+    std::shared_ptr<ob::State> state;
+};
+
+std::shared_ptr<const ConstraintChain> add_constraint(
+    std::shared_ptr<oc::SpaceInformation> si,
+    const Constraint& constraint,
+    std::shared_ptr<const ConstraintChain> parent)
+{
+    std::shared_ptr<ob::State> state(si->cloneState(constraint.constrained_state), [si](ob::State* s) { si->freeState(s); });
+    return std::make_shared<ConstraintChain>(ConstraintChain{{constraint.time, state.get()}, parent, state});
+}
+
+// the constraints of the chain, oldest first
+std::vector<Constraint> collect_constraints(std::shared_ptr<const ConstraintChain> chain)
+{
+    std::vector<Constraint> constraints;
+    for (; chain; chain = chain->parent) {
+        constraints.push_back(chain->constraint);
+    }
+    std::reverse(constraints.begin(), constraints.end());
+    return constraints;
+}
+
+// Collision objects of the parts of a robot along its plan, objects[t][part],
+// their bounding spheres and a segment tree of the robot's AABBs over time.
+// Built once per plan and shared by the HL nodes that use the plan.
+struct TrajectoryGeometry {
+    std::vector<std::vector<std::unique_ptr<fcl::CollisionObjectf>>> objects;
+    // center and radius per object
+    std::vector<std::vector<std::pair<fcl::Vector3f, float>>> spheres;
+    // swept[leaves + t] is the AABB of all parts at t, an inner node the union
+    // of its children
+    std::vector<fcl::AABBf> swept;
+    size_t leaves = 0;
+};
+
+// Conflicts of a pair of robots: the first conflicting timestep (-1 if none) and
+// the number of conflicting timesteps
+struct PairConflicts {
+    int first = -1;
+    size_t count = 0;
+};
+
+// Conflicts between all pairs of robots of a HL node, pairs[i * num_robots + j]
+// for i < j
+struct ConflictTable {
+    size_t num_robots = 0;
+    std::vector<PairConflicts> pairs;
+    size_t num_conflicts = 0;
+};
+
+// Plans, constraints and conflicts are immutable and shared with the parent, a
+// child only adds the plan and constraint of its replanned robot.
+struct HighLevelNode {
+    std::vector<std::shared_ptr<const LowLevelPlan<AStarNode*, ob::State*, oc::Control*>>> solution;
+    std::vector<std::shared_ptr<const ConstraintChain>> constraints;
+    // std::map<size_t, std::vector<Constraint>> constraints;
+
+    // the conflicts of the parent, rechecked for the robots in stale (whose
+    // geometries are outdated as well) when the node is expanded
+    std::vector<std::shared_ptr<const TrajectoryGeometry>> geometries;
+    std::shared_ptr<const ConflictTable> conflicts;
+    std::vector<size_t> stale;
+
+    float cost; 
+    int id;
+
+    typename boost::heap::d_ary_heap<HighLevelNode, boost::heap::arity<2>,
+                                     boost::heap::mutable_<true> >::handle_type
+        handle;
+
+    bool operator<(const HighLevelNode& n) const {
+      return cost > n.cost;
+    }
+  };
+
+// A low-level query within a delta iteration: the robot and its constraints,
+// in a canonical order (by time and state, without duplicates) and by value, as
+// the same constraints reached through different branches use different states.
+struct LowLevelQuery {
+    size_t robot;
+    std::vector<std::pair<float, std::vector<double>>> constraints;
+
+    bool operator==(const LowLevelQuery& other) const {
+        return robot == other.robot && constraints == other.constraints;
+    }
+};
+
+struct LowLevelQueryHash {
+    size_t operator()(const LowLevelQuery& query) const {
+        size_t seed = 0;
+        boost::hash_combine(seed, query.robot);
+        for (const auto& constraint : query.constraints) {
+            boost::hash_combine(seed, constraint.first);
+            boost::hash_range(seed, constraint.second.begin(), constraint.second.end());
+        }
+        return seed;
+    }
+};
+
+LowLevelQuery make_low_level_query(size_t robot_idx, std::shared_ptr<Robot> robot, const std::vector<Constraint>& constraints)
+{
+    LowLevelQuery query{robot_idx, {}};
+    auto space = robot->getSpaceInformation()->getStateSpace();
+    for (const auto& constraint : constraints) {
+        std::vector<double> reals;
+        space->copyToReals(reals, constraint.constrained_state);
+        query.constraints.emplace_back(constraint.time, reals);
+    }
+    std::sort(query.constraints.begin(), query.constraints.end());
+    query.constraints.erase(std::unique(query.constraints.begin(), query.constraints.end()), query.constraints.end());
+    return query;
+}
+
+// Answer to a low-level query; the plan is shared with the HL nodes
+struct CachedPlan {
+    bool success;
+    std::shared_ptr<const LowLevelPlan<AStarNode*, ob::State*, oc::Control*>> plan;
+};
+
+// copies of the plans of a HL node, for the exports
+std::vector<LowLevelPlan<AStarNode*, ob::State*, oc::Control*>> collect_plans(const HighLevelNode& node)
+{
+    std::vector<LowLevelPlan<AStarNode*, ob::State*, oc::Control*>> plans;
+    for (const auto& plan : node.solution) {
+        plans.push_back(*plan);
+    }
+    return plans;
+}
+
+void print_solution(const std::vector<LowLevelPlan<AStarNode*,ob::State*, oc::Control*>>& solution, const std::vector<std::shared_ptr<Robot>>& all_robots){
+    size_t max_t = 0;
+    ob::State *node_state;
+    for (const auto& sol : solution){
+      max_t = std::max(max_t, sol.trajectory.size() - 1);
+    }
+    for (size_t t = 0; t <= max_t; ++t){
+        std::cout << "/////////// "<< "time: " << t << "///////////" << std::endl;
+        for (size_t i = 0; i < all_robots.size(); ++i){
+            std::cout << "robot " << i << std::endl;
+            if (t >= solution[i].trajectory.size()){
+                node_state = solution[i].trajectory.back();    
+            }
+            else {
+                node_state = solution[i].trajectory[t];
+            }
+            const auto transform = all_robots[i]->getTransform(node_state,0);
+            std::cout << transform.translation() << std::endl;
+        }
+    }
+}
+
+// export path to .yaml file
+void export_solutions(const std::vector<LowLevelPlan<AStarNode*,ob::State*, oc::Control*>>& solution, 
+                        const std::vector<std::shared_ptr<Robot>>& robots, std::string outputFile){
+    std::ofstream out(outputFile);
+    std::vector<double> reals;
+    float cost = 0;
+    for (auto& n : solution)
+      cost += n.cost;
+    out << "cost: " << cost << std::endl; 
+    out << "result:" << std::endl;
+    for (size_t i = 0; i < solution.size(); ++i){ 
+        auto si = robots[i]->getSpaceInformation(); 
+        out << "  - states:" << std::endl;
+        for (size_t j = 0; j < solution[i].trajectory.size(); ++j){
+            const auto node_state = solution[i].trajectory[j];
+            out << "      - ";
+            printState(out, si, node_state);
+            out << std::endl;
+        }
+        out << "    actions:" << std::endl;
+        for (size_t j = 0; j < solution[i].actions.size(); ++j){
+            const auto& node_action = solution[i].actions[j];
+            // out << "      # ";
+            out << "      - ";
+            printAction(out, si, node_action);
+            out << std::endl;
+        }
+    }
+}
+
+std::shared_ptr<TrajectoryGeometry> make_trajectory_geometry(
+    std::shared_ptr<Robot> robot,
+    const LowLevelPlan<AStarNode*,ob::State*, oc::Control*>& plan)
+{
+    auto geometry = std::make_shared<TrajectoryGeometry>();
+    geometry->leaves = 1;
+    while (geometry->leaves < plan.trajectory.size()) {
+        geometry->leaves *= 2;
+    }
+    geometry->swept.resize(2 * geometry->leaves);
+    for (size_t t = 0; t < plan.trajectory.size(); ++t) {
+        geometry->objects.emplace_back();
+        geometry->spheres.emplace_back();
+        fcl::AABBf& aabb = geometry->swept[geometry->leaves + t];
+        for (size_t p = 0; p < robot->numParts(); ++p) {
+            // computes the AABB
+            auto obj = new fcl::CollisionObjectf(robot->getCollisionGeometry(p), robot->getTransform(plan.trajectory[t], p));
+            geometry->objects.back().emplace_back(obj);
+            const auto& geom = obj->collisionGeometry();
+            geometry->spheres.back().emplace_back(obj->getTransform() * geom->aabb_center, geom->aabb_radius);
+            aabb += obj->getAABB();
+        }
+    }
+    for (size_t k = geometry->leaves - 1; k > 0; --k) {
+        geometry->swept[k] = geometry->swept[2 * k] + geometry->swept[2 * k + 1];
+    }
+    return geometry;
+}
+
+// AABB of the robot over the timesteps [t0, t1); it stays at its last state
+fcl::AABBf swept_aabb(const TrajectoryGeometry& geometry, size_t t0, size_t t1)
+{
+    const size_t length = geometry.objects.size();
+    t0 = std::min(t0, length - 1);
+    t1 = std::min(t1, length);
+    fcl::AABBf aabb;
+    for (size_t l = t0 + geometry.leaves, r = t1 + geometry.leaves; l < r; l /= 2, r /= 2) {
+        if (l & 1) {
+            aabb += geometry.swept[l++];
+        }
+        if (r & 1) {
+            aabb += geometry.swept[--r];
+        }
+    }
+    return aabb;
+}
+
+bool collide_at(const TrajectoryGeometry& a, const TrajectoryGeometry& b, size_t t, size_t* num_collision_checks)
+{
+    const size_t t_a = std::min(t, a.objects.size() - 1);
+    const size_t t_b = std::min(t, b.objects.size() - 1);
+    for (size_t p = 0; p < a.objects[t_a].size(); ++p) {
+        for (size_t q = 0; q < b.objects[t_b].size(); ++q) {
+            const auto& sphere_a = a.spheres[t_a][p];
+            const auto& sphere_b = b.spheres[t_b][q];
+            const float radii = sphere_a.second + sphere_b.second;
+            if ((sphere_a.first - sphere_b.first).squaredNorm() > radii * radii) {
+                continue;
+            }
+            const auto& obj_a = a.objects[t_a][p];
+            const auto& obj_b = b.objects[t_b][q];
+            if (!obj_a->getAABB().overlap(obj_b->getAABB())) {
+                continue;
+            }
+            fcl::CollisionRequestf request;
+            fcl::CollisionResultf result;
+            fcl::collide(obj_a.get(), obj_b.get(), request, result);
+            if (num_collision_checks) {
+                ++(*num_collision_checks);
+            }
+            if (result.isCollision()) {
+                return true;
+            }
+        }
+    }
+    return false;
+}
+
+// Adds the conflicts in [t0, t1) in order of time. Time windows in which the
+// swept AABBs of the robots do not overlap are skipped.
+void check_window(const TrajectoryGeometry& a, const TrajectoryGeometry& b, size_t t0, size_t t1,
+    PairConflicts& conflicts, size_t* num_collision_checks)
+{
+    // shorter windows are checked timestep by timestep
+    const size_t min_window = 8;
+    if (!swept_aabb(a, t0, t1).overlap(swept_aabb(b, t0, t1))) {
+        return;
+    }
+    if (t1 - t0 > min_window) {
+        const size_t t_mid = t0 + (t1 - t0) / 2;
+        check_window(a, b, t0, t_mid, conflicts, num_collision_checks);
+        check_window(a, b, t_mid, t1, conflicts, num_collision_checks);
+        return;
+    }
+    for (size_t t = t0; t < t1; ++t) {
+        if (collide_at(a, b, t, num_collision_checks)) {
+            if (conflicts.first < 0) {
+                conflicts.first = t;
+            }
+            ++conflicts.count;
+        }
+    }
+}
+
+// Robots that reached their goal stay there
+PairConflicts check_pair(const TrajectoryGeometry& a, const TrajectoryGeometry& b, size_t* num_collision_checks = nullptr)
+{
+    PairConflicts conflicts;
+    check_window(a, b, 0, std::max(a.objects.size(), b.objects.size()), conflicts, num_collision_checks);
+    return conflicts;
+}
+
+// Rechecks the pairs of robots that involve one of the changed robots
+void update_conflicts(
+    const std::vector<std::shared_ptr<const TrajectoryGeometry>>& geometries,
+    const std::vector<size_t>& changed,
+    ConflictTable& table,
+    size_t* num_collision_checks = nullptr)
+{
+    const size_t n = geometries.size();
+    if (table.num_robots != n) {
+        table.num_robots = n;
+        table.pairs.assign(n * n, PairConflicts());
+    }
+    std::vector<bool> is_changed(n, false);
+    for (size_t i : changed) {
+        is_changed[i] = true;
+    }
+    table.num_conflicts = 0;
+    for (size_t i = 0; i < n; ++i) {
+        for (size_t j = i + 1; j < n; ++j) {
+            if (is_changed[i] || is_changed[j]) {
+                table.pairs[i * n + j] = check_pair(*geometries[i], *geometries[j], num_collision_checks);
+            }
+            table.num_conflicts += table.pairs[i * n + j].count;
+        }
+    }
+}
+
+// The earliest conflict of the table (of the first pair of robots, if several
+// conflict at that time)
+bool getEarliestConflict(
+    const ConflictTable& table,
+    const std::vector<std::shared_ptr<const LowLevelPlan<AStarNode*,ob::State*, oc::Control*>>>& solution,
+    const std::vector<std::shared_ptr<Robot>>& all_robots,
+    Conflict& early_conflict)
+{
+    const size_t n = table.num_robots;
+    int first = -1;
+    for (size_t i = 0; i < n; ++i) {
+        for (size_t j = i + 1; j < n; ++j) {
+            const auto& pair = table.pairs[i * n + j];
+            if (pair.first >= 0 && (first < 0 || pair.first < first)) {
+                first = pair.first;
+                early_conflict.robot_idx_i = i;
+                early_conflict.robot_idx_j = j;
+            }
+        }
+    }
+    if (first < 0) {
+        return false;
+    }
+    const auto& trajectory_i = solution[early_conflict.robot_idx_i]->trajectory;
+    const auto& trajectory_j = solution[early_conflict.robot_idx_j]->trajectory;
+    early_conflict.time = first * all_robots[0]->dt();
+    early_conflict.robot_state_i = trajectory_i[std::min<size_t>(first, trajectory_i.size() - 1)];
+    early_conflict.robot_state_j = trajectory_j[std::min<size_t>(first, trajectory_j.size() - 1)];
+    return true;
+}
+
+// Constraints from Conflicts
+void createConstraintsFromConflicts(const Conflict& early_conflict, std::map<size_t, std::vector<Constraint>>& constraints){
+    constraints[early_conflict.robot_idx_i].push_back({early_conflict.time, early_conflict.robot_state_i});
+    constraints[early_conflict.robot_idx_j].push_back({early_conflict.time, early_conflict.robot_state_j});
+}
+
+void export_joint_solutions(const std::vector<LowLevelPlan<AStarNode*,ob::State*, oc::Control*>>& solution, 
+                        const std::vector<std::shared_ptr<Robot>>& robots, std::string outputFile){
+    std::ofstream out(outputFile);
+    std::vector<double> reals;
+    ob::State *node_state;
+    oc::Control *node_action;
+    float cost = 0;
+    size_t max_t = 0;
+    size_t max_a = 0;
+    for (auto& sol : solution){
+      cost += sol.cost;
+      max_t = std::max(max_t, sol.trajectory.size());
+      max_a = std::max(max_a, sol.actions.size());
+    }
+
+    out << "cost: " << cost << std::endl; 
+    out << "result:" << std::endl;
+    out << "  - states:" << std::endl;
+    std::vector<double> joint_state;
+    std::vector<double> joint_action;
+    std::vector<double> last_state;
+    for (size_t t = 0; t < max_t; ++t){
+        out << "      - [";
+        for (size_t i = 0; i < robots.size(); ++i){
+            std::vector<double> reals;
+            auto si = robots[i]->getSpaceInformation(); 
+            if (t >= solution[i].trajectory.size()){
+                node_state = solution[i].trajectory.back();    
+            }
+            else {
+                node_state = solution[i].trajectory[t];
+            }
+            si->getStateSpace()->copyToReals(reals, node_state);
+            joint_state.insert(joint_state.end(), reals.begin(), reals.end());
+        }
+        for (size_t k = 0; k < joint_state.size(); ++k) {
+                out << joint_state[k];
+                if (k < joint_state.size() - 1) {
+                    out << ",";
+                }
+        }
+        out << "]" << std::endl;
+        joint_state.clear();
+
+    }
+
+    // for the action
+    out << "    actions:" << std::endl;
+    for (size_t t = 0; t < max_a; ++t){
+        out << "      - ";
+        out << "[";
+        for (size_t i = 0; i < robots.size(); ++i){
+            std::vector<double> reals;
+            auto si = robots[i]->getSpaceInformation(); 
+            const size_t dim = si->getControlSpace()->getDimension();
+            if (t >= solution[i].actions.size()){
+                if (solution[i].actions.size() > 0) {
+                    node_action = solution[i].actions.back();
+                } else {
+                    node_action = nullptr;
+                }
+            }
+            else {
+                node_action = solution[i].actions[t];
+            }
+            for (size_t d = 0; d < dim; ++d)
+            {
+                if (node_action) {
+                    double *address = si->getControlSpace()->getValueAddressAtIndex(node_action, d);
+                    reals.push_back(*address);
+                } else {
+                    reals.push_back(0);
+                }
+            }
+            joint_action.insert(joint_action.end(), reals.begin(), reals.end());
+        }
+        for (size_t k = 0; k < joint_action.size(); ++k) {
+                out << joint_action[k];
+                if (k < joint_action.size() - 1) {
+                    out << ",";
+                }
+        }
+        out << "]" << std::endl;
+        joint_action.clear();
+    }
+
+    
+}
+
+#define dynobench_base "../dynoplan/dynobench/"
+
+// Problem description (environment, robots, start and goal states)
+struct Problem {
+    std::vector<fcl::CollisionObjectf *> obstacles;
+    std::vector<double> env_min;
+    std::vector<double> env_max;
+    fcl::AABBf workspace_aabb;
+    std::vector<std::shared_ptr<Robot>> robots;
+    std::vector<std::vector<double>> starts;
+    std::vector<std::vector<double>> goals;
+    std::vector<std::string> robot_types;
+};
+
+void load_problem(const YAML::Node& env, Problem& problem)
+{
+    for (const auto &obs : env["environment"]["obstacles"])
+    {
+        if (obs["type"].as<std::string>() == "box"){
+            const auto &size = obs["size"];
+            std::shared_ptr<fcl::CollisionGeometryf> geom;
+            geom.reset(new fcl::Boxf(size[0].as<float>(), size[1].as<float>(), 1.0));
+            const auto &center = obs["center"];
+            auto co = new fcl::CollisionObjectf(geom);
+            co->setTranslation(fcl::Vector3f(center[0].as<float>(), center[1].as<float>(), 0));
+            co->computeAABB();
+            problem.obstacles.push_back(co);
+        }
+        else {
+        throw std::runtime_error("Unknown obstacle type!");
+        }
+    }
+    const auto &env_min = env["environment"]["min"];
+    const auto &env_max = env["environment"]["max"];
+    ob::RealVectorBounds position_bounds(env_min.size());
+    for (size_t i = 0; i < env_min.size(); ++i) {
+        position_bounds.setLow(i, env_min[i].as<double>());
+        position_bounds.setHigh(i, env_max[i].as<double>());
+        problem.env_min.push_back(env_min[i].as<double>());
+        problem.env_max.push_back(env_max[i].as<double>());
+    }
+
+    problem.workspace_aabb = fcl::AABBf(
+        fcl::Vector3f(env_min[0].as<double>(),
+        env_min[1].as<double>(),-1),
+        fcl::Vector3f(env_max[0].as<double>(), env_max[1].as<double>(), 1));
+
+    for (const auto &robot_node : env["robots"]) {
+        auto robotType = robot_node["type"].as<std::string>();
+        std::shared_ptr<Robot> robot = create_robot(robotType, position_bounds);
+        problem.robots.push_back(robot);
+
+        std::vector<double> start_reals;
+        for (const auto& v : robot_node["start"]) {
+            start_reals.push_back(v.as<double>());
+        }
+        problem.starts.push_back(start_reals);
+
+        std::vector<double> goal_reals;
+        for (const auto& v : robot_node["goal"]) {
+            goal_reals.push_back(v.as<double>());
+        }
+        problem.goals.push_back(goal_reals);
+        problem.robot_types.push_back(robotType);
+    }
+}
+
+std::string motions_file(const std::string& robotType, const std::string& motionsPath)
+{
+    if (robotType == "unicycle_first_order_0" || robotType == "unicycle_first_order_0_sphere") {
+        return motionsPath + "/unicycle_first_order_0_sorted.msgpack";
+    } else if (robotType == "unicycle_second_order_0") {
+        return motionsPath + "/unicycle_second_order_0_sorted.msgpack";
+    } else if (robotType == "double_integrator_0") {
+        return motionsPath + "/double_integrator_0_sorted.msgpack";
+    } else if (robotType == "car_first_order_with_1_trailers_0") {
+        return motionsPath + "/car_first_order_with_1_trailers_0_sorted.msgpack";
+    }
+    throw std::runtime_error("Unknown motion filename for this robottype!");
+}
+
+// loads the motions of all robot types of the problem that are not in robot_motions yet
+void load_robot_motions(const Problem& problem, const std::string& motionsPath, std::map<std::string, Motions>& robot_motions)
+{
+    for (size_t i = 0; i < problem.robots.size(); ++i) {
+        const auto& robotType = problem.robot_types[i];
+        auto iter = robot_motions.find(robotType);
+        if (iter == robot_motions.end()) {
+            std::string motionsFile = motions_file(robotType, motionsPath);
+            load_motions_cached(motionsFile, problem.robots[i], robotType, problem.env_min.size(), robot_motions[robotType]);
+
+            std::cout << "loaded motions for " << robotType << std::endl;
+        }
+    }
+}
+
+struct SolveStats {
+    // delta iterations that were started
+    size_t iterations = 0;
+    // HL expansions of the last iteration
+    size_t hl_expansions = 0;
+    float discrete_cost = 0;
+    // time until the (last) discrete solution was found and spent in the optimization (s)
+    double t_discrete = 0;
+    double t_optimization = 0;
+    // time spent building the reverse-search heuristics (s)
+    double t_heuristic = 0;
+    double t_total = 0;
+    // cost of the optimized solution
+    float cost = 0;
+    // time per phase and counters, in total and per delta iteration. Phases are
+    // motion_loading (by the caller), heuristic, motion_filtering, root_planning,
+    // hl_search (incl. conflict_checks and low_level) and optimization
+    PhaseStats phases;
+};
+
+// Outcome of a low-level search that ran on the thread pool
+struct LowLevelRun {
+    bool success;
+    size_t num_expansions;
+    size_t num_collision_checks;
+};
+
+// Runs db-CBS until the optimization finds a feasible solution or the time limit
+// (s, none if <= 0) is exceeded. The motions are only enabled/disabled, so the
+// same robot_motions can be used for many problems.
+// The root plans of the robots and the replans of the children of a HL node run
+// concurrently on cfg["threads"] threads (default: all cores). The replans of a
+// delta iteration are cached (cfg["ll_cache_size"] plans, default 10000, 0
+// disables the cache).
+// The discrete solution is written to outputFile (and jointFile, if not empty),
+// the optimized one to optimizationFile.
+bool solve_db_cbs(
+    const std::string& inputFile,
+    const std::string& outputFile,
+    const std::string& jointFile,
+    const std::string& optimizationFile,
+    const YAML::Node& cfg,
+    const Problem& problem,
+    std::map<std::string, Motions>& robot_motions,
+    EventLog& events,
+    double timelimit,
+    SolveStats& stats)
+{
+    const auto t_start = std::chrono::steady_clock::now();
+    auto elapsed = [&t_start]() {
+        return std::chrono::duration<double>(std::chrono::steady_clock::now() - t_start).count();
+    };
+    auto timed_out = [&]() {
+        return timelimit > 0 && elapsed() > timelimit;
+    };
+    auto seconds_since = [](std::chrono::steady_clock::time_point t) {
+        return std::chrono::duration<double>(std::chrono::steady_clock::now() - t).count();
+    };
+    auto& phases = stats.phases;
+
+    float alpha = cfg["alpha"].as<float>();
+    bool filter_duplicates = cfg["filter_duplicates"].as<bool>();
+
+    const auto& robots = problem.robots;
+    const auto& robot_types = problem.robot_types;
+    const auto& starts = problem.starts;
+    const auto& goals = problem.goals;
+    const auto& obstacles = problem.obstacles;
+    const auto& workspace_aabb = problem.workspace_aabb;
+
+    // the low-level searches only read the space information of the robots
+    for (const auto& robot : robots) {
+        setup_space_information(robot, obstacles);
+    }
+
+    size_t num_threads = cfg["threads"] ? cfg["threads"].as<size_t>() : std::thread::hardware_concurrency();
+    // at most one search per robot runs at a time; a single thread plans inline
+    num_threads = std::min(num_threads, robots.size());
+    ThreadPool pool(num_threads > 1 ? num_threads : 0);
+
+    // Heuristic computation
+    // the arenas of the reverse searches, which hold the heuristic trees
+    std::vector<std::shared_ptr<SearchArena>> heuristics(robots.size());
+
+    if (cfg["heuristic1"].as<std::string>() == "reverse-search") {
+        const auto t_heuristic = std::chrono::steady_clock::now();
+        ScopedTimer timer(phases, "heuristic");
+        // disable/enable motions
+        for (auto& iter : robot_motions) {
+            for (size_t i = 0; i < robot_types.size(); ++i) {
+                if (iter.first == robot_types[i]) {
+                    disable_motions(robots[i], cfg["heuristic1_delta"].as<float>(), filter_duplicates, alpha, 99999, iter.second);
+                    break;
+                }
+            }
+        }
+
+        // one reverse search per robot type and goal; the searches run concurrently
+        const float heuristic_delta = cfg["heuristic1_delta"].as<float>();
+        std::map<std::pair<std::string, std::vector<double>>, size_t> searched;
+        std::vector<size_t> source(robots.size());
+        std::vector<std::future<LowLevelRun>> runs(robots.size());
+        for (size_t i = 0; i < robots.size(); ++i) {
+            auto iter = searched.emplace(std::make_pair(robot_types[i], goals[i]), i).first;
+            source[i] = iter->second;
+            if (source[i] != i) {
+                continue;
+            }
+            runs[i] = pool.submit([&, i]() {
+                DBAstar<Constraint> llplanner(heuristic_delta, alpha);
+                LowLevelPlan<AStarNode*,ob::State*,oc::Control*> ll_result;
+                std::vector<double> v_nanf(starts[i].size(), nanf(""));
+                bool success = llplanner.search(robot_motions.at(robot_types[i]), v_nanf, goals[i],
+                    obstacles, workspace_aabb, robots[i], {}, /*reverse_search*/true, ll_result, nullptr, &heuristics[i]);
+                return LowLevelRun{success, llplanner.num_expansions, llplanner.num_collision_checks};
+            });
+        }
+        for (size_t i = 0; i < robots.size(); ++i) {
+            if (source[i] != i) {
+                heuristics[i] = heuristics[source[i]];
+                std::cout << "using the heuristic of robot " << source[i] << " for robot " << i << "." << std::endl;
+                events.emit("heuristic", {{"robot", i}, {"entries", heuristics[i]->T_n->size()}, {"shared_with", source[i]}});
+                continue;
+            }
+            const LowLevelRun run = runs[i].get();
+            phases.count("heuristic_expansions", run.num_expansions);
+            phases.count("fcl_collision_calls", run.num_collision_checks);
+            std::cout << "computed heuristic with " << heuristics[i]->T_n->size() << " entries." << std::endl;
+            events.emit("heuristic", {{"robot", i}, {"entries", heuristics[i]->T_n->size()}});
+        }
+        phases.count("heuristic_searches", searched.size());
+        stats.t_heuristic = seconds_since(t_heuristic);
+        std::cout << "computed " << searched.size() << " heuristics in " << stats.t_heuristic << " s." << std::endl;
+    }
+
+    // actual search
+
+    float delta = cfg["delta_0"].as<float>();
+    size_t max_motions = cfg["num_primitives_0"].as<size_t>();
+    bool solved_db = false;
+
+    // low-level plans of the children in the current delta iteration (other
+    // deltas and motions give other plans)
+    LRUCache<LowLevelQuery, CachedPlan, LowLevelQueryHash> ll_cache(
+        cfg["ll_cache_size"] ? cfg["ll_cache_size"].as<size_t>() : 10000);
+
+    // plans for robot i with the current delta; runs on the thread pool
+    auto low_level = [&](size_t i, const std::vector<Constraint>& constraints,
+                         LowLevelPlan<AStarNode*,ob::State*,oc::Control*>& ll_result) {
+        DBAstar<Constraint> llplanner(delta, alpha);
+        bool success = llplanner.search(robot_motions.at(robot_types[i]), starts[i], goals[i],
+            obstacles, workspace_aabb, robots[i], constraints, /*reverse_search*/false, ll_result,
+            heuristics[i] ? heuristics[i]->T_n.get() : nullptr);
+        return LowLevelRun{success, llplanner.num_expansions, llplanner.num_collision_checks};
+    };
+
+    for (size_t iteration = 0; ; ++iteration) {
+        // the stats of the previous iterations
+        phases.checkpoint();
+        if (timed_out()) {
+            break;
+        }
+        stats.iterations = iteration + 1;
+
+        if (iteration > 0) {
+            if (solved_db) {
+                delta *= cfg["delta_rate"].as<float>();
+            } else {
+                delta *= 0.99;
+            }
+            max_motions *= cfg["num_primitives_rate"].as<float>();
+            max_motions = std::min<size_t>(max_motions, 1e6);
+        }
+
+        std::cout << "Search with delta=" << delta << " and motions=" << max_motions << std::endl;
+        events.emit("delta_iteration", {{"iteration", iteration}, {"delta", delta}, {"motions", max_motions}});
+        phases.beginIteration(delta, max_motions);
+        ll_cache.clear();
+
+        // disable/enable motions
+        {
+            ScopedTimer timer(phases, "motion_filtering");
+            for (auto& iter : robot_motions) {
+                for (size_t i = 0; i < robot_types.size(); ++i) {
+                    if (iter.first == robot_types[i]) {
+                        disable_motions(robots[i], delta, filter_duplicates, alpha, max_motions, iter.second);
+                        break;
+                    }
+                }
+            }
+        }
+
+        solved_db = false;
+        HighLevelNode start;
+        
+        start.solution.resize(robots.size());
+        start.constraints.resize(robots.size());
+        start.geometries.resize(robots.size());
+        start.cost = 0;
+        start.id = 0;
+        bool start_node_valid = true;
+        const auto t_root = std::chrono::steady_clock::now();
+        const std::vector<Constraint> no_constraints;
+        std::vector<LowLevelPlan<AStarNode*, ob::State*, oc::Control*>> root_plans(robots.size());
+        std::vector<std::future<LowLevelRun>> root_runs;
+        for (size_t i = 0; i < robots.size(); ++i) {
+            root_runs.push_back(pool.submit([&, i]() {
+                return low_level(i, no_constraints, root_plans[i]);
+            }));
+        }
+        for (size_t i = 0; i < robots.size(); ++i) {
+            const LowLevelRun run = root_runs[i].get();
+            start.solution[i] = std::make_shared<LowLevelPlan<AStarNode*, ob::State*, oc::Control*>>(std::move(root_plans[i]));
+            phases.count("ll_calls");
+            phases.count("ll_expansions", run.num_expansions);
+            phases.count("fcl_collision_calls", run.num_collision_checks);
+            if (!start_node_valid) {
+                continue;
+            }
+            if (!run.success) {
+                std::cout << "Couldn't find initial solution for robot " << i << "." << std::endl;
+                events.emit("root_low_level", {{"robot", i}, {"success", 0}});
+                start_node_valid = false;
+                continue;
+            }
+            events.emit("root_low_level", {{"robot", i}, {"success", 1}, {"cost", start.solution[i]->cost}});
+
+            start.cost += start.solution[i]->cost;
+            std::cout << "High Level Node Cost: " << start.cost << std::endl;
+        } 
+        phases.addTime("root_planning", seconds_since(t_root));
+        if (!start_node_valid) {
+            continue;
+        }
+        for (size_t i = 0; i < robots.size(); ++i) {
+            start.stale.push_back(i);
+        }
+        events.emit("root_node", {{"cost", start.cost}});
+        
+        typename boost::heap::d_ary_heap<HighLevelNode, boost::heap::arity<2>,
+                                        boost::heap::mutable_<true> > open;
+        auto handle = open.push(start);
+        (*handle).handle = handle;
+        int id = 1;
+
+        size_t expands = 0;
+        // the HL search time excludes the optimization
+        const auto t_hl = std::chrono::steady_clock::now();
+        double t_hl_optimization = 0;
+        while (!open.empty()) {
+            if (timed_out()) {
+                break;
+            }
+            HighLevelNode P = open.top();
+            open.pop();
+            Conflict inter_robot_conflict;
+            bool has_conflict;
+            {
+                // only the pairs with a replanned robot are checked again
+                ScopedTimer timer(phases, "conflict_checks");
+                size_t num_collision_checks = 0;
+                auto conflicts = P.conflicts ? std::make_shared<ConflictTable>(*P.conflicts) : std::make_shared<ConflictTable>();
+                for (size_t i : P.stale) {
+                    P.geometries[i] = make_trajectory_geometry(robots[i], *P.solution[i]);
+                }
+                update_conflicts(P.geometries, P.stale, *conflicts, &num_collision_checks);
+                P.conflicts = conflicts;
+                P.stale.clear();
+                has_conflict = getEarliestConflict(*P.conflicts, P.solution, robots, inter_robot_conflict);
+                phases.count("fcl_collision_calls", num_collision_checks);
+            }
+            if (!has_conflict) {
+                solved_db = true;
+                std::cout << "Final solution! cost: " << P.cost << std::endl;
+                events.emit("discrete_solution", {{"iteration", iteration}, {"cost", P.cost}, {"expands", expands}});
+                stats.hl_expansions = expands;
+                stats.discrete_cost = P.cost;
+                stats.t_discrete = elapsed();
+                const auto solution = collect_plans(P);
+                export_solutions(solution, robots, outputFile);
+                if (!jointFile.empty()) {
+                    export_joint_solutions(solution, robots, jointFile);
+                }
+
+                std::cout << "warning: using new multirobot optimization" << std::endl;
+            
+                const bool sum_robot_cost = true;
+                events.emit("optimization_start");
+                const auto t_optimization = std::chrono::steady_clock::now();
+                bool feasible = execute_optimizationMultiRobot(inputFile,
+                                                    outputFile, 
+                                                    optimizationFile,
+                                                    dynobench_base,
+                                                    sum_robot_cost);
+                t_hl_optimization += seconds_since(t_optimization);
+                phases.addTime("optimization", seconds_since(t_optimization));
+                events.emit("optimization_end", {{"feasible", feasible}});
+                stats.t_optimization = elapsed() - stats.t_discrete;
+                if (feasible) {
+                    phases.addTime("hl_search", seconds_since(t_hl) - t_hl_optimization);
+                    YAML::Node result = YAML::LoadFile(optimizationFile);
+                    size_t i = 0;
+                    for (const auto& r : result["result"]) {
+                        stats.cost += r["actions"].size() * robots[i]->dt();
+                        ++i;
+                    }
+                    phases.set("cost", stats.cost);
+                    phases.set("discrete_cost", stats.discrete_cost);
+                    stats.t_total = elapsed();
+                    phases.checkpoint();
+                    return true;
+                }
+
+                break;
+            }
+
+            ++expands;
+            stats.hl_expansions = expands;
+            phases.count("hl_expansions");
+            if (expands % 100 == 0) {
+                std::cout << "HL expanded: " << expands << " open: " << open.size() << " cost " << P.cost << " conflict at " << inter_robot_conflict.time << " conflicts " << P.conflicts->num_conflicts << std::endl;
+                events.emit("hl_expansions", {{"expands", expands}, {"open", open.size()}, {"cost", P.cost}, {"conflicts", P.conflicts->num_conflicts}, {"rss", current_rss()}});
+            }
+        
+            std::map<size_t, std::vector<Constraint>> constraints;
+            createConstraintsFromConflicts(inter_robot_conflict, constraints);
+            std::vector<HighLevelNode> children;
+            std::vector<size_t> replanned;
+            std::vector<std::vector<Constraint>> child_constraints;
+            for (const auto& c : constraints){
+                children.push_back(P);
+                HighLevelNode& newNode = children.back();
+                size_t i = c.first;
+                for (const auto& constraint : c.second) {
+                    newNode.constraints[i] = add_constraint(robots[i]->getSpaceInformation(), constraint, newNode.constraints[i]);
+                }
+                newNode.cost -= newNode.solution[i]->cost;
+                newNode.stale = {i};
+                replanned.push_back(i);
+                child_constraints.push_back(collect_constraints(newNode.constraints[i]));
+#ifdef DBG_PRINTS
+                std::cout << "New node cost: " << newNode.cost << std::endl;
+#endif
+            }
+
+            // run the low level planner for all children at once, unless the
+            // query was answered before
+            std::vector<LowLevelRun> runs(children.size());
+            std::vector<bool> cached(children.size(), false);
+            std::vector<LowLevelPlan<AStarNode*, ob::State*, oc::Control*>> plans(children.size());
+            {
+                ScopedTimer timer(phases, "low_level");
+                std::vector<LowLevelQuery> queries;
+                std::vector<std::future<LowLevelRun>> futures(children.size());
+                for (size_t k = 0; k < children.size(); ++k) {
+                    const size_t i = replanned[k];
+                    queries.push_back(make_low_level_query(i, robots[i], child_constraints[k]));
+                    const CachedPlan* hit = ll_cache.get(queries[k]);
+                    if (hit) {
+                        children[k].solution[i] = hit->plan;
+                        runs[k] = LowLevelRun{hit->success, 0, 0};
+                        cached[k] = true;
+                        continue;
+                    }
+                    futures[k] = pool.submit([&, k, i]() {
+                        return low_level(i, child_constraints[k], plans[k]);
+                    });
+                }
+                for (size_t k = 0; k < children.size(); ++k) {
+                    if (!cached[k]) {
+                        runs[k] = futures[k].get();
+                        children[k].solution[replanned[k]] = std::make_shared<LowLevelPlan<AStarNode*, ob::State*, oc::Control*>>(std::move(plans[k]));
+                        ll_cache.put(queries[k], CachedPlan{runs[k].success, children[k].solution[replanned[k]]});
+                    }
+                }
+            }
+
+            // in the same order (and with the same ids) as a sequential replan
+            for (size_t k = 0; k < children.size(); ++k) {
+                HighLevelNode& newNode = children[k];
+                const size_t i = replanned[k];
+                if (cached[k]) {
+                    phases.count("ll_cache_hits");
+                } else {
+                    phases.count("ll_cache_misses");
+                    phases.count("ll_calls");
+                    phases.count("ll_expansions", runs[k].num_expansions);
+                    phases.count("fcl_collision_calls", runs[k].num_collision_checks);
+                }
+
+                if (runs[k].success) {
+                    newNode.id = id;
+                    newNode.cost += newNode.solution[i]->cost;
+#ifdef DBG_PRINTS
+                    std::cout << "Node ID is " << id << std::endl;
+                    std::cout << "Updated New node cost: " << newNode.cost << std::endl;
+#endif
+                    //   print_solution(newNode.solution, robots);
+
+                    auto handle = open.push(newNode);
+                    (*handle).handle = handle;
+                    
+                    id++;
+                }
+            }
+        }
+        phases.addTime("hl_search", seconds_since(t_hl) - t_hl_optimization);
+    }
+
+    stats.t_total = elapsed();
+    // stopped at the time limit, rather than failed
+    phases.set("timed_out", timed_out());
+    phases.checkpoint();
+    return false;
+}
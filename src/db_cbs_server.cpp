@@ -0,0 +1,173 @@
+#include <iostream>
+#include <fstream>
+#include <cerrno>
+#include <csignal>
+#include <cstring>
+#include <boost/program_options.hpp>
+#include <yaml-cpp/yaml.h>
+
+// Unix domain sockets
+#include <sys/socket.h>
+#include <sys/un.h>
+#include <unistd.h>
+
+#include "db_cbs.hpp"
+
+// Keeps the motions of all robot types that were used so far loaded, and
+// solves the problems sent to it over a Unix domain socket, one at a time.
+//
+// A client connects, sends a request (yaml or json) and closes its write end:
+//   {env: env.yaml, cfg: {...}, output: result_dbcbs.yaml, joint: dbcbs_joint.yaml,
+//    optimization: result_dbcbs_opt.yaml, timelimit: 300, progress: progress.jsonl,
+//    stats: dbcbs_stats.yaml}
+// (joint, timelimit, progress and stats are optional). The server answers with
+//   {feasible: true, timed_out: false, cost: 12.3, stats: {iterations: 2, ...}}
+// or {error: "..."} and closes the connection.
+
+YAML::Node handle_request(
+    const std::string& request,
+    const std::string& motionsPath,
+    std::map<std::string, Motions>& robot_motions)
+{
+    YAML::Node req = YAML::Load(request);
+    const std::string inputFile = req["env"].as<std::string>();
+    const std::string jointFile = req["joint"] ? req["joint"].as<std::string>() : "";
+    const double timelimit = req["timelimit"] ? req["timelimit"].as<double>() : 0;
+
+    EventLog events;
+    if (req["progress"]) {
+      events.open(req["progress"].as<std::string>());
+    }
+
+    YAML::Node env = YAML::LoadFile(inputFile);
+    Problem problem;
+    load_problem(env, problem);
+
+    SolveStats stats;
+    if (req["stats"]) {
+      stats.phases.setOutput(req["stats"].as<std::string>());
+    }
+    {
+        ScopedTimer timer(stats.phases, "motion_loading");
+        load_robot_motions(problem, motionsPath, robot_motions);
+    }
+    bool feasible = solve_db_cbs(inputFile, req["output"].as<std::string>(), jointFile,
+        req["optimization"].as<std::string>(), req["cfg"], problem, robot_motions, events, timelimit, stats);
+
+    YAML::Node response;
+    response["feasible"] = feasible;
+    response["timed_out"] = !feasible && timelimit > 0 && stats.t_total > timelimit;
+    response["cost"] = stats.cost;
+    response["stats"]["iterations"] = stats.iterations;
+    response["stats"]["hl_expansions"] = stats.hl_expansions;
+    response["stats"]["discrete_cost"] = stats.discrete_cost;
+    response["stats"]["t_discrete"] = stats.t_discrete;
+    response["stats"]["t_heuristic"] = stats.t_heuristic;
+    response["stats"]["t_optimization"] = stats.t_optimization;
+    response["stats"]["t_total"] = stats.t_total;
+    return response;
+}
+
+int main(int argc, char* argv[]) {
+
+    namespace po = boost::program_options;
+    // Declare the supported options.
+    po::options_description desc("Allowed options");
+    std::string socketFile;
+    std::string motionsPath;
+    std::vector<std::string> warmupFiles;
+
+    desc.add_options()
+      ("help", "produce help message")
+      ("socket,s", po::value<std::string>(&socketFile)->required(), "socket to listen on")
+      ("motions", po::value<std::string>(&motionsPath)->default_value("../motions"), "folder with the motion primitives")
+      ("warmup", po::value<std::vector<std::string>>(&warmupFiles)->multitoken(), "load the motions for these problems (yaml) at startup");
+
+    try {
+      po::variables_map vm;
+      po::store(po::parse_command_line(argc, argv, desc), vm);
+      po::notify(vm);
+
+      if (vm.count("help") != 0u) {
+        std::cout << desc << "\n";
+        return 0;
+      }
+    } catch (po::error& e) {
+      std::cerr << e.what() << std::endl << std::endl;
+      std::cerr << desc << std::endl;
+      return 1;
+    }
+
+    // a client that went away must not kill the server
+    signal(SIGPIPE, SIG_IGN);
+
+    std::map<std::string, Motions> robot_motions;
+    for (const auto& warmupFile : warmupFiles) {
+        Problem problem;
+        load_problem(YAML::LoadFile(warmupFile), problem);
+        load_robot_motions(problem, motionsPath, robot_motions);
+    }
+
+    int server = socket(AF_UNIX, SOCK_STREAM, 0);
+    if (server < 0) {
+        perror("socket");
+        return 1;
+    }
+    sockaddr_un addr = {};
+    addr.sun_family = AF_UNIX;
+    if (socketFile.size() >= sizeof(addr.sun_path)) {
+        std::cerr << "socket path too long: " << socketFile << std::endl;
+        return 1;
+    }
+    strncpy(addr.sun_path, socketFile.c_str(), sizeof(addr.sun_path) - 1);
+    unlink(socketFile.c_str());
+    if (bind(server, (sockaddr*)&addr, sizeof(addr)) < 0 || listen(server, 16) < 0) {
+        perror("bind");
+        return 1;
+    }
+    std::cout << "listening on " << socketFile << std::endl;
+
+    while (true) {
+        int client = accept(server, nullptr, nullptr);
+        if (client < 0) {
+            if (errno == EINTR) {
+                continue;
+            }
+            perror("accept");
+            break;
+        }
+
+        // read the request until the client closes its write end
+        std::string request;
+        char buffer[4096];
+        ssize_t n;
+        while ((n = read(client, buffer, sizeof(buffer))) > 0) {
+            request.append(buffer, n);
+        }
+
+        YAML::Node response;
+        try {
+            response = handle_request(request, motionsPath, robot_motions);
+        } catch (const std::exception& e) {
+            std::cerr << "request failed: " << e.what() << std::endl;
+            response["error"] = e.what();
+        }
+
+        YAML::Emitter out;
+        out << response;
+        const std::string answer = out.c_str();
+        size_t written = 0;
+        while (written < answer.size()) {
+            n = write(client, answer.c_str() + written, answer.size() - written);
+            if (n <= 0) {
+                break;
+            }
+            written += n;
+        }
+        close(client);
+    }
+
+    close(server);
+    unlink(socketFile.c_str());
+    return 0;
+}
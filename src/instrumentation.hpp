@@ -0,0 +1,180 @@
+#pragma once
+
+#include <chrono>
+#include <cmath>
+#include <cstdio>
+#include <fstream>
+#include <initializer_list>
+#include <map>
+#include <string>
+#include <utility>
+#include <vector>
+#include <unistd.h>
+
+// Writes progress events as JSON lines, so that a solver run can be followed
+// while it is running, e.g.
+// {"t": 0.52, "event": "hl_expansions", "expands": 100, "open": 57, "cost": 12.3}
+// t is the time since the log was created (s). Without open(), emit is a no-op.
+class EventLog
+{
+public:
+  EventLog()
+    : start_(std::chrono::steady_clock::now())
+  {
+  }
+
+  void open(const std::string& filename)
+  {
+    out_.open(filename);
+  }
+
+  void emit(const std::string& event, std::initializer_list<std::pair<const char*, double>> fields = {})
+  {
+    if (!out_.is_open()) {
+      return;
+    }
+    const auto now = std::chrono::steady_clock::now();
+    const double t = std::chrono::duration<double>(now - start_).count();
+    out_ << "{\"t\": " << t << ", \"event\": \"" << event << "\"";
+    for (const auto& field : fields) {
+      out_ << ", \"" << field.first << "\": ";
+      // JSON has no inf or nan (e.g. the cost before a solution is found)
+      if (std::isfinite(field.second)) {
+        out_ << field.second;
+      } else {
+        out_ << "null";
+      }
+    }
+    // flush after every event, so that readers can tail the file
+    out_ << "}" << std::endl;
+  }
+
+private:
+  std::chrono::steady_clock::time_point start_;
+  std::ofstream out_;
+};
+
+// Time spent per phase (s) and counters of a solver run, in total and per
+// delta iteration. If an output file is set, checkpoint() (re)writes it as
+// yaml, so that a run that is killed still leaves the stats of its completed
+// iterations behind.
+class PhaseStats
+{
+public:
+  void setOutput(const std::string& filename)
+  {
+    filename_ = filename;
+  }
+
+  void addTime(const std::string& phase, double seconds)
+  {
+    times_[phase] += seconds;
+    if (!iterations_.empty()) {
+      iterations_.back().times[phase] += seconds;
+    }
+  }
+
+  void count(const std::string& counter, size_t n = 1)
+  {
+    counters_[counter] += n;
+    if (!iterations_.empty()) {
+      iterations_.back().counters[counter] += n;
+    }
+  }
+
+  // times and counters are also accounted to this iteration from now on
+  void beginIteration(double delta, size_t motions)
+  {
+    iterations_.push_back({delta, motions, {}, {}});
+  }
+
+  void set(const std::string& key, double value)
+  {
+    values_[key] = value;
+  }
+
+  void checkpoint() const
+  {
+    if (filename_.empty()) {
+      return;
+    }
+    // write to a temporary file first, so that readers never see a partial file
+    const std::string tmp = filename_ + ".tmp";
+    {
+      std::ofstream out(tmp);
+      for (const auto& v : values_) {
+        out << v.first << ": " << v.second << std::endl;
+      }
+      write(out, "", times_, counters_);
+      out << "iterations:" << std::endl;
+      for (const auto& it : iterations_) {
+        out << "  - delta: " << it.delta << std::endl;
+        out << "    motions: " << it.motions << std::endl;
+        write(out, "    ", it.times, it.counters);
+      }
+    }
+    std::rename(tmp.c_str(), filename_.c_str());
+  }
+
+private:
+  struct Iteration {
+    double delta;
+    size_t motions;
+    std::map<std::string, double> times;
+    std::map<std::string, size_t> counters;
+  };
+
+  static void write(std::ofstream& out, const std::string& indent,
+    const std::map<std::string, double>& times, const std::map<std::string, size_t>& counters)
+  {
+    out << indent << "time:" << (times.empty() ? " {}" : "") << std::endl;
+    for (const auto& t : times) {
+      out << indent << "  " << t.first << ": " << t.second << std::endl;
+    }
+    out << indent << "counters:" << (counters.empty() ? " {}" : "") << std::endl;
+    for (const auto& c : counters) {
+      out << indent << "  " << c.first << ": " << c.second << std::endl;
+    }
+  }
+
+  std::string filename_;
+  std::map<std::string, double> values_;
+  std::map<std::string, double> times_;
+  std::map<std::string, size_t> counters_;
+  std::vector<Iteration> iterations_;
+};
+
+// Adds the time between construction and destruction to a phase
+class ScopedTimer
+{
+public:
+  ScopedTimer(PhaseStats& stats, const std::string& phase)
+    : stats_(stats)
+    , phase_(phase)
+    , start_(std::chrono::steady_clock::now())
+  {
+  }
+
+  ~ScopedTimer()
+  {
+    const auto now = std::chrono::steady_clock::now();
+    stats_.addTime(phase_, std::chrono::duration<double>(now - start_).count());
+  }
+
+private:
+  PhaseStats& stats_;
+  std::string phase_;
+  std::chrono::steady_clock::time_point start_;
+};
+
+// Resident set size of this process (MiB), 0 where /proc is not available
+inline double current_rss()
+{
+  std::ifstream statm("/proc/self/statm");
+  size_t size = 0;
+  size_t resident = 0;
+  if (!(statm >> size >> resident)) {
+    return 0;
+  }
+  return resident * (double)sysconf(_SC_PAGESIZE) / (1024 * 1024);
+}
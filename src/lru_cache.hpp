@@ -0,0 +1,65 @@
+#pragma once
+
+#include <functional>
+#include <list>
+#include <unordered_map>
+#include <utility>
+
+// Map with a maximum number of entries; adding to a full cache evicts the
+// least recently used entry. A capacity of 0 disables the cache.
+template <typename Key, typename Value, typename Hash = std::hash<Key>>
+class LRUCache
+{
+public:
+  explicit LRUCache(size_t capacity)
+    : capacity_(capacity)
+  {
+  }
+
+  // nullptr if key is not cached, otherwise the entry becomes the most recently used
+  const Value* get(const Key& key)
+  {
+    auto iter = index_.find(key);
+    if (iter == index_.end()) {
+      return nullptr;
+    }
+    entries_.splice(entries_.begin(), entries_, iter->second);
+    return &iter->second->second;
+  }
+
+  void put(const Key& key, Value value)
+  {
+    if (capacity_ == 0) {
+      return;
+    }
+    auto iter = index_.find(key);
+    if (iter != index_.end()) {
+      iter->second->second = std::move(value);
+      entries_.splice(entries_.begin(), entries_, iter->second);
+      return;
+    }
+    if (entries_.size() >= capacity_) {
+      index_.erase(entries_.back().first);
+      entries_.pop_back();
+    }
+    entries_.emplace_front(key, std::move(value));
+    index_[key] = entries_.begin();
+  }
+
+  void clear()
+  {
+    entries_.clear();
+    index_.clear();
+  }
+
+  size_t size() const
+  {
+    return entries_.size();
+  }
+
+private:
+  size_t capacity_;
+  // most recently used first
+  std::list<std::pair<Key, Value>> entries_;
+  std::unordered_map<Key, typename std::list<std::pair<Key, Value>>::iterator, Hash> index_;
+};
@@ -0,0 +1,331 @@
+#pragma once
+
+#include <cmath>
+#include <cstdint>
+#include <cstring>
+#include <cstdio>
+#include <fstream>
+#include <string>
+#include <vector>
+
+// mmap
+#include <fcntl.h>
+#include <sys/mman.h>
+#include <sys/stat.h>
+#include <unistd.h>
+
+#include "db_astar.hpp"
+
+// Cache of the motions as load_motions reads them from a msgpack file: the
+// (shuffled, bounds-enforced) states and actions as flat arrays, the AABB and
+// the translated last state of each motion, and the GNATs T_m_start and
+// T_m_end (with motion indices instead of pointers). It is stored next to the
+// msgpack file (<file>.<robot type>.cache) and memory mapped when loading,
+// which skips parsing the msgpack file and the distance computations of
+// building the GNATs. The OMPL states and controls are still allocated and
+// copied (they are polymorphic, so cannot live in the mapping). The
+// collision managers are not part of the cache: they are built when a motion
+// is first checked for collisions (see add_collision_manager), for motions
+// loaded either way.
+//
+// The cache is rebuilt if the msgpack file (size, mtime), the environment
+// dimension or the robot model (dimensions, dt, collision geometry and the
+// transform of a probe state) changed.
+
+namespace motion_cache {
+
+const char magic[8] = {'D', 'B', 'M', 'O', 'T', 'I', 'O', 'N'};
+const uint32_t version = 3;
+
+struct Header {
+  char magic[8];
+  uint32_t version;
+  uint32_t state_dim;
+  uint32_t control_dim;
+  uint32_t num_parts;
+  float dt;
+  uint64_t source_size;
+  int64_t source_mtime_ns;
+  uint64_t num_motions;
+  uint64_t num_states;
+  uint64_t num_actions;
+  // the states are clamped to the bounds of an environment of this dimension
+  uint64_t env_size;
+  char robot_type[64];
+};
+
+// per motion
+struct Entry {
+  uint64_t state_offset;
+  uint64_t num_states;
+  uint64_t action_offset;
+  uint64_t num_actions;
+  float aabb_min[3];
+  float aabb_max[3];
+};
+
+// transform (3 translation + 9 rotation) of the first state of the first
+// motion and the AABB radius of the geometry, per part
+const size_t fingerprint_size = 13;
+
+std::vector<double> fingerprint(std::shared_ptr<Robot> robot, const ob::State* probe)
+{
+  std::vector<double> result;
+  for (size_t part = 0; part < robot->numParts(); ++part) {
+    const auto transform = robot->getTransform(probe, part);
+    for (size_t i = 0; i < 3; ++i) {
+      result.push_back(transform.translation()(i));
+    }
+    for (size_t i = 0; i < 3; ++i) {
+      for (size_t j = 0; j < 3; ++j) {
+        result.push_back(transform.rotation()(i, j));
+      }
+    }
+    auto geom = robot->getCollisionGeometry(part);
+    geom->computeLocalAABB();
+    result.push_back(geom->aabb_radius);
+  }
+  return result;
+}
+
+bool source_info(const std::string& filename, uint64_t& size, int64_t& mtime_ns)
+{
+  struct stat st;
+  if (stat(filename.c_str(), &st) != 0) {
+    return false;
+  }
+  size = st.st_size;
+  mtime_ns = int64_t(st.st_mtim.tv_sec) * 1000000000 + st.st_mtim.tv_nsec;
+  return true;
+}
+
+void fill_header(Header& header, const std::string& motionsFile, std::shared_ptr<Robot> robot, const std::string& robot_type,
+  size_t env_size)
+{
+  auto si = robot->getSpaceInformation();
+  std::memset(&header, 0, sizeof(header));
+  std::memcpy(header.magic, magic, sizeof(magic));
+  header.version = version;
+  header.state_dim = si->getStateSpace()->getDimension();
+  header.control_dim = si->getControlSpace()->getDimension();
+  header.num_parts = robot->numParts();
+  header.dt = robot->dt();
+  source_info(motionsFile, header.source_size, header.source_mtime_ns);
+  header.env_size = env_size;
+  std::strncpy(header.robot_type, robot_type.c_str(), sizeof(header.robot_type) - 1);
+}
+
+// writes the cache for motions (as returned by load_motions); atomic, so that
+// concurrent solver processes never see a partially written cache
+void save(const std::string& cacheFile, const std::string& motionsFile, std::shared_ptr<Robot> robot,
+  const std::string& robot_type, size_t env_size, const Motions& motions)
+{
+  auto si = robot->getSpaceInformation();
+  Header header;
+  fill_header(header, motionsFile, robot, robot_type, env_size);
+  header.num_motions = motions.motions.size();
+
+  std::vector<Entry> entries;
+  std::vector<double> states;
+  std::vector<double> actions;
+  std::vector<double> last_states;
+  std::vector<double> reals;
+  for (const auto& m : motions.motions) {
+    Entry e;
+    e.state_offset = states.size() / header.state_dim;
+    e.num_states = m.states.size();
+    e.action_offset = actions.size() / header.control_dim;
+    e.num_actions = m.actions.size();
+    for (size_t i = 0; i < 3; ++i) {
+      e.aabb_min[i] = m.aabb.min_(i);
+      e.aabb_max[i] = m.aabb.max_(i);
+    }
+    entries.push_back(e);
+
+    for (const auto& state : m.states) {
+      si->getStateSpace()->copyToReals(reals, state);
+      states.insert(states.end(), reals.begin(), reals.end());
+    }
+    for (const auto& action : m.actions) {
+      for (size_t d = 0; d < header.control_dim; ++d) {
+        actions.push_back(*si->getControlSpace()->getValueAddressAtIndex(action, d));
+      }
+    }
+    si->getStateSpace()->copyToReals(reals, m.last_state_translated);
+    last_states.insert(last_states.end(), reals.begin(), reals.end());
+  }
+  header.num_states = states.size() / header.state_dim;
+  header.num_actions = actions.size() / header.control_dim;
+  const auto print = fingerprint(robot, motions.motions.at(0).states.at(0));
+
+  // only GNATs are stored, the other trees are cheap to build
+  std::string trees;
+  auto T_m_start = dynamic_cast<const MotionGNAT*>(motions.T_m_start);
+  auto T_m_end = dynamic_cast<const MotionGNAT*>(motions.T_m_end);
+  trees.push_back(T_m_start != nullptr && T_m_end != nullptr);
+  if (trees.back()) {
+    T_m_start->write(trees, motions.motions.data());
+    T_m_end->write(trees, motions.motions.data());
+  }
+
+  const std::string tmpFile = cacheFile + ".tmp" + std::to_string(getpid());
+  {
+    std::ofstream out(tmpFile, std::ios::binary);
+    out.write((const char*)&header, sizeof(header));
+    out.write((const char*)print.data(), print.size() * sizeof(double));
+    out.write((const char*)entries.data(), entries.size() * sizeof(Entry));
+    out.write((const char*)states.data(), states.size() * sizeof(double));
+    out.write((const char*)actions.data(), actions.size() * sizeof(double));
+    out.write((const char*)last_states.data(), last_states.size() * sizeof(double));
+    out.write(trees.data(), trees.size());
+    if (!out) {
+      std::remove(tmpFile.c_str());
+      return;
+    }
+  }
+  std::rename(tmpFile.c_str(), cacheFile.c_str());
+}
+
+// fills motions from the cache; returns false (and leaves motions untouched)
+// if there is no valid cache for this msgpack file and robot
+bool load(const std::string& cacheFile, const std::string& motionsFile, std::shared_ptr<Robot> robot,
+  const std::string& robot_type, size_t env_size, Motions& result)
+{
+  int fd = open(cacheFile.c_str(), O_RDONLY);
+  if (fd < 0) {
+    return false;
+  }
+  struct stat st;
+  if (fstat(fd, &st) != 0 || size_t(st.st_size) < sizeof(Header)) {
+    close(fd);
+    return false;
+  }
+  const size_t size = st.st_size;
+  void* data = mmap(nullptr, size, PROT_READ, MAP_SHARED, fd, 0);
+  close(fd);
+  if (data == MAP_FAILED) {
+    return false;
+  }
+
+  auto si = robot->getSpaceInformation();
+  const char* ptr = (const char*)data;
+  Header header;
+  fill_header(header, motionsFile, robot, robot_type, env_size);
+  const Header& cached = *(const Header*)ptr;
+  bool valid = std::memcmp(cached.magic, header.magic, sizeof(magic)) == 0
+    && cached.version == header.version
+    && cached.state_dim == header.state_dim
+    && cached.control_dim == header.control_dim
+    && cached.num_parts == header.num_parts
+    && cached.dt == header.dt
+    && cached.source_size == header.source_size
+    && cached.source_mtime_ns == header.source_mtime_ns
+    && cached.env_size == header.env_size
+    && std::strncmp(cached.robot_type, header.robot_type, sizeof(header.robot_type)) == 0
+    && cached.num_motions > 0;
+
+  const size_t num_print = fingerprint_size * header.num_parts;
+  const double* print = (const double*)(ptr + sizeof(Header));
+  const Entry* entries = (const Entry*)(print + num_print);
+  const double* states = (const double*)(entries + cached.num_motions);
+  const double* actions = states + cached.num_states * header.state_dim;
+  const double* last_states = actions + cached.num_actions * header.control_dim;
+  const char* trees = (const char*)(last_states + cached.num_motions * header.state_dim);
+  const char* end = ptr + size;
+  valid = valid && trees < end;
+
+  if (valid) {
+    // the robot model must map states to the same geometry as before
+    ob::State* probe = si->allocState();
+    si->getStateSpace()->copyFromReals(probe, std::vector<double>(states, states + header.state_dim));
+    const auto current = fingerprint(robot, probe);
+    si->freeState(probe);
+    for (size_t i = 0; i < num_print; ++i) {
+      valid = valid && std::abs(current[i] - print[i]) < 1e-6;
+    }
+  }
+  if (!valid) {
+    munmap(data, size);
+    return false;
+  }
+
+  result.motions.resize(cached.num_motions);
+  for (size_t idx = 0; idx < cached.num_motions; ++idx) {
+    const Entry& e = entries[idx];
+    Motion& m = result.motions[idx];
+    for (size_t k = 0; k < e.num_states; ++k) {
+      ob::State* state = si->allocState();
+      const double* s = states + (e.state_offset + k) * header.state_dim;
+      si->getStateSpace()->copyFromReals(state, std::vector<double>(s, s + header.state_dim));
+      m.states.push_back(state);
+    }
+    for (size_t k = 0; k < e.num_actions; ++k) {
+      oc::Control* control = si->allocControl();
+      const double* a = actions + (e.action_offset + k) * header.control_dim;
+      for (size_t d = 0; d < header.control_dim; ++d) {
+        *si->getControlSpace()->getValueAddressAtIndex(control, d) = a[d];
+      }
+      m.actions.push_back(control);
+    }
+    m.last_state_translated = si->allocState();
+    const double* l = last_states + idx * header.state_dim;
+    si->getStateSpace()->copyFromReals(m.last_state_translated, std::vector<double>(l, l + header.state_dim));
+    m.aabb = fcl::AABBf(fcl::Vector3f(e.aabb_min[0], e.aabb_min[1], e.aabb_min[2]),
+                        fcl::Vector3f(e.aabb_max[0], e.aabb_max[1], e.aabb_max[2]));
+    m.cost = m.actions.size() * robot->dt();
+    m.idx = idx;
+    m.disabled = false;
+  }
+
+  new_motion_trees(si, result);
+  auto T_m_start = dynamic_cast<MotionGNAT*>(result.T_m_start);
+  auto T_m_end = dynamic_cast<MotionGNAT*>(result.T_m_end);
+  const bool restored = *trees++ && T_m_start != nullptr && T_m_end != nullptr
+    && T_m_start->read(trees, end, result.motions.data(), result.motions.size())
+    && T_m_end->read(trees, end, result.motions.data(), result.motions.size())
+    && trees == end;
+  munmap(data, size);
+  if (!restored) {
+    delete result.T_m_start;
+    delete result.T_m_end;
+    build_motion_trees(si, result);
+  }
+  std::cout << "There are " << result.motions.size() << " motions (cached" << (restored ? "" : ", trees rebuilt") << ")!" << std::endl;
+  return true;
+}
+
+} // namespace motion_cache
+
+// load_motions for a msgpack file, using (and, if needed, creating) the cache next to it
+void load_motions_cached(
+  const std::string& motionsFile,
+  std::shared_ptr<Robot> robot,
+  const std::string& robot_type,
+  size_t env_size,
+  Motions& result)
+{
+  // robot types may share a msgpack file, but not the cache
+  const std::string cacheFile = motionsFile + "." + robot_type + ".cache";
+  if (motion_cache::load(cacheFile, motionsFile, robot, robot_type, env_size, result)) {
+    return;
+  }
+
+  // load the msgpck
+  std::ifstream is( motionsFile.c_str(), std::ios::in | std::ios::binary );
+  // get length of file
+  is.seekg (0, is.end);
+  int length = is.tellg();
+  is.seekg (0, is.beg);
+  //
+  msgpack::unpacker unpacker;
+  unpacker.reserve_buffer(length);
+  is.read(unpacker.buffer(), length);
+  unpacker.buffer_consumed(length);
+  msgpack::object_handle oh;
+  unpacker.next(oh);
+  load_motions(oh.get(), robot, robot_type, env_size, /*delta, filterDuplicates, alpha,*/ result);
+
+  if (!result.motions.empty()) {
+    motion_cache::save(cacheFile, motionsFile, robot, robot_type, env_size, result);
+  }
+}
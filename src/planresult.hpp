@@ -1,4 +1,5 @@
 #pragma once
+#include <memory>
 #include <vector>
 #include <iostream>
 
@@ -8,4 +9,7 @@ struct LowLevelPlan {
   std::vector<StateT> trajectory;
   std::vector<StateA> actions;
   float cost;
+  // owns the states and actions (if they are allocated, e.g. a PlanArena);
+  // copies of the plan share it, so they are freed with the last copy
+  std::shared_ptr<void> storage;
 };
@@ -18,6 +18,8 @@
 // local
 #include "robots.h"
 #include "robotStatePropagator.hpp"
+#include "db_cbs.hpp"
+#include "db_astar_incremental.hpp"
 
 namespace py = pybind11;
 using namespace pybind11::literals;
@@ -345,8 +347,88 @@ private:
   ob::State *tmp_state_;
 };
 
+py::array_t<double> to_array(const std::vector<std::vector<double>>& rows)
+{
+  const size_t dim = rows.empty() ? 0 : rows[0].size();
+  py::array_t<double> result({rows.size(), dim});
+  auto r = result.mutable_unchecked<2>();
+  for (size_t i = 0; i < rows.size(); ++i) {
+    for (size_t j = 0; j < dim; ++j) {
+      r(i, j) = rows[i][j];
+    }
+  }
+  return result;
+}
+
+// db-A* for the first robot of an environment (file), see IncrementalDBAstar
+IncrementalDBAstar* create_incremental_dbastar(
+  const std::string& filename_env, float delta, float epsilon, float alpha, bool filter_duplicates, float max_cost)
+{
+  Problem problem;
+  load_problem(YAML::LoadFile(filename_env), problem);
+  return new IncrementalDBAstar(problem.robots[0], problem.robot_types[0], problem.env_min.size(),
+    problem.obstacles, problem.workspace_aabb, problem.starts[0], problem.goals[0],
+    delta, epsilon, alpha, filter_duplicates, max_cost);
+}
+
+// motions as in the msgpack files: a list of dicts with (at least) states and actions
+size_t add_motions(IncrementalDBAstar& planner, const py::list& motions)
+{
+  std::vector<std::vector<std::vector<double>>> states;
+  std::vector<std::vector<std::vector<double>>> actions;
+  for (const auto& motion : motions) {
+    states.push_back(motion["states"].cast<std::vector<std::vector<double>>>());
+    actions.push_back(motion["actions"].cast<std::vector<std::vector<double>>>());
+  }
+  py::gil_scoped_release release;
+  return planner.add_motions(states, actions);
+}
+
+// None if there is no solution (yet)
+py::object search_incremental(IncrementalDBAstar& planner, double timelimit)
+{
+  std::vector<std::vector<double>> states;
+  std::vector<std::vector<double>> actions;
+  std::map<size_t, size_t> motion_stats;
+  float cost = 0;
+  bool found = false;
+  {
+    py::gil_scoped_release release;
+    const AStarNode* node = planner.search(timelimit);
+    if (node != nullptr) {
+      planner.extract(node, states, actions, motion_stats);
+      cost = node->gScore;
+      found = true;
+    }
+  }
+  if (!found) {
+    return py::none();
+  }
+  return py::dict(
+    "cost"_a=cost,
+    "delta"_a=planner.delta(),
+    "states"_a=to_array(states),
+    "actions"_a=to_array(actions),
+    "motion_stats"_a=motion_stats);
+}
+
 PYBIND11_MODULE(motionplanningutils, m)
 {
+  pybind11::class_<IncrementalDBAstar>(m, "IncrementalDBAstar")
+      .def(py::init(&create_incremental_dbastar),
+        py::arg("filename_env"), py::arg("delta"), py::arg("epsilon") = 1.0, py::arg("alpha") = 0.5,
+        py::arg("filter_duplicates") = true, py::arg("max_cost") = std::numeric_limits<float>::infinity())
+      .def("add_motions", &add_motions, py::arg("motions"))
+      .def("search", &search_incremental, py::arg("timelimit") = 0)
+      .def("restart", &IncrementalDBAstar::restart)
+      .def("set_disabled", &IncrementalDBAstar::set_disabled, py::arg("idx"), py::arg("disabled") = true)
+      .def_property_readonly("delta", &IncrementalDBAstar::delta)
+      .def_property("max_cost", &IncrementalDBAstar::max_cost, &IncrementalDBAstar::set_max_cost)
+      .def_property_readonly("num_motions", &IncrementalDBAstar::num_motions)
+      .def_property_readonly("num_nodes", &IncrementalDBAstar::num_nodes)
+      .def_readonly("num_expansions", &IncrementalDBAstar::num_expansions)
+      .def_readonly("num_collision_checks", &IncrementalDBAstar::num_collision_checks);
+
   pybind11::class_<CollisionChecker>(m, "CollisionChecker")
       .def(pybind11::init())
       .def("load", &CollisionChecker::load)
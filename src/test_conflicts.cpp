@@ -0,0 +1,157 @@
+#include <cstdlib>
+#include <iostream>
+#include <random>
+
+#include "db_cbs.hpp"
+
+// Checks the incremental conflict table of the db-CBS high level against a
+// full recheck: after each replan of a random robot, the table updated for
+// that robot only must equal the table of all pairs built from scratch, and
+// both must match plain fcl collision checks at every timestep.
+
+// unlike assert, also checks in release builds
+#define CHECK(cond) \
+    do { \
+        if (!(cond)) { \
+            std::cerr << __FILE__ << ":" << __LINE__ << ": check failed: " #cond << std::endl; \
+            std::exit(1); \
+        } \
+    } while (0)
+
+typedef LowLevelPlan<AStarNode*, ob::State*, oc::Control*> Plan;
+
+// random walk in a small workspace, so that the robots run into each other
+std::shared_ptr<const Plan> random_plan(std::shared_ptr<Robot> robot, std::mt19937& rng)
+{
+    auto si = robot->getSpaceInformation();
+    auto arena = std::make_shared<PlanArena>(si);
+    auto plan = std::make_shared<Plan>();
+    plan->storage = arena;
+    std::uniform_real_distribution<double> position(0.0, 3.0);
+    std::uniform_real_distribution<double> step(-0.1, 0.1);
+    std::uniform_real_distribution<double> yaw(-M_PI, M_PI);
+    std::uniform_int_distribution<size_t> length(1, 60);
+    std::vector<double> reals = {position(rng), position(rng), yaw(rng)};
+    const size_t num_states = length(rng);
+    for (size_t t = 0; t < num_states; ++t) {
+        ob::State* state = arena->allocState();
+        si->getStateSpace()->copyFromReals(state, reals);
+        plan->trajectory.push_back(state);
+        reals[0] += step(rng);
+        reals[1] += step(rng);
+        reals[2] += step(rng);
+    }
+    plan->cost = (num_states - 1) * robot->dt();
+    return plan;
+}
+
+// conflicts of robots i and j by colliding their parts at every timestep
+PairConflicts reference_conflicts(
+    const std::vector<std::shared_ptr<Robot>>& robots,
+    const std::vector<std::shared_ptr<const Plan>>& plans,
+    size_t i, size_t j)
+{
+    PairConflicts conflicts;
+    const size_t length = std::max(plans[i]->trajectory.size(), plans[j]->trajectory.size());
+    for (size_t t = 0; t < length; ++t) {
+        // robots that reached their goal stay there
+        const auto state_i = plans[i]->trajectory[std::min(t, plans[i]->trajectory.size() - 1)];
+        const auto state_j = plans[j]->trajectory[std::min(t, plans[j]->trajectory.size() - 1)];
+        bool collision = false;
+        for (size_t p = 0; p < robots[i]->numParts(); ++p) {
+            for (size_t q = 0; q < robots[j]->numParts(); ++q) {
+                fcl::CollisionObjectf a(robots[i]->getCollisionGeometry(p), robots[i]->getTransform(state_i, p));
+                fcl::CollisionObjectf b(robots[j]->getCollisionGeometry(q), robots[j]->getTransform(state_j, q));
+                fcl::CollisionRequestf request;
+                fcl::CollisionResultf result;
+                fcl::collide(&a, &b, request, result);
+                collision = collision || result.isCollision();
+            }
+        }
+        if (collision) {
+            if (conflicts.first < 0) {
+                conflicts.first = t;
+            }
+            ++conflicts.count;
+        }
+    }
+    return conflicts;
+}
+
+void check_tables_equal(const ConflictTable& a, const ConflictTable& b)
+{
+    CHECK(a.num_robots == b.num_robots);
+    CHECK(a.num_conflicts == b.num_conflicts);
+    for (size_t i = 0; i < a.num_robots; ++i) {
+        for (size_t j = i + 1; j < a.num_robots; ++j) {
+            CHECK(a.pairs[i * a.num_robots + j].first == b.pairs[i * b.num_robots + j].first);
+            CHECK(a.pairs[i * a.num_robots + j].count == b.pairs[i * b.num_robots + j].count);
+        }
+    }
+}
+
+int main()
+{
+    ob::RealVectorBounds bounds(2);
+    bounds.setLow(-1);
+    bounds.setHigh(4);
+    std::vector<std::shared_ptr<Robot>> robots;
+    for (const auto& type : {"unicycle_first_order_0", "unicycle_first_order_0_sphere", "unicycle_first_order_0", "unicycle_first_order_0_sphere", "unicycle_first_order_0"}) {
+        robots.push_back(create_robot(type, bounds));
+    }
+    const size_t n = robots.size();
+    std::vector<size_t> all(n);
+    for (size_t i = 0; i < n; ++i) {
+        all[i] = i;
+    }
+
+    std::mt19937 rng(0);
+    std::vector<std::shared_ptr<const Plan>> plans;
+    std::vector<std::shared_ptr<const TrajectoryGeometry>> geometries;
+    for (size_t i = 0; i < n; ++i) {
+        plans.push_back(random_plan(robots[i], rng));
+        geometries.push_back(make_trajectory_geometry(robots[i], *plans[i]));
+    }
+    ConflictTable incremental;
+    update_conflicts(geometries, all, incremental);
+
+    size_t total_conflicts = 0;
+    std::uniform_int_distribution<size_t> pick(0, n - 1);
+    for (size_t iteration = 0; iteration < 500; ++iteration) {
+        // replan one robot
+        const size_t k = pick(rng);
+        plans[k] = random_plan(robots[k], rng);
+        geometries[k] = make_trajectory_geometry(robots[k], *plans[k]);
+        update_conflicts(geometries, {k}, incremental);
+
+        ConflictTable full;
+        update_conflicts(geometries, all, full);
+        check_tables_equal(incremental, full);
+
+        for (size_t i = 0; i < n; ++i) {
+            for (size_t j = i + 1; j < n; ++j) {
+                const PairConflicts expected = reference_conflicts(robots, plans, i, j);
+                CHECK(full.pairs[i * n + j].first == expected.first);
+                CHECK(full.pairs[i * n + j].count == expected.count);
+            }
+        }
+
+        // the earliest conflict is the earliest of all pairs
+        Conflict conflict;
+        int first = -1;
+        for (const auto& pair : full.pairs) {
+            if (pair.first >= 0 && (first < 0 || pair.first < first)) {
+                first = pair.first;
+            }
+        }
+        CHECK(getEarliestConflict(incremental, plans, robots, conflict) == (first >= 0));
+        if (first >= 0) {
+            CHECK(std::abs(conflict.time - first * robots[0]->dt()) < 1e-6);
+        }
+        total_conflicts += full.num_conflicts;
+    }
+    // the random plans must actually conflict, otherwise nothing was tested
+    CHECK(total_conflicts > 0);
+    std::cout << "conflicts: ok (" << total_conflicts << " conflicting timesteps)" << std::endl;
+    return 0;
+}
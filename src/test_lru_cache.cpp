@@ -0,0 +1,87 @@
+#include <cstdlib>
+#include <iostream>
+#include <string>
+
+#include "lru_cache.hpp"
+
+// unlike assert, also checks in release builds
+#define CHECK(cond) \
+  do { \
+    if (!(cond)) { \
+      std::cerr << __FILE__ << ":" << __LINE__ << ": check failed: " #cond << std::endl; \
+      std::exit(1); \
+    } \
+  } while (0)
+
+void test_eviction()
+{
+  LRUCache<int, std::string> cache(2);
+  cache.put(1, "a");
+  cache.put(2, "b");
+  CHECK(cache.size() == 2);
+
+  // full: the least recently used entry (1) goes
+  cache.put(3, "c");
+  CHECK(cache.size() == 2);
+  CHECK(cache.get(1) == nullptr);
+  CHECK(cache.get(2) != nullptr && *cache.get(2) == "b");
+  CHECK(cache.get(3) != nullptr && *cache.get(3) == "c");
+
+  // get makes 2 the most recently used, so 3 goes next
+  CHECK(cache.get(2) != nullptr);
+  cache.put(4, "d");
+  CHECK(cache.get(3) == nullptr);
+  CHECK(cache.get(2) != nullptr);
+  CHECK(cache.get(4) != nullptr);
+}
+
+void test_update()
+{
+  LRUCache<int, std::string> cache(2);
+  cache.put(1, "a");
+  cache.put(2, "b");
+  // updating an entry does not add one, but makes it the most recently used
+  cache.put(1, "A");
+  CHECK(cache.size() == 2);
+  CHECK(*cache.get(1) == "A");
+  cache.put(2, "B");
+  cache.put(3, "c");
+  CHECK(cache.get(1) == nullptr);
+  CHECK(*cache.get(2) == "B");
+  CHECK(*cache.get(3) == "c");
+}
+
+void test_disabled()
+{
+  LRUCache<int, std::string> cache(0);
+  cache.put(1, "a");
+  CHECK(cache.size() == 0);
+  CHECK(cache.get(1) == nullptr);
+}
+
+void test_clear()
+{
+  LRUCache<int, std::string> cache(3);
+  cache.put(1, "a");
+  cache.put(2, "b");
+  cache.clear();
+  CHECK(cache.size() == 0);
+  CHECK(cache.get(1) == nullptr);
+  // still usable with its capacity
+  for (int i = 0; i < 5; ++i) {
+    cache.put(i, std::to_string(i));
+  }
+  CHECK(cache.size() == 3);
+  CHECK(cache.get(1) == nullptr);
+  CHECK(*cache.get(4) == "4");
+}
+
+int main()
+{
+  test_eviction();
+  test_update();
+  test_disabled();
+  test_clear();
+  std::cout << "lru_cache: ok" << std::endl;
+  return 0;
+}
@@ -0,0 +1,185 @@
+#include <algorithm>
+#include <chrono>
+#include <cstdlib>
+#include <filesystem>
+#include <iostream>
+#include <random>
+
+#include "motion_cache.hpp"
+
+// Checks that motions loaded from the motion cache behave like the motions
+// parsed from the msgpack file: same motions, same answers of the restored
+// GNATs, same collisions of the collision managers built on first use. Also
+// prints the load times of both.
+
+// unlike assert, also checks in release builds
+#define CHECK(cond) \
+    do { \
+        if (!(cond)) { \
+            std::cerr << __FILE__ << ":" << __LINE__ << ": check failed: " #cond << std::endl; \
+            std::exit(1); \
+        } \
+    } while (0)
+
+typedef std::map<std::string, std::vector<std::vector<double>>> PackedMotion;
+
+// random unicycle motions starting at the origin, as in the msgpack libraries
+std::vector<PackedMotion> random_motions(size_t num_motions, float dt, std::mt19937& rng)
+{
+    std::uniform_real_distribution<double> yaw(-M_PI, M_PI);
+    std::uniform_real_distribution<double> v(-0.5, 0.5);
+    std::uniform_real_distribution<double> w(-0.5, 0.5);
+    std::uniform_int_distribution<size_t> length(5, 15);
+    std::vector<PackedMotion> motions;
+    for (size_t i = 0; i < num_motions; ++i) {
+        PackedMotion m;
+        std::vector<double> state = {0, 0, yaw(rng)};
+        m["states"].push_back(state);
+        const size_t num_actions = length(rng);
+        for (size_t k = 0; k < num_actions; ++k) {
+            const std::vector<double> action = {v(rng), w(rng)};
+            state[0] += action[0] * cos(state[2]) * dt;
+            state[1] += action[0] * sin(state[2]) * dt;
+            state[2] = std::remainder(state[2] + action[1] * dt, 2 * M_PI);
+            m["actions"].push_back(action);
+            m["states"].push_back(state);
+        }
+        motions.push_back(m);
+    }
+    return motions;
+}
+
+std::vector<size_t> indices(const std::vector<Motion*>& motions)
+{
+    std::vector<size_t> result;
+    for (const Motion* m : motions) {
+        result.push_back(m->idx);
+    }
+    std::sort(result.begin(), result.end());
+    return result;
+}
+
+double load(const std::string& motionsFile, const std::string& robot_type, Motions& motions)
+{
+    ob::RealVectorBounds bounds(2);
+    bounds.setLow(-1);
+    bounds.setHigh(4);
+    const auto start = std::chrono::steady_clock::now();
+    load_motions_cached(motionsFile, create_robot(robot_type, bounds), robot_type, 2, motions);
+    return std::chrono::duration<double>(std::chrono::steady_clock::now() - start).count();
+}
+
+int main()
+{
+    const std::string robot_type = "unicycle_first_order_0";
+    ob::RealVectorBounds bounds(2);
+    bounds.setLow(-1);
+    bounds.setHigh(4);
+    auto robot = create_robot(robot_type, bounds);
+    auto si = robot->getSpaceInformation();
+
+    const auto folder = std::filesystem::temp_directory_path() / ("test_motion_cache_" + std::to_string(getpid()));
+    std::filesystem::create_directories(folder);
+    const std::string motionsFile = folder / "motions.msgpack";
+    std::mt19937 rng(0);
+    {
+        std::ofstream out(motionsFile, std::ios::binary);
+        msgpack::pack(out, random_motions(20000, robot->dt(), rng));
+    }
+
+    // the first load parses the msgpack file and writes the cache
+    Motions parsed;
+    const double t_parsed = load(motionsFile, robot_type, parsed);
+    CHECK(std::filesystem::exists(motionsFile + "." + robot_type + ".cache"));
+    Motions cached;
+    const double t_cached = load(motionsFile, robot_type, cached);
+
+    // what the cache saves: building the trees and (before they were built on
+    // first use) the collision managers of all motions
+    const auto t_start = std::chrono::steady_clock::now();
+    Motions rebuilt;
+    rebuilt.motions = cached.motions;
+    build_motion_trees(si, rebuilt);
+    for (auto& m : rebuilt.motions) {
+        add_collision_manager(robot, m);
+    }
+    const double t_rebuilt = std::chrono::duration<double>(std::chrono::steady_clock::now() - t_start).count();
+
+    CHECK(cached.motions.size() == parsed.motions.size());
+    CHECK(cached.T_m_start->size() == parsed.T_m_start->size());
+    CHECK(cached.T_m_end->size() == parsed.T_m_end->size());
+    std::vector<double> a, b;
+    for (size_t i = 0; i < parsed.motions.size(); ++i) {
+        const Motion& p = parsed.motions[i];
+        const Motion& c = cached.motions[i];
+        CHECK(c.idx == i && p.idx == i);
+        CHECK(c.states.size() == p.states.size() && c.actions.size() == p.actions.size());
+        for (size_t k = 0; k < p.states.size(); ++k) {
+            si->getStateSpace()->copyToReals(a, p.states[k]);
+            si->getStateSpace()->copyToReals(b, c.states[k]);
+            CHECK(a == b);
+        }
+        CHECK(c.cost == p.cost);
+        CHECK(c.collision_manager == nullptr);
+    }
+
+    // the restored GNATs find the same motions as the ones built from scratch
+    Motion query;
+    query.states.push_back(si->allocState());
+    query.last_state_translated = si->allocState();
+    std::uniform_real_distribution<double> yaw(-M_PI, M_PI);
+    std::vector<Motion*> expected, result;
+    size_t num_found = 0;
+    for (size_t i = 0; i < 200; ++i) {
+        // the motions are translated to the origin
+        si->getStateSpace()->copyFromReals(query.states[0], {0, 0, yaw(rng)});
+        si->copyState(query.last_state_translated, query.states[0]);
+        parsed.T_m_start->nearestR(&query, 0.3, expected);
+        cached.T_m_start->nearestR(&query, 0.3, result);
+        CHECK(indices(expected) == indices(result));
+        num_found += result.size();
+        parsed.T_m_end->nearestR(&query, 0.3, expected);
+        cached.T_m_end->nearestR(&query, 0.3, result);
+        CHECK(indices(expected) == indices(result));
+        parsed.T_m_start->nearestK(&query, 5, expected);
+        cached.T_m_start->nearestK(&query, 5, result);
+        CHECK(indices(expected) == indices(result));
+    }
+    CHECK(num_found > 0);
+
+    // collision managers built on first use collide like the ones of a full load
+    std::shared_ptr<fcl::CollisionGeometryf> box(new fcl::Boxf(0.5, 0.5, 1.0));
+    fcl::CollisionObjectf obstacle(box);
+    obstacle.setTranslation(fcl::Vector3f(0.5, 0.5, 0));
+    obstacle.computeAABB();
+    std::vector<fcl::CollisionObjectf*> obstacles = {&obstacle};
+    fcl::DynamicAABBTreeCollisionManagerf env;
+    env.registerObjects(obstacles);
+    env.setup();
+    std::uniform_real_distribution<float> position(0, 1);
+    size_t num_collisions = 0;
+    for (size_t i = 0; i < 2000; ++i) {
+        const Motion& m = cached.motions[i];
+        CHECK(m.collision_manager == nullptr);
+        add_collision_manager(robot, m);
+        CHECK(m.collision_objects.size() == m.states.size() * robot->numParts());
+        const fcl::Vector3f offset(position(rng), position(rng), 0);
+        bool collision[2];
+        for (const Motion* motion : {&m, &rebuilt.motions[i]}) {
+            fcl::DefaultCollisionData<float> collision_data;
+            motion->collision_manager->shift(offset);
+            motion->collision_manager->collide(&env, &collision_data, fcl::DefaultCollisionFunction<float>);
+            motion->collision_manager->shift(-offset);
+            collision[motion == &m] = collision_data.result.isCollision();
+        }
+        CHECK(collision[0] == collision[1]);
+        num_collisions += collision[0];
+    }
+    CHECK(num_collisions > 0 && num_collisions < 2000);
+
+    std::filesystem::remove_all(folder);
+    std::cout << "motion_cache: ok (20000 motions loaded in " << t_parsed << " s from msgpack, "
+              << t_cached << " s from the cache; rebuilding the trees and collision managers takes "
+              << t_rebuilt << " s)" << std::endl;
+    return 0;
+}